@@ -105,6 +105,27 @@ http {
           client.WritePlot();
       ';
     }
+
+    location /wrk2-api/movie-info/write-batch {
+      content_by_lua '
+          local client = require "wrk2-api/movie-info/write-batch"
+          client.WriteMovieInfoBatch();
+      ';
+    }
+
+    location /wrk2-api/cast-info/write-batch {
+      content_by_lua '
+          local client = require "wrk2-api/cast-info/write-batch"
+          client.WriteCastInfoBatch();
+      ';
+    }
+
+    location /wrk2-api/plot/write-batch {
+      content_by_lua '
+          local client = require "wrk2-api/plot/write-batch"
+          client.WritePlotBatch();
+      ';
+    }
   }
 }
 {{- end}}
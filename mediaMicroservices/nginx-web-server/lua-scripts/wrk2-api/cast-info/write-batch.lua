@@ -0,0 +1,53 @@
+local _M = {}
+local k8s_suffix = os.getenv("fqdn_suffix")
+if (k8s_suffix == nil) then
+  k8s_suffix = ""
+end
+
+function _M.WriteCastInfoBatch()
+  local bridge_tracer = require "opentracing_bridge_tracer"
+  local GenericObjectPool = require "GenericObjectPool"
+  local CastInfoServiceClient = require 'media_service_CastInfoService'
+  local ngx = ngx
+  local cjson = require("cjson")
+
+  local req_id = tonumber(string.sub(ngx.var.request_id, 0, 15), 16)
+  local tracer = bridge_tracer.new_from_global()
+  local parent_span_context = tracer:binary_extract(ngx.var.opentracing_binary_context)
+  local span = tracer:start_span("WriteCastInfoBatch  ", {["references"] = {{"child_of", parent_span_context}}})
+  local carrier = {}
+  tracer:text_map_inject(span:context(), carrier)
+
+  ngx.req.read_body()
+  local data = ngx.req.get_body_data()
+
+  if not data then
+    ngx.status = ngx.HTTP_BAD_REQUEST
+    ngx.say("Empty body")
+    ngx.log(ngx.ERR, "Empty body")
+    ngx.exit(ngx.HTTP_BAD_REQUEST)
+  end
+
+  local cast_infos = cjson.decode(data)
+  for _, cast_info in ipairs(cast_infos) do
+    if (cast_info["cast_info_id"] == nil or cast_info["name"] == nil or
+        cast_info["gender"] == nil or cast_info["intro"] == nil) then
+      ngx.status = ngx.HTTP_BAD_REQUEST
+      ngx.say("Incomplete arguments")
+      ngx.log(ngx.ERR, "Incomplete arguments")
+      ngx.exit(ngx.HTTP_BAD_REQUEST)
+    end
+  end
+
+  -- One pooled connection serves the whole batch.
+  local client = GenericObjectPool:connection(CastInfoServiceClient, "cast-info-service" .. k8s_suffix, 9090)
+  for _, cast_info in ipairs(cast_infos) do
+    client:WriteCastInfo(req_id, cast_info["cast_info_id"], cast_info["name"],
+        cast_info["gender"], cast_info["intro"],  carrier)
+  end
+  GenericObjectPool:returnConnection(client)
+  ngx.say(#cast_infos)
+  span:finish()
+end
+
+return _M
@@ -0,0 +1,112 @@
+import asyncio
+import urllib.parse
+
+
+class PipelinedConnection:
+  """One HTTP/1.1 keep-alive connection that sends requests back-to-back.
+
+  request_many() writes every request before reading any response, so a
+  batch costs one round trip instead of one per request. Responses come
+  back in request order, as HTTP/1.1 pipelining requires.
+  """
+
+  def __init__(self, host, port):
+    self.host = host
+    self.port = port
+    self.closed = True
+    self._reader = None
+    self._writer = None
+
+  async def open(self):
+    self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+    self.closed = False
+
+  def close(self):
+    self.closed = True
+    if self._writer is not None:
+      self._writer.close()
+
+  async def request_many(self, requests):
+    """Sends (path, content_type, body) requests and returns (status, text)
+    for as many of them as the server answered before closing, in order."""
+    head = 'POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n'
+    out = bytearray()
+    for path, content_type, body in requests:
+      out += head.format(path, self.host, content_type, len(body)).encode('latin-1')
+      out += body
+    self._writer.write(out)
+    await self._writer.drain()
+    responses = []
+    for _ in requests:
+      status, text, keep_alive = await self._read_response()
+      responses.append((status, text))
+      if not keep_alive:
+        self.close()
+        break
+    return responses
+
+  async def _read_response(self):
+    status_line = await self._reader.readline()
+    if not status_line:
+      raise ConnectionResetError('connection closed by server')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+      line = await self._reader.readline()
+      if line in (b'\r\n', b'\n', b''):
+        break
+      name, _, value = line.decode('latin-1').partition(':')
+      headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+      body = bytearray()
+      while True:
+        size = int((await self._reader.readline()).split(b';')[0], 16)
+        if size == 0:
+          await self._reader.readline()
+          break
+        body += await self._reader.readexactly(size)
+        await self._reader.readline()
+    else:
+      body = await self._reader.readexactly(int(headers.get('content-length', 0)))
+    keep_alive = headers.get('connection', '').lower() != 'close'
+    return status, bytes(body).decode('utf-8', errors='replace'), keep_alive
+
+
+class PipelinePool:
+  """Reuses pipelined connections to the server at `addr`."""
+
+  def __init__(self, addr):
+    url = urllib.parse.urlsplit(addr)
+    self.host = url.hostname
+    self.port = url.port or 80
+    self.base_path = url.path.rstrip('/')
+    self._idle = []
+
+  async def request_many(self, requests):
+    requests = [(self.base_path + path, content_type, body)
+                for path, content_type, body in requests]
+    responses = []
+    while len(responses) < len(requests):
+      reused = bool(self._idle)
+      conn = self._idle.pop() if reused else PipelinedConnection(self.host, self.port)
+      if conn.closed:
+        await conn.open()
+      try:
+        # Requests the server did not answer before closing are resent.
+        responses += await conn.request_many(requests[len(responses):])
+      except (ConnectionError, asyncio.IncompleteReadError):
+        conn.close()
+        if reused:
+          continue  # the server may have timed out the idle connection
+        raise
+      except BaseException:
+        conn.close()
+        raise
+      if not conn.closed:
+        self._idle.append(conn)
+    return responses
+
+  def close(self):
+    for conn in self._idle:
+      conn.close()
+    self._idle = []
@@ -0,0 +1,63 @@
+import json
+
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = ',]' + _WHITESPACE
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+  """Yields the elements of a top-level JSON array as they are decoded.
+
+  `file` is a text file object; it is read `chunk_size` characters at a
+  time, so memory use is bounded by the largest single element rather than
+  by the size of the file.
+  """
+  decoder = json.JSONDecoder()
+  buf = ''
+  pos = 0
+  eof = False
+
+  def fill():
+    nonlocal buf, pos, eof
+    chunk = file.read(chunk_size)
+    if not chunk:
+      eof = True
+    buf = buf[pos:] + chunk
+    pos = 0
+
+  def skip(chars):
+    nonlocal pos
+    while True:
+      while pos < len(buf) and buf[pos] in chars:
+        pos += 1
+      if pos < len(buf) or eof:
+        return
+      fill()
+
+  skip(_WHITESPACE)
+  if buf[pos:pos + 1] != '[':
+    raise ValueError('expected a JSON array')
+  pos += 1
+  skip(_WHITESPACE)
+  if buf[pos:pos + 1] == ']':
+    return
+  while True:
+    try:
+      element, end = decoder.raw_decode(buf, pos)
+    except json.JSONDecodeError:
+      if eof:
+        raise
+      fill()
+      continue
+    if not eof and (end == len(buf) or buf[end] not in _DELIMITERS):
+      # A number cut at the chunk boundary ("12" of "12.5e3") still decodes.
+      fill()
+      continue
+    pos = end
+    yield element
+    skip(_WHITESPACE)
+    if buf[pos:pos + 1] == ']':
+      return
+    if buf[pos:pos + 1] != ',':
+      raise ValueError('expected "," or "]" in JSON array')
+    pos += 1
+    skip(_WHITESPACE)
@@ -3,17 +3,29 @@ import asyncio
 import sys
 import json
 import argparse
+import functools
+import time
+import urllib.parse
+
+from http_pipeline import PipelinePool
+from json_stream import iter_json_array
+from latency import RequestStats
+
+CAST_INFO_PATH = "/wrk2-api/cast-info/write"
+PLOT_PATH = "/wrk2-api/plot/write"
+MOVIE_INFO_PATH = "/wrk2-api/movie-info/write"
+REGISTER_MOVIE_PATH = "/wrk2-api/movie/register"
 
 async def upload_cast_info(session, addr, cast):
-  async with session.post(addr + "/wrk2-api/cast-info/write", json=cast) as resp:
+  async with session.post(addr + CAST_INFO_PATH, json=cast) as resp:
     return await resp.text()
 
 async def upload_plot(session, addr, plot):
-  async with session.post(addr + "/wrk2-api/plot/write", json=plot) as resp:
+  async with session.post(addr + PLOT_PATH, json=plot) as resp:
     return await resp.text()
 
 async def upload_movie_info(session, addr, movie):
-  async with session.post(addr + "/wrk2-api/movie-info/write", json=movie) as resp:
+  async with session.post(addr + MOVIE_INFO_PATH, json=movie) as resp:
     return await resp.text()
 
 async def register_movie(session, addr, movie):
@@ -21,73 +33,346 @@ async def register_movie(session, addr, movie):
     "title": movie["title"],
     "movie_id": movie["movie_id"]
   }
-  async with session.post(addr + "/wrk2-api/movie/register", data=params) as resp:
+  async with session.post(addr + REGISTER_MOVIE_PATH, data=params) as resp:
+    return await resp.text()
+
+UPLOADS = {
+  CAST_INFO_PATH: upload_cast_info,
+  PLOT_PATH: upload_plot,
+  MOVIE_INFO_PATH: upload_movie_info,
+  REGISTER_MOVIE_PATH: register_movie,
+}
+
+# Endpoints that take a JSON array of records; /movie/register has none.
+BATCH_ENDPOINTS = {
+  CAST_INFO_PATH: CAST_INFO_PATH + "-batch",
+  PLOT_PATH: PLOT_PATH + "-batch",
+  MOVIE_INFO_PATH: MOVIE_INFO_PATH + "-batch",
+}
+
+async def upload_batch(batch_endpoint, session, addr, records):
+  async with session.post(addr + batch_endpoint, json=records) as resp:
     return await resp.text()
 
-async def write_cast_info(addr, raw_casts):
-  idx = 0
-  tasks = []
-  conn = aiohttp.TCPConnector(limit=200)
-  async with aiohttp.ClientSession(connector=conn) as session:
-    for raw_cast in raw_casts:
-      try:
-        cast = dict()
-        cast["cast_info_id"] = raw_cast["id"]
-        cast["name"] = raw_cast["name"]
-        cast["gender"] = True if raw_cast["gender"] == 2 else False
-        cast["intro"] = raw_cast["biography"]
-        task = asyncio.ensure_future(upload_cast_info(session, addr, cast))
-        tasks.append(task)
-        idx += 1
-      except:
-        print("Warning: cast info missing!")
-      if idx % 200 == 0:
-        resps = await asyncio.gather(*tasks)
-        print(idx, "casts finished")
-    resps = await asyncio.gather(*tasks)
-    print(idx, "casts finished")
-
-async def write_movie_info(addr, raw_movies):
-  idx = 0
-  tasks = []
-  conn = aiohttp.TCPConnector(limit=200)
-  async with aiohttp.ClientSession(connector=conn) as session:
-    for raw_movie in raw_movies:
-      movie = dict()
-      casts = list()
-      movie["movie_id"] = str(raw_movie["id"])
-      movie["title"] = raw_movie["title"]
-      movie["plot_id"] = raw_movie["id"]
-      for raw_cast in raw_movie["cast"]:
-        try:
-          cast = dict()
-          cast["cast_id"] = raw_cast["cast_id"]
-          cast["character"] = raw_cast["character"]
-          cast["cast_info_id"] = raw_cast["id"]
-          casts.append(cast)
-        except:
-          print("Warning: cast info missing!")
-      movie["casts"] = casts
-      movie["thumbnail_ids"] = [raw_movie["poster_path"]]
-      movie["photo_ids"] = []
-      movie["video_ids"] = []
-      movie["avg_rating"] = raw_movie["vote_average"]
-      movie["num_rating"] = raw_movie["vote_count"]
-      task = asyncio.ensure_future(upload_movie_info(session, addr, movie))
-      tasks.append(task)
-      plot = dict()
-      plot["plot_id"] = raw_movie["id"]
-      plot["plot"] = raw_movie["overview"]
-      task = asyncio.ensure_future(upload_plot(session, addr, plot))
-      tasks.append(task)
-      task = asyncio.ensure_future(register_movie(session, addr, movie))
-      tasks.append(task)
-      idx += 1
-      if idx % 200 == 0:
-        resps = await asyncio.gather(*tasks)
-        print(idx, "movies finished")
-    resps = await asyncio.gather(*tasks)
-    print(idx, "movies finished")
+def encode_request(endpoint, record):
+  if endpoint == REGISTER_MOVIE_PATH:
+    params = {"title": record["title"], "movie_id": record["movie_id"]}
+    return endpoint, "application/x-www-form-urlencoded", urllib.parse.urlencode(params).encode()
+  return endpoint, "application/json", json.dumps(record).encode()
+
+async def upload_pipelined(pool, endpoint, session, addr, records):
+  responses = await pool.request_many([encode_request(endpoint, r) for r in records])
+  failed = sum(1 for status, _ in responses if status >= 400)
+  if failed:
+    raise aiohttp.ClientError("{} of {} requests failed".format(failed, len(responses)))
+  return responses
+
+async def timed(stats, endpoint, coro):
+  start = time.monotonic()
+  try:
+    return await coro
+  finally:
+    stats.record(endpoint, time.monotonic() - start)
+
+def make_cast(raw_cast):
+  cast = dict()
+  cast["cast_info_id"] = raw_cast["id"]
+  cast["name"] = raw_cast["name"]
+  cast["gender"] = True if raw_cast["gender"] == 2 else False
+  cast["intro"] = raw_cast["biography"]
+  return cast
+
+def make_movie(raw_movie):
+  movie = dict()
+  casts = list()
+  movie["movie_id"] = str(raw_movie["id"])
+  movie["title"] = raw_movie["title"]
+  movie["plot_id"] = raw_movie["id"]
+  for raw_cast in raw_movie["cast"]:
+    try:
+      cast = dict()
+      cast["cast_id"] = raw_cast["cast_id"]
+      cast["character"] = raw_cast["character"]
+      cast["cast_info_id"] = raw_cast["id"]
+      casts.append(cast)
+    except:
+      print("Warning: cast info missing!")
+  movie["casts"] = casts
+  movie["thumbnail_ids"] = [raw_movie["poster_path"]]
+  movie["photo_ids"] = []
+  movie["video_ids"] = []
+  movie["avg_rating"] = raw_movie["vote_average"]
+  movie["num_rating"] = raw_movie["vote_count"]
+  plot = dict()
+  plot["plot_id"] = raw_movie["id"]
+  plot["plot"] = raw_movie["overview"]
+  return movie, plot
+
+class UploadScheduler:
+  """Keeps at most `limit` uploads in flight, whatever phase they belong to."""
+
+  def __init__(self, session, addr, stats, limit=200):
+    self.session = session
+    self.addr = addr
+    self.stats = stats
+    self.done = 0
+    self.records = 0
+    self.failed = 0  # records in failed uploads
+    self.start = time.monotonic()
+    self._slots = asyncio.Semaphore(limit)
+    self._tasks = set()
+
+  async def submit(self, endpoint, upload, payload, on_done=None, records=1):
+    """Waits for a free slot, then starts the upload in the background.
+    on_done(ok) runs once it has finished, with ok False if it failed."""
+    await self._slots.acquire()
+    self.track(self._run(endpoint, upload, payload, on_done, records))
+
+  def spawn(self, endpoint, upload, payload, on_done=None, records=1):
+    """Like submit(), but callable from a completion callback."""
+    self.track(self.submit(endpoint, upload, payload, on_done, records))
+
+  def track(self, coro):
+    task = asyncio.ensure_future(coro)
+    self._tasks.add(task)
+    task.add_done_callback(self._tasks.discard)
+
+  async def _run(self, endpoint, upload, payload, on_done, records):
+    ok = False
+    try:
+      await timed(self.stats, endpoint, upload(self.session, self.addr, payload))
+      ok = True
+    except Exception as e:
+      # Client errors, timeouts, and whatever a pipelined connection
+      # raises on a reset or a garbled response, fail only this upload.
+      print("Warning:", endpoint, "failed:", "{}: {}".format(type(e).__name__, e))
+      self.failed += records
+    finally:
+      self._slots.release()
+      self.done += 1
+      self.records += records
+      if self.done % 1000 == 0:
+        print(self.done, "requests finished")
+      if on_done is not None:
+        on_done(ok)
+
+  async def drain(self):
+    while self._tasks:
+      await asyncio.gather(*list(self._tasks))
+
+  def print_summary(self, batch_size):
+    elapsed = time.monotonic() - self.start
+    print("{} records in {} requests (batch size {}), {:.1f}s: {:.1f} records/s, {:.1f} requests/s".format(
+      self.records, self.done, batch_size, elapsed,
+      self.records / elapsed if elapsed else 0.0, self.done / elapsed if elapsed else 0.0))
+    if self.failed:
+      print("{} records failed".format(self.failed))
+
+class RecordWriter:
+  """Sends one request per record."""
+
+  def __init__(self, scheduler):
+    self.scheduler = scheduler
+
+  async def write(self, endpoint, record, on_done=None):
+    await self.scheduler.submit(endpoint, UPLOADS[endpoint], record, on_done)
+
+  def defer(self, endpoint, record, on_done=None):
+    """Like write(), but callable from a completion callback."""
+    self.scheduler.spawn(endpoint, UPLOADS[endpoint], record, on_done)
+
+  async def flush(self):
+    pass
+
+class BatchWriter(RecordWriter):
+  """Groups records per endpoint into batches of `batch_size`.
+
+  `senders` maps an endpoint to (label, upload) where upload takes a list
+  of records; endpoints without a sender fall back to one request per
+  record. A partial batch is sent once it has waited `linger` seconds, so
+  records that others depend on are never held back indefinitely.
+  """
+
+  def __init__(self, scheduler, senders, batch_size, linger=0.05):
+    super().__init__(scheduler)
+    self.senders = senders
+    self.batch_size = batch_size
+    self.linger = linger
+    self._batches = dict()
+    self._timers = dict()
+
+  async def write(self, endpoint, record, on_done=None):
+    if endpoint not in self.senders:
+      return await super().write(endpoint, record, on_done)
+    batch = self._add(endpoint, record, on_done)
+    if batch:
+      await self._submit(endpoint, batch)
+
+  def defer(self, endpoint, record, on_done=None):
+    if endpoint not in self.senders:
+      return super().defer(endpoint, record, on_done)
+    batch = self._add(endpoint, record, on_done)
+    if batch:
+      self.scheduler.track(self._submit(endpoint, batch))
+
+  async def flush(self):
+    for endpoint in list(self._batches):
+      batch = self._take(endpoint)
+      if batch:
+        await self._submit(endpoint, batch)
+
+  def _add(self, endpoint, record, on_done):
+    batch = self._batches.setdefault(endpoint, [])
+    batch.append((record, on_done))
+    if len(batch) >= self.batch_size:
+      return self._take(endpoint)
+    if len(batch) == 1:
+      self._timers[endpoint] = asyncio.get_running_loop().call_later(
+        self.linger, self._expire, endpoint)
+    return None
+
+  def _take(self, endpoint):
+    timer = self._timers.pop(endpoint, None)
+    if timer is not None:
+      timer.cancel()
+    return self._batches.pop(endpoint, None)
+
+  def _expire(self, endpoint):
+    self._timers.pop(endpoint, None)
+    batch = self._batches.pop(endpoint, None)
+    if batch:
+      self.scheduler.track(self._submit(endpoint, batch))
+
+  async def _submit(self, endpoint, batch):
+    label, upload = self.senders[endpoint]
+    records = [record for record, _ in batch]
+    callbacks = [on_done for _, on_done in batch if on_done is not None]
+    def on_done(ok):
+      for callback in callbacks:
+        callback(ok)
+    await self.scheduler.submit(label, upload, records, on_done, len(records))
+
+class CastDependencies:
+  """Tracks queued and finished cast infos and the callbacks waiting for them."""
+
+  def __init__(self):
+    self.queued = set()
+    self.finished = dict()  # cast_info_id -> whether it was written
+    self.closed = False
+    self._waiters = dict()
+
+  def queue(self, cast_info_id):
+    self.queued.add(cast_info_id)
+
+  def finish(self, cast_info_id, ok):
+    self.finished[cast_info_id] = ok
+    for callback in self._waiters.pop(cast_info_id, ()):
+      callback(ok)
+
+  def wait(self, cast_info_id, callback):
+    """Calls callback(ok) once the cast info is written (ok) or has failed,
+    or right away if that is already known."""
+    if cast_info_id in self.finished:
+      callback(self.finished[cast_info_id])
+    elif self.closed and cast_info_id not in self.queued:
+      callback(True)  # never coming; the movie goes without it
+    else:
+      self._waiters.setdefault(cast_info_id, []).append(callback)
+
+  def close(self):
+    # No more cast infos are coming; casts never queued will stay missing.
+    # Casts still being uploaded release their movies when they finish.
+    self.closed = True
+    for cast_info_id in list(self._waiters):
+      if cast_info_id not in self.queued:
+        for callback in self._waiters.pop(cast_info_id):
+          callback(True)
+
+class Countdown:
+  """Calls callback(ok) after `count` calls; ok is False if any call's was."""
+
+  def __init__(self, count, callback):
+    self.count = count
+    self.ok = True
+    self.callback = callback
+
+  def __call__(self, ok=True):
+    self.ok = self.ok and ok
+    self.count -= 1
+    if self.count == 0:
+      self.callback(self.ok)
+
+async def feed_casts(writer, deps, raw_casts):
+  num_casts = 0
+  for raw_cast in raw_casts:
+    try:
+      cast = make_cast(raw_cast)
+    except:
+      print("Warning: cast info missing!")
+      continue
+    deps.queue(cast["cast_info_id"])
+    await writer.write(CAST_INFO_PATH, cast,
+      functools.partial(deps.finish, cast["cast_info_id"]))
+    num_casts += 1
+  print(num_casts, "casts queued")
+
+async def feed_movies(writer, deps, raw_movies, max_pending):
+  # A movie is registered, which makes its page reachable by title, only
+  # after its movie info, its plot and the cast infos of all of its casts
+  # have been written; if one of them fails, it is reported and left out.
+  # Other uploads are unordered.
+  pending = asyncio.Semaphore(max_pending)
+  num_movies = 0
+  for raw_movie in raw_movies:
+    movie, plot = make_movie(raw_movie)
+    await pending.acquire()
+    def register(ok, movie=movie):
+      if ok:
+        writer.defer(REGISTER_MOVIE_PATH, movie, lambda ok: pending.release())
+      else:
+        print("Warning: movie", movie["movie_id"], "not registered, a record it needs failed")
+        pending.release()
+    cast_info_ids = set(cast["cast_info_id"] for cast in movie["casts"])
+    ready = Countdown(2 + len(cast_info_ids), register)
+    for cast_info_id in cast_info_ids:
+      deps.wait(cast_info_id, ready)
+    await writer.write(MOVIE_INFO_PATH, movie, ready)
+    await writer.write(PLOT_PATH, plot, ready)
+    num_movies += 1
+  print(num_movies, "movies queued")
+
+async def write_all(addr, raw_casts, raw_movies, stats, limit=200,
+                    batch_size=1, batch_mode="endpoint"):
+  pool = PipelinePool(addr) if batch_mode == "pipeline" else None
+  conn = aiohttp.TCPConnector(limit=limit)
+  # Error statuses count as failed uploads, which hold back what depends on them.
+  async with aiohttp.ClientSession(connector=conn, raise_for_status=True) as session:
+    scheduler = UploadScheduler(session, addr, stats, limit)
+    if batch_size <= 1:
+      writer = RecordWriter(scheduler)
+    elif batch_mode == "pipeline":
+      writer = BatchWriter(scheduler, dict(
+        (endpoint, (endpoint + " [pipelined]", functools.partial(upload_pipelined, pool, endpoint)))
+        for endpoint in UPLOADS), batch_size)
+    else:
+      writer = BatchWriter(scheduler, dict(
+        (endpoint, (batch_endpoint, functools.partial(upload_batch, batch_endpoint)))
+        for endpoint, batch_endpoint in BATCH_ENDPOINTS.items()), batch_size)
+    deps = CastDependencies()
+    casts = asyncio.ensure_future(feed_casts(writer, deps, raw_casts))
+    movies = asyncio.ensure_future(feed_movies(writer, deps, raw_movies, 10 * limit))
+    try:
+      await casts
+      deps.close()
+      await movies
+      await writer.flush()
+      await scheduler.drain()
+    finally:
+      casts.cancel()
+      movies.cancel()
+      if pool is not None:
+        pool.close()
+  scheduler.print_summary(batch_size)
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser()
@@ -97,16 +382,27 @@ if __name__ == '__main__':
     type=str, default="../datasets/tmdb/movies.json")
   parser.add_argument("--server_address", action="store", dest="server_addr",
     type=str, default="http://127.0.0.1:8080")
+  parser.add_argument("--limit", action="store", dest="limit",
+    type=int, default=200, help="number of requests in flight")
+  parser.add_argument("--batch_size", action="store", dest="batch_size",
+    type=int, default=1, help="records per request (1 disables batching)")
+  parser.add_argument("--batch_mode", action="store", dest="batch_mode",
+    choices=["endpoint", "pipeline"], default="endpoint",
+    help="send each batch to the */write-batch endpoints, or as pipelined requests on one keep-alive connection")
+  parser.add_argument("--stats_json", action="store", dest="stats_json",
+    type=str, default=None, help="also write latency histograms and throughput to this JSON file")
   args = parser.parse_args()
 
-  with open(args.cast_filename, 'r') as cast_file:
-    raw_casts = json.load(cast_file)
-  loop = asyncio.get_event_loop()
-  future = asyncio.ensure_future(write_cast_info(args.server_addr, raw_casts))
-  loop.run_until_complete(future)
-
-  with open(args.movie_filename, 'r') as movie_file:
-    raw_movies = json.load(movie_file)
-    loop = asyncio.get_event_loop()
-    future = asyncio.ensure_future(write_movie_info(args.server_addr, raw_movies))
-    loop.run_until_complete(future)
\ No newline at end of file
+  stats = RequestStats()
+
+  with open(args.cast_filename, 'r') as cast_file, \
+       open(args.movie_filename, 'r') as movie_file:
+    raw_casts = iter_json_array(cast_file)
+    raw_movies = iter_json_array(movie_file)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(write_all(args.server_addr, raw_casts, raw_movies, stats, args.limit,
+      args.batch_size, args.batch_mode))
+
+  stats.print_report()
+  if args.stats_json:
+    stats.dump_json(args.stats_json)
@@ -0,0 +1,799 @@
+"""In-process stand-in cluster for the media_service call graph.
+
+Every service is a Python implementation of the generated Iface, backed
+by in-memory dicts and served by the generated Processor on its
+docker-compose host port on loopback. Calls between services are real
+Thrift hops, following the C++ handlers in src/:
+
+  UploadText, UploadUniqueId, UploadUserWithUsername/-UserId -> ComposeReview
+  UploadMovieId -> ComposeReview.UploadMovieId, RatingService.UploadRating
+                   -> ComposeReview.UploadRating
+  ComposeReview (once all five parts are in) -> StoreReview,
+                   UploadUserReview, UploadMovieReview
+  ReadPage -> ReadMovieInfo, ReadMovieReviews -> ReadReviews
+           -> ReadCastInfo, ReadPlot
+
+A handler makes its downstream calls one after another on its own
+thread.
+
+Every handler call first sleeps for its service's service time (constant,
+exponential or lognormal), with the options of socialNetwork's
+standin_services.py. An HTTP front on port 8080 serves the nginx
+/wrk2-api/ endpoints, so the TMDB seeding script and the curl scripts
+work unchanged:
+
+  python3 standin_cluster.py --service-time 0.5 --service-time page-service=2 \
+      --distribution exponential
+  python3 ../scripts/write_movie_info.py -c casts.json -m movies.json
+  python3 testComposeReviewServiceE2E.py 127.0.0.1
+
+--bench N registers users and movies, then composes N reviews and reads
+N pages over Thrift and prints their throughput.
+"""
+
+import sys
+sys.path.append('../gen-py')
+sys.path.append('../..')
+
+import argparse
+import hashlib
+import http.server
+import itertools
+import json
+import random
+import string
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from media_service import CastInfoService
+from media_service import ComposeReviewService
+from media_service import MovieIdService
+from media_service import MovieInfoService
+from media_service import MovieReviewService
+from media_service import PageService
+from media_service import PlotService
+from media_service import RatingService
+from media_service import ReviewStorageService
+from media_service import TextService
+from media_service import UniqueIdService
+from media_service import UserReviewService
+from media_service import UserService
+from media_service.ttypes import Cast, CastInfo, ErrorCode, MovieInfo, Page, Review
+from media_service.ttypes import ServiceException, User
+
+from thriftkit import PoolManager, ProcessorMetrics, ThriftServer
+from thriftkit.histogram import LatencyHistogram
+from thriftkit.server import StatsReporter
+from thriftkit.tracing import Tracer, traced_checkout
+
+# The host ports docker-compose.yml maps each service to; page-service has
+# no mapping there and takes the next free one.
+PORTS = {
+    'unique-id-service': 10001,
+    'movie-id-service': 10002,
+    'text-service': 10003,
+    'rating-service': 10004,
+    'user-service': 10005,
+    'compose-review-service': 10006,
+    'review-storage-service': 10007,
+    'user-review-service': 10008,
+    'movie-review-service': 10009,
+    'cast-info-service': 10010,
+    'plot-service': 10011,
+    'movie-info-service': 10012,
+    'page-service': 10013,
+}
+
+SERVICES = {
+    'unique-id-service': UniqueIdService,
+    'movie-id-service': MovieIdService,
+    'text-service': TextService,
+    'rating-service': RatingService,
+    'user-service': UserService,
+    'compose-review-service': ComposeReviewService,
+    'review-storage-service': ReviewStorageService,
+    'user-review-service': UserReviewService,
+    'movie-review-service': MovieReviewService,
+    'cast-info-service': CastInfoService,
+    'plot-service': PlotService,
+    'movie-info-service': MovieInfoService,
+    'page-service': PageService,
+}
+
+HTTP_PORT = 8080
+NUM_COMPONENTS = 5  # review_id, user_id, movie_id, text, rating
+DISTRIBUTIONS = ('constant', 'exponential', 'lognormal')
+
+
+def _error(message):
+  return ServiceException(errorCode=ErrorCode.SE_THRIFT_HANDLER_ERROR, message=message)
+
+
+class Handler:
+  """Base of the stand-in handlers: service time and downstream clients."""
+
+  name = None
+
+  def __init__(self, cluster):
+    self.cluster = cluster
+    self.lock = threading.Lock()
+
+  def work(self):
+    self.cluster.pause(self.name)
+
+  def call(self, name, method, *args):
+    # Downstream hops run on the handler's own thread. A shared pool would
+    # let parents that block on their children starve those children.
+    return self.cluster.call(name, method, *args)
+
+
+class UniqueIdHandler(Handler):
+  name = 'unique-id-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.counter = itertools.count(1)
+
+  def UploadUniqueId(self, req_id, carrier):
+    self.work()
+    self.call('compose-review-service', 'UploadUniqueId', req_id, next(self.counter), carrier)
+
+
+class TextHandler(Handler):
+  name = 'text-service'
+
+  def UploadText(self, req_id, text, carrier):
+    self.work()
+    self.call('compose-review-service', 'UploadText', req_id, text, carrier)
+
+
+class RatingHandler(Handler):
+  name = 'rating-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    # movie_id -> [sum, count] of ratings not yet folded into the movie info.
+    self.uncommitted = {}
+
+  def UploadRating(self, req_id, movie_id, rating, carrier):
+    self.work()
+    with self.lock:
+      totals = self.uncommitted.setdefault(movie_id, [0, 0])
+      totals[0] += rating
+      totals[1] += 1
+    self.call('compose-review-service', 'UploadRating', req_id, rating, carrier)
+
+
+class MovieIdHandler(Handler):
+  name = 'movie-id-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.movie_ids = {}
+
+  def UploadMovieId(self, req_id, title, rating, carrier):
+    self.work()
+    movie_id = self.movie_ids.get(title)
+    if movie_id is None:
+      raise _error('Movie %s is not found in MongoDB' % title)
+    self.call('compose-review-service', 'UploadMovieId', req_id, movie_id, carrier)
+    self.call('rating-service', 'UploadRating', req_id, movie_id, rating, carrier)
+
+  def RegisterMovieId(self, req_id, title, movie_id, carrier):
+    self.work()
+    with self.lock:
+      if title in self.movie_ids:
+        raise _error('Movie %s already existed in MongoDB' % title)
+      self.movie_ids[title] = movie_id
+
+
+class UserHandler(Handler):
+  name = 'user-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.users = {}
+    self.counter = itertools.count(1 << 32)
+
+  def _register(self, first_name, last_name, username, password, user_id):
+    salt = ''.join(self.cluster.rng.choices(string.ascii_letters + string.digits, k=32))
+    user = User(user_id=user_id, first_name=first_name, last_name=last_name,
+                username=username, salt=salt,
+                password=hashlib.sha256((password + salt).encode()).hexdigest())
+    with self.lock:
+      if username in self.users:
+        raise _error('User %s already existed' % username)
+      self.users[username] = user
+
+  def RegisterUser(self, req_id, first_name, last_name, username, password, carrier):
+    self.work()
+    self._register(first_name, last_name, username, password, next(self.counter))
+
+  def RegisterUserWithId(self, req_id, first_name, last_name, username, password, user_id,
+                         carrier):
+    self.work()
+    self._register(first_name, last_name, username, password, user_id)
+
+  def _user(self, username):
+    user = self.users.get(username)
+    if user is None:
+      raise _error('User: %s is not registered' % username)
+    return user
+
+  def Login(self, req_id, username, password, carrier):
+    self.work()
+    user = self._user(username)
+    if hashlib.sha256((password + user.salt).encode()).hexdigest() != user.password:
+      raise ServiceException(errorCode=ErrorCode.SE_UNAUTHORIZED,
+                             message='Incorrect username or password')
+    return 'token-%d-%d' % (user.user_id, int(time.time()))
+
+  def UploadUserWithUserId(self, req_id, user_id, carrier):
+    self.work()
+    self.call('compose-review-service', 'UploadUserId', req_id, user_id, carrier)
+
+  def UploadUserWithUsername(self, req_id, username, carrier):
+    self.work()
+    self.call('compose-review-service', 'UploadUserId', req_id,
+              self._user(username).user_id, carrier)
+
+
+class ComposeReviewHandler(Handler):
+  name = 'compose-review-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    # req_id -> the review parts uploaded so far.
+    self.pending = {}
+    self.composed = 0
+
+  def _upload(self, req_id, field, value, carrier):
+    self.work()
+    with self.lock:
+      parts = self.pending.setdefault(req_id, {})
+      if field in parts:
+        raise _error('Review %s of request %d uploaded twice' % (field, req_id))
+      parts[field] = value
+      if len(parts) < NUM_COMPONENTS:
+        return
+      del self.pending[req_id]
+      self.composed += 1
+    review = Review(req_id=req_id, timestamp=int(time.time() * 1000), **parts)
+    self.call('review-storage-service', 'StoreReview', req_id, review, carrier)
+    self.call('user-review-service', 'UploadUserReview', req_id, review.user_id,
+              review.review_id, review.timestamp, carrier)
+    self.call('movie-review-service', 'UploadMovieReview', req_id, review.movie_id,
+              review.review_id, review.timestamp, carrier)
+
+  def UploadText(self, req_id, text, carrier):
+    self._upload(req_id, 'text', text, carrier)
+
+  def UploadRating(self, req_id, rating, carrier):
+    self._upload(req_id, 'rating', rating, carrier)
+
+  def UploadMovieId(self, req_id, movie_id, carrier):
+    self._upload(req_id, 'movie_id', movie_id, carrier)
+
+  def UploadUniqueId(self, req_id, unique_id, carrier):
+    self._upload(req_id, 'review_id', unique_id, carrier)
+
+  def UploadUserId(self, req_id, user_id, carrier):
+    self._upload(req_id, 'user_id', user_id, carrier)
+
+
+class ReviewStorageHandler(Handler):
+  name = 'review-storage-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.reviews = {}
+
+  def StoreReview(self, req_id, review, carrier):
+    self.work()
+    self.reviews[review.review_id] = review
+
+  def ReadReviews(self, req_id, review_ids, carrier):
+    self.work()
+    return [self.reviews[review_id] for review_id in review_ids
+            if review_id in self.reviews]
+
+
+class _ReviewIndex(Handler):
+  """Review ids per user or movie, read newest first."""
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.index = {}
+
+  def _append(self, key, review_id):
+    with self.lock:
+      self.index.setdefault(key, []).append(review_id)
+
+  def _read(self, req_id, key, start, stop, carrier):
+    review_ids = self.index.get(key, [])
+    if start < 0 or stop <= start:
+      return []
+    end = len(review_ids)
+    review_ids = review_ids[max(0, end - stop):end - start][::-1]
+    if not review_ids:
+      return []
+    return self.call('review-storage-service', 'ReadReviews', req_id, review_ids, carrier)
+
+
+class UserReviewHandler(_ReviewIndex):
+  name = 'user-review-service'
+
+  def UploadUserReview(self, req_id, user_id, review_id, timestamp, carrier):
+    self.work()
+    self._append(user_id, review_id)
+
+  def ReadUserReviews(self, req_id, user_id, start, stop, carrier):
+    self.work()
+    return self._read(req_id, user_id, start, stop, carrier)
+
+
+class MovieReviewHandler(_ReviewIndex):
+  name = 'movie-review-service'
+
+  def UploadMovieReview(self, req_id, movie_id, review_id, timestamp, carrier):
+    self.work()
+    self._append(movie_id, review_id)
+
+  def ReadMovieReviews(self, req_id, movie_id, start, stop, carrier):
+    self.work()
+    return self._read(req_id, movie_id, start, stop, carrier)
+
+
+class CastInfoHandler(Handler):
+  name = 'cast-info-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.cast_infos = {}
+
+  def WriteCastInfo(self, req_id, cast_info_id, name, gender, intro, carrier):
+    self.work()
+    self.cast_infos[cast_info_id] = CastInfo(cast_info_id=cast_info_id, name=name,
+                                             gender=gender, intro=intro)
+
+  def ReadCastInfo(self, req_id, cast_ids, carrier):
+    self.work()
+    return [self.cast_infos[cast_id] for cast_id in cast_ids if cast_id in self.cast_infos]
+
+
+class PlotHandler(Handler):
+  name = 'plot-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.plots = {}
+
+  def WritePlot(self, req_id, plot_id, plot, carrier):
+    self.work()
+    self.plots[plot_id] = plot
+
+  def ReadPlot(self, req_id, plot_id, carrier):
+    self.work()
+    plot = self.plots.get(plot_id)
+    if plot is None:
+      raise _error('Plot_id %d is not found in MongoDB' % plot_id)
+    return plot
+
+
+class MovieInfoHandler(Handler):
+  name = 'movie-info-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.movie_infos = {}
+
+  def WriteMovieInfo(self, req_id, movie_id, title, casts, plot_id, thumbnail_ids,
+                     photo_ids, video_ids, avg_rating, num_rating, carrier):
+    self.work()
+    self.movie_infos[movie_id] = MovieInfo(
+        movie_id=movie_id, title=title, casts=casts, plot_id=plot_id,
+        thumbnail_ids=thumbnail_ids, photo_ids=photo_ids, video_ids=video_ids,
+        avg_rating=avg_rating, num_rating=num_rating)
+
+  def ReadMovieInfo(self, req_id, movie_id, carrier):
+    self.work()
+    movie_info = self.movie_infos.get(movie_id)
+    if movie_info is None:
+      raise _error('Movie %s is not found in MongoDB' % movie_id)
+    return movie_info
+
+  def UpdateRating(self, req_id, movie_id, sum_uncommitted_rating, num_uncommitted_rating,
+                   carrier):
+    self.work()
+    with self.lock:
+      movie_info = self.ReadMovieInfo(req_id, movie_id, carrier)
+      total = movie_info.avg_rating * movie_info.num_rating + sum_uncommitted_rating
+      movie_info.num_rating += num_uncommitted_rating
+      movie_info.avg_rating = total / movie_info.num_rating if movie_info.num_rating else 0.0
+
+
+class PageHandler(Handler):
+  name = 'page-service'
+
+  def ReadPage(self, req_id, movie_id, review_start, review_stop, carrier):
+    self.work()
+    reviews = self.call('movie-review-service', 'ReadMovieReviews', req_id, movie_id,
+                        review_start, review_stop, carrier)
+    movie_info = self.call('movie-info-service', 'ReadMovieInfo', req_id, movie_id, carrier)
+    cast_infos = self.call('cast-info-service', 'ReadCastInfo', req_id,
+                           [cast.cast_info_id for cast in movie_info.casts or ()], carrier)
+    plot = self.call('plot-service', 'ReadPlot', req_id, movie_info.plot_id, carrier)
+    return Page(movie_info=movie_info, reviews=reviews, cast_infos=cast_infos, plot=plot)
+
+
+HANDLERS = [
+    UniqueIdHandler, MovieIdHandler, TextHandler, RatingHandler, UserHandler,
+    ComposeReviewHandler, ReviewStorageHandler, UserReviewHandler, MovieReviewHandler,
+    CastInfoHandler, PlotHandler, MovieInfoHandler, PageHandler,
+]
+
+
+class StandInCluster:
+  """Serves every media_service stand-in on `host`, one port per service.
+
+  `service_time` is the mean time in seconds each handler call spends
+  before doing its work, overridden per service name by `service_times`;
+  `distribution` is 'constant', 'exponential' or 'lognormal' (with shape
+  `sigma`, the service time being its median). With `metrics`, a thriftkit
+  ProcessorMetrics, every Processor is instrumented;
+  with `tracer`, a thriftkit Tracer, every call is traced.
+  """
+
+  def __init__(self, host='127.0.0.1', ports=None, service_time=0.0,
+               distribution='constant', service_times=None, sigma=0.5, workers=64, seed=1,
+               server_mode='threads', report_interval=None, metrics=None, tracer=None):
+    if distribution not in DISTRIBUTIONS:
+      raise ValueError('unknown service time distribution %r' % distribution)
+    self.host = host
+    self.ports = dict(PORTS, **(ports or {}))
+    self.service_time = service_time
+    self.distribution = distribution
+    self.service_times = dict(service_times or {})
+    self.sigma = sigma
+    self.rng = random.Random(seed)
+    self.pools = PoolManager()
+    # Fans out top-level requests only (the HTTP front and bench()); no
+    # handler submits to it, so nothing in it waits on work queued behind it.
+    self.executor = ThreadPoolExecutor(workers)
+    self.handlers = {cls.name: cls(self) for cls in HANDLERS}
+    self.workers = workers
+    self.server_mode = server_mode
+    self.report_interval = report_interval
+    self.metrics = metrics
+    self.tracer = tracer
+    self.servers = {}
+    self.reporter = None
+
+  def pause(self, name):
+    mean = self.service_times.get(name, self.service_time)
+    if mean <= 0:
+      return
+    if self.distribution == 'exponential':
+      mean = self.rng.expovariate(1.0 / mean)
+    elif self.distribution == 'lognormal':
+      mean *= self.rng.lognormvariate(0.0, self.sigma)
+    time.sleep(mean)
+
+  def client(self, name):
+    checkout = self.pools.client(SERVICES[name], self.host, self.ports[name])
+    if self.tracer is not None:
+      checkout = traced_checkout(checkout, SERVICES[name], self.tracer, name)
+    return checkout
+
+  def call(self, name, method, *args):
+    """Calls `method` of service `name` over a pooled connection."""
+    with self.client(name) as client:
+      return getattr(client, method)(*args)
+
+  def start(self):
+    for name, handler in self.handlers.items():
+      processor = SERVICES[name].Processor(handler)
+      if self.metrics is not None:
+        self.metrics.instrument(processor, name)
+      if self.tracer is not None:
+        self.tracer.instrument(processor, name)
+      self.servers[name] = ThriftServer(processor, self.host, self.ports[name],
+                                        mode=self.server_mode, workers=self.workers).start()
+    if self.report_interval:
+      self.reporter = StatsReporter(self.server_stats, self.report_interval).start()
+    return self
+
+  def server_stats(self):
+    """Returns {'<service>.<method>': LatencyHistogram} over all servers."""
+    return {'%s.%s' % (name, method): histogram
+            for name, server in self.servers.items()
+            for method, histogram in server.stats.snapshot().items()}
+
+  def stop(self):
+    if self.reporter is not None:
+      self.reporter.stop()
+      self.reporter = None
+    for server in self.servers.values():
+      server.stop()
+    self.servers = {}
+    self.pools.close()
+    self.executor.shutdown(wait=False)
+
+
+def _form(body, *names):
+  params = urllib.parse.parse_qs(body.decode('utf-8'))
+  values = [params.get(name, [''])[0] for name in names]
+  if not all(values):
+    raise ValueError('Incomplete arguments')
+  return values
+
+
+def _json_records(body, *names):
+  if not body:
+    raise ValueError('Empty body')
+  records = json.loads(body)
+  for record in records if isinstance(records, list) else [records]:
+    if any(record.get(name) is None for name in names):
+      raise ValueError('Incomplete arguments')
+  return records
+
+
+CAST_INFO_FIELDS = ('cast_info_id', 'name', 'gender', 'intro')
+PLOT_FIELDS = ('plot_id', 'plot')
+MOVIE_INFO_FIELDS = ('movie_id', 'title', 'casts', 'plot_id', 'thumbnail_ids', 'photo_ids',
+                     'video_ids', 'avg_rating', 'num_rating')
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+  # The seeding script opens hundreds of connections at once; the default
+  # backlog of 5 drops their SYNs and costs each a 1s retransmit.
+  request_queue_size = 1024
+  daemon_threads = True
+
+
+class WrkApiFront:
+  """The nginx /wrk2-api/ endpoints, forwarding to the cluster over Thrift.
+
+  Like the lua scripts, each request gets a random req_id and writes its
+  records over one pooled connection; responses are plain text.
+  """
+
+  def __init__(self, cluster, host='127.0.0.1', port=HTTP_PORT):
+    self.cluster = cluster
+    front = self
+
+    class RequestHandler(http.server.BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'
+
+      def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        route = front.routes.get(urllib.parse.urlsplit(self.path).path)
+        if route is None:
+          return self._reply(404, 'Not found')
+        try:
+          text = route(body)
+        except ValueError as e:
+          return self._reply(400, str(e))
+        except (AttributeError, KeyError, TypeError) as e:
+          # JSON of the wrong shape, e.g. a list of strings or a cast
+          # without its fields.
+          return self._reply(400, 'Malformed arguments: %s: %s' % (type(e).__name__, e))
+        except ServiceException as e:
+          return self._reply(500, e.message)
+        self._reply(200, '' if text is None else str(text))
+
+      def _reply(self, status, text):
+        data = (text + '\n').encode() if text else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+      def log_message(self, format, *args):
+        pass
+
+    self.routes = {
+        '/wrk2-api/user/register': self.register_user,
+        '/wrk2-api/movie/register': self.register_movie,
+        '/wrk2-api/review/compose': self.compose_review,
+        '/wrk2-api/cast-info/write': self.write_cast_info,
+        '/wrk2-api/plot/write': self.write_plot,
+        '/wrk2-api/movie-info/write': self.write_movie_info,
+        '/wrk2-api/cast-info/write-batch': self.write_cast_info,
+        '/wrk2-api/plot/write-batch': self.write_plot,
+        '/wrk2-api/movie-info/write-batch': self.write_movie_info,
+    }
+    self.server = _HTTPServer((host, port), RequestHandler)
+
+  def start(self):
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    return self
+
+  def stop(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def _req_id(self):
+    return random.getrandbits(63)
+
+  def register_user(self, body):
+    first_name, last_name, username, password = _form(
+        body, 'first_name', 'last_name', 'username', 'password')
+    with self.cluster.client('user-service') as client:
+      client.RegisterUser(self._req_id(), first_name, last_name, username, password, {})
+
+  def register_movie(self, body):
+    title, movie_id = _form(body, 'title', 'movie_id')
+    with self.cluster.client('movie-id-service') as client:
+      client.RegisterMovieId(self._req_id(), title, movie_id, {})
+
+  def compose_review(self, body):
+    title, text, username, _, rating = _form(
+        body, 'title', 'text', 'username', 'password', 'rating')
+    req_id = self._req_id()
+    submit, call = self.cluster.executor.submit, self.cluster.call
+    futures = [
+        submit(call, 'user-service', 'UploadUserWithUsername', req_id, username, {}),
+        submit(call, 'movie-id-service', 'UploadMovieId', req_id, title, int(rating), {}),
+        submit(call, 'text-service', 'UploadText', req_id, text, {}),
+        submit(call, 'unique-id-service', 'UploadUniqueId', req_id, {}),
+    ]
+    for future in futures:
+      future.result()
+
+  def write_cast_info(self, body):
+    records = _json_records(body, *CAST_INFO_FIELDS)
+    with self.cluster.client('cast-info-service') as client:
+      for cast_info in records if isinstance(records, list) else [records]:
+        client.WriteCastInfo(self._req_id(), cast_info['cast_info_id'], cast_info['name'],
+                             bool(cast_info['gender']), cast_info['intro'], {})
+    return len(records) if isinstance(records, list) else None
+
+  def write_plot(self, body):
+    records = _json_records(body, *PLOT_FIELDS)
+    with self.cluster.client('plot-service') as client:
+      for plot in records if isinstance(records, list) else [records]:
+        client.WritePlot(self._req_id(), plot['plot_id'], plot['plot'], {})
+    return len(records) if isinstance(records, list) else None
+
+  def write_movie_info(self, body):
+    records = _json_records(body, *MOVIE_INFO_FIELDS)
+    with self.cluster.client('movie-info-service') as client:
+      for movie_info in records if isinstance(records, list) else [records]:
+        casts = [Cast(cast_id=cast.get('cast_id'), character=cast.get('character'),
+                      cast_info_id=cast.get('cast_info_id'))
+                 for cast in movie_info['casts']]
+        client.WriteMovieInfo(
+            self._req_id(), movie_info['movie_id'], movie_info['title'], casts,
+            movie_info['plot_id'], movie_info['thumbnail_ids'], movie_info['photo_ids'],
+            movie_info['video_ids'], float(movie_info['avg_rating']),
+            movie_info['num_rating'], {})
+    return len(records) if isinstance(records, list) else None
+
+
+def bench(cluster, num_users, num_movies, requests, concurrency):
+  """Registers users and movies, composes `requests` reviews, then reads as
+  many pages, and prints throughput and latency percentiles for each."""
+  rng = random.Random(2)
+  for i in range(num_users):
+    cluster.handlers['user-service']._register(
+        'first_%d' % i, 'last_%d' % i, 'username_%d' % i, 'password_%d' % i, i)
+  for i in range(num_movies):
+    movie_id = 'movie_id_%d' % i
+    cluster.handlers['movie-id-service'].movie_ids['movie_title_%d' % i] = movie_id
+    casts = [Cast(cast_id=k, character='character_%d' % k, cast_info_id=i * 10 + k)
+             for k in range(5)]
+    for cast in casts:
+      cluster.handlers['cast-info-service'].cast_infos[cast.cast_info_id] = CastInfo(
+          cast_info_id=cast.cast_info_id, name='name_%d' % cast.cast_info_id, gender=True,
+          intro='intro')
+    cluster.handlers['plot-service'].plots[i] = 'plot_%d' % i
+    cluster.handlers['movie-info-service'].movie_infos[movie_id] = MovieInfo(
+        movie_id=movie_id, title='movie_title_%d' % i, casts=casts, plot_id=i,
+        thumbnail_ids=[], photo_ids=[], video_ids=[], avg_rating=5.0, num_rating=1)
+
+  def compose(i):
+    req_id = rng.getrandbits(63)
+    text = ''.join(rng.choices(string.ascii_lowercase + string.digits, k=256))
+    calls = [
+        ('user-service', 'UploadUserWithUserId', req_id, rng.randrange(num_users), {}),
+        ('movie-id-service', 'UploadMovieId', req_id,
+         'movie_title_%d' % rng.randrange(num_movies), rng.randint(0, 10), {}),
+        ('text-service', 'UploadText', req_id, text, {}),
+        ('unique-id-service', 'UploadUniqueId', req_id, {}),
+    ]
+    for future in [cluster.executor.submit(cluster.call, *args) for args in calls]:
+      future.result()
+
+  def read(i):
+    with cluster.client('page-service') as client:
+      client.ReadPage(i, 'movie_id_%d' % rng.randrange(num_movies), 0, 10, {})
+
+  for label, call in (('ComposeReview', compose), ('ReadPage', read)):
+    histogram = LatencyHistogram()
+    lock = threading.Lock()
+
+    def timed(i):
+      start = time.monotonic()
+      call(i)
+      with lock:
+        histogram.record(time.monotonic() - start)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as pool:
+      list(pool.map(timed, range(requests)))
+    elapsed = time.monotonic() - start
+    print('{:<14} {:>9.0f} req/s  p50 {:>7.2f} ms  p99 {:>7.2f} ms'.format(
+        label, requests / elapsed, histogram.percentile(50) * 1e3,
+        histogram.percentile(99) * 1e3))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--http-port', type=int, default=HTTP_PORT)
+  parser.add_argument('--service-time', action='append', default=[],
+                      metavar='[SERVICE=]MS',
+                      help='mean service time per handler call in ms, e.g. 0.5, or '
+                           'page-service=2 for one service')
+  parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='constant')
+  parser.add_argument('--sigma', type=float, default=0.5,
+                      help='shape of the lognormal distribution, whose median is the '
+                           'service time')
+  parser.add_argument('--bench', type=int, default=0, metavar='REQUESTS',
+                      help='run a ComposeReview/ReadPage benchmark and exit')
+  parser.add_argument('--users', type=int, default=1000)
+  parser.add_argument('--movies', type=int, default=1000)
+  parser.add_argument('--concurrency', type=int, default=8)
+  parser.add_argument('--server-mode', choices=('threads', 'asyncio'), default='threads',
+                      help='thriftkit server mode; asyncio runs handlers, and so their '
+                           'delays, one at a time per service')
+  parser.add_argument('--report-interval', type=float, default=None,
+                      help='print per-method QPS and latency every this many seconds')
+  parser.add_argument('--metrics-port', type=int, default=None,
+                      help='serve per-method decode/handler/encode histograms at '
+                           'http://HOST:PORT/metrics')
+  parser.add_argument('--trace', metavar='PATH', default=None,
+                      help='record client and server spans to this binary log')
+  args = parser.parse_args()
+
+  metrics = None
+  if args.metrics_port:
+    metrics = ProcessorMetrics()
+    metrics.serve(args.host, args.metrics_port)
+  tracer = Tracer(args.trace) if args.trace else None
+
+  service_time, service_times = 0.0, {}
+  for spec in args.service_time:
+    name, _, ms = spec.rpartition('=')
+    if name:
+      service_times[name] = float(ms) / 1000.0
+    else:
+      service_time = float(ms) / 1000.0
+  cluster = StandInCluster(args.host, service_time=service_time,
+                           distribution=args.distribution, service_times=service_times,
+                           sigma=args.sigma, server_mode=args.server_mode,
+                           report_interval=args.report_interval, metrics=metrics,
+                           tracer=tracer).start()
+  if args.bench:
+    bench(cluster, args.users, args.movies, args.bench, args.concurrency)
+    cluster.stop()
+    return
+  front = WrkApiFront(cluster, args.host, args.http_port).start()
+  for name in SERVICES:
+    print('{:<24} {}:{}'.format(name, args.host, cluster.ports[name]))
+  print('{:<24} http://{}:{}/wrk2-api/'.format('nginx-web-server', args.host, args.http_port))
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    front.stop()
+    cluster.stop()
+
+
+if __name__ == '__main__':
+  main()
@@ -1,5 +1,6 @@
 import sys
 sys.path.append('../gen-py')
+sys.path.append('../..')
 
 from media_service import UserService
 from media_service import TextService
@@ -12,14 +13,20 @@ from thrift import Thrift
 from thrift.transport import TSocket
 from thrift.transport import TTransport
 from thrift.protocol import TBinaryProtocol
+from thriftkit.aio import connect
 
+import asyncio
 import random
 import string
-from multiprocessing import Process
+import time
+
+# Pass 127.0.0.1 to run against standin_cluster.py.
+HOST = sys.argv[1] if len(sys.argv) > 1 else "ath-8.ece.cornell.edu"
+NUM_REVIEWS = 100
 
 
 def register_movies():
-  movie_id_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10002)
+  movie_id_socket = TSocket.TSocket(HOST, 10002)
   movie_id_transport = TTransport.TFramedTransport(movie_id_socket)
   movie_id_protocol = TBinaryProtocol.TBinaryProtocol(movie_id_transport)
   movie_id_client = MovieIdService.Client(movie_id_protocol)
@@ -33,7 +40,7 @@ def register_movies():
   movie_id_transport.close()
 
 def register_users():
-  user_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10005)
+  user_socket = TSocket.TSocket(HOST, 10005)
   user_transport = TTransport.TFramedTransport(user_socket)
   user_protocol = TBinaryProtocol.TBinaryProtocol(user_transport)
   user_client = UserService.Client(user_protocol)
@@ -47,7 +54,7 @@ def register_users():
     user_client.RegisterUserWithId(req_id, first_name, last_name, username, password, i, {})
   user_transport.close()
 
-def worker():
+async def worker(num_reviews):
   # text_socket = TSocket.TSocket("text-service", 9090)
   # text_transport = TTransport.TFramedTransport(text_socket)
   # text_protocol = TBinaryProtocol.TBinaryProtocol(text_transport)
@@ -73,32 +80,12 @@ def worker():
   # user_protocol = TBinaryProtocol.TBinaryProtocol(user_transport)
   # user_client = UserService.Client(user_protocol)
 
-  text_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10003)
-  text_transport = TTransport.TFramedTransport(text_socket)
-  text_protocol = TBinaryProtocol.TBinaryProtocol(text_transport)
-  text_client = TextService.Client(text_protocol)
-
-  unique_id_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10001)
-  unique_id_transport = TTransport.TFramedTransport(unique_id_socket)
-  unique_id_protocol = TBinaryProtocol.TBinaryProtocol(unique_id_transport)
-  unique_id_client = UniqueIdService.Client(unique_id_protocol)
+  text_client = await connect(TextService, HOST, 10003)
+  unique_id_client = await connect(UniqueIdService, HOST, 10001)
+  movie_id_client = await connect(MovieIdService, HOST, 10002)
+  user_client = await connect(UserService, HOST, 10005)
 
-  movie_id_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10002)
-  movie_id_transport = TTransport.TFramedTransport(movie_id_socket)
-  movie_id_protocol = TBinaryProtocol.TBinaryProtocol(movie_id_transport)
-  movie_id_client = MovieIdService.Client(movie_id_protocol)
-
-  user_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10005)
-  user_transport = TTransport.TFramedTransport(user_socket)
-  user_protocol = TBinaryProtocol.TBinaryProtocol(user_transport)
-  user_client = UserService.Client(user_protocol)
-
-  text_transport.open()
-  unique_id_transport.open()
-  movie_id_transport.open()
-  user_transport.open()
-
-  for i in range(100):
+  async def compose_review():
     req_id = random.getrandbits(63)
     user_id = random.randint(0, 99)
     movie_num = random.randint(0, 99)
@@ -106,28 +93,29 @@ def worker():
     text = ''.join(random.choices(string.ascii_lowercase + string.digits, k=256))
     title = "movie_title_" + str(movie_num)
 
-    unique_id_client.UploadUniqueId(req_id, {})
-    user_client.UploadUserWithUserId(req_id, user_id, {})
-    text_client.UploadText(req_id, text, {})
-    movie_id_client.UploadMovieId(req_id, title, rating, {})
+    await asyncio.gather(
+        unique_id_client.UploadUniqueId(req_id, {}),
+        user_client.UploadUserWithUserId(req_id, user_id, {}),
+        text_client.UploadText(req_id, text, {}),
+        movie_id_client.UploadMovieId(req_id, title, rating, {}))
 
-  text_transport.close()
-  unique_id_transport.close()
-  movie_id_transport.close()
-  user_transport.close()
+  # All reviews are in flight at once, multiplexed over one connection per
+  # service.
+  await asyncio.gather(*[compose_review() for _ in range(num_reviews)])
+
+  await text_client.close()
+  await unique_id_client.close()
+  await movie_id_client.close()
+  await user_client.close()
 
 def main():
   register_movies()
   register_users()
-  processes = []
-  for i in range(1):
-    p = Process(target=worker)
-    processes.append(p)
-    p.start()
-
-  for i in range(1):
-    processes[i].join()
-  print("finished")
+  start = time.monotonic()
+  asyncio.run(worker(NUM_REVIEWS))
+  elapsed = time.monotonic() - start
+  print("finished: {} reviews in {:.2f}s, {:.1f} reviews/s".format(
+      NUM_REVIEWS, elapsed, NUM_REVIEWS / elapsed))
 
 if __name__ == '__main__':
   try:
@@ -0,0 +1,116 @@
+import bisect
+import json
+import os
+import time
+
+
+class IndexRanges:
+  """A set of non-negative integers stored as sorted, merged [start, end) ranges."""
+
+  def __init__(self, ranges=()):
+    self._starts = []
+    self._ends = []
+    for start, end in ranges:
+      self.add_range(start, end)
+
+  def add(self, index):
+    self.add_range(index, index + 1)
+
+  def add_range(self, start, end):
+    if start >= end:
+      return
+    lo = bisect.bisect_left(self._ends, start)
+    hi = bisect.bisect_right(self._starts, end)
+    if lo < hi:
+      start = min(start, self._starts[lo])
+      end = max(end, self._ends[hi - 1])
+    self._starts[lo:hi] = [start]
+    self._ends[lo:hi] = [end]
+
+  def __contains__(self, index):
+    i = bisect.bisect_right(self._starts, index) - 1
+    return i >= 0 and index < self._ends[i]
+
+  def __len__(self):
+    return sum(end - start for start, end in self)
+
+  def __iter__(self):
+    return zip(self._starts, self._ends)
+
+  def __bool__(self):
+    return bool(self._starts)
+
+
+class Checkpoint:
+  """Append-only journal of the job indices each seeding phase has completed.
+
+  The first line holds metadata describing the run; every later line is
+  {"phase": ..., "ranges": [[start, end], ...]} for the indices completed
+  since the previous flush. Loading takes the union of all lines, so a
+  journal cut short by a crash only loses its partial lines.
+
+  Each line goes out in a single write() on an O_APPEND descriptor, so
+  several processes may append to the same journal.
+  """
+
+  def __init__(self, path, meta, resume=False, interval=5.0):
+    self.path = path
+    self.meta = dict(meta)
+    self.interval = interval
+    self._done = {}
+    self._pending = {}
+    flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+    if resume and os.path.exists(path):
+      torn = self._load()
+      self._fd = os.open(path, flags)
+      if torn:
+        # End the line a crash cut short, or the next entry would extend it.
+        os.write(self._fd, b'\n')
+    else:
+      self._fd = os.open(path, flags | os.O_TRUNC)
+      self._write({'meta': self.meta})
+    self._last_flush = time.monotonic()
+
+  def _write(self, entry):
+    os.write(self._fd, (json.dumps(entry) + '\n').encode())
+
+  def _load(self):
+    with open(self.path, 'r') as f:
+      torn = False
+      for line in f:
+        torn = not line.endswith('\n')
+        try:
+          entry = json.loads(line)
+        except ValueError:
+          continue
+        if 'meta' in entry:
+          self.meta.update(entry['meta'])
+        else:
+          done = self._done.setdefault(entry['phase'], IndexRanges())
+          for start, end in entry['ranges']:
+            done.add_range(start, end)
+    return torn
+
+  def completed(self, phase):
+    return self._done.setdefault(phase, IndexRanges())
+
+  def is_done(self, phase, index):
+    return index in self.completed(phase)
+
+  def mark_done(self, phase, index):
+    self.completed(phase).add(index)
+    self._pending.setdefault(phase, IndexRanges()).add(index)
+    if time.monotonic() - self._last_flush >= self.interval:
+      self.flush()
+
+  def flush(self):
+    for phase, ranges in self._pending.items():
+      if ranges:
+        self._write({'phase': phase, 'ranges': [list(r) for r in ranges]})
+    os.fsync(self._fd)
+    self._pending = {}
+    self._last_flush = time.monotonic()
+
+  def close(self):
+    self.flush()
+    os.close(self._fd)
@@ -1,69 +1,61 @@
 import aiohttp
 import asyncio
+import collections
+import concurrent.futures
 import os
-import string
+import time
 import random
 import argparse
 
+from checkpoint import Checkpoint
+from latency import RequestStats
+from post_generator import PostGenerator
+from social_graph import csr_is_fresh, open_graph_edges
+
+
+FOLLOW_PATH = '/wrk2-api/user/follow'
+REGISTER_PATH = '/wrk2-api/user/register'
+COMPOSE_PATH = '/wrk2-api/post/compose'
+
 
 async def upload_follow(session, addr, user_0, user_1):
   payload = {'user_name': 'username_' + user_0,
              'followee_name': 'username_' + user_1}
-  async with session.post(addr + '/wrk2-api/user/follow', data=payload) as resp:
-    return await resp.text()
+  async with session.post(addr + FOLLOW_PATH, data=payload) as resp:
+    return resp.status, await resp.text()
 
 
 async def upload_register(session, addr, user):
   payload = {'first_name': 'first_name_' + user, 'last_name': 'last_name_' + user,
              'username': 'username_' + user, 'password': 'password_' + user, 'user_id': user}
-  async with session.post(addr + '/wrk2-api/user/register', data=payload) as resp:
-    return await resp.text()
-
-
-async def upload_compose(session, addr, user_id, num_users):
-  text = ''.join(random.choices(string.ascii_letters + string.digits, k=256))
-  # user mentions
-  for _ in range(random.randint(0, 5)):
-    text += ' @username_' + str(random.randint(0, num_users))
-  # urls
-  for _ in range(random.randint(0, 5)):
-    text += ' http://' + \
-        ''.join(random.choices(string.ascii_lowercase + string.digits, k=64))
-  # media
-  media_ids = []
-  media_types = []
-  for _ in range(random.randint(0, 5)):
-    media_ids.append('\"' + ''.join(random.choices(string.digits, k=18)) + '\"')
-    media_types.append('\"png\"')
+  async with session.post(addr + REGISTER_PATH, data=payload) as resp:
+    return resp.status, await resp.text()
+
+
+async def upload_compose(session, addr, user_id, posts):
+  text, media_ids, media_types = posts.next_post()
   payload = {'username': 'username_' + str(user_id),
              'user_id': str(user_id),
              'text': text,
-             'media_ids': '[' + ','.join(media_ids) + ']',
-             'media_types': '[' + ','.join(media_types) + ']',
+             'media_ids': media_ids,
+             'media_types': media_types,
              'post_type': '0'}
-  async with session.post(addr + '/wrk2-api/post/compose', data=payload) as resp:
-    return await resp.text()
+  async with session.post(addr + COMPOSE_PATH, data=payload) as resp:
+    return resp.status, await resp.text()
 
 
-def getNumNodes(file):
-  return int(file.readline())
+ENDPOINTS = {
+    upload_follow: FOLLOW_PATH,
+    upload_register: REGISTER_PATH,
+    upload_compose: COMPOSE_PATH,
+}
 
 
-def getEdges(file):
-  edges = []
-  lines = file.readlines()
-  for line in lines:
-    edges.append(line.split())
-  return edges
+def getNumNodes(file):
+  return int(file.readline())
 
 
-def printResults(results):
-  result_type_count = {}
-  for result in results:
-    try:
-      result_type_count[result] += 1
-    except KeyError:
-      result_type_count[result] = 1
+def printResults(result_type_count):
   for result_type, count in result_type_count.items():
     if result_type == '' or result_type.startswith('Success'):
       print('Succeeded:', count)
@@ -73,58 +65,195 @@ def printResults(results):
       print('Failed:', count, 'Error:', result_type.strip())
 
 
-async def register(addr, nodes, limit=200):
-  tasks = []
-  conn = aiohttp.TCPConnector(limit=limit)
-  async with aiohttp.ClientSession(connector=conn) as session:
-    print('Registering Users...')
-    for i in range(nodes):
-      task = asyncio.ensure_future(upload_register(session, addr, str(i)))
-      tasks.append(task)
-      if i % limit == 0:
-        _ = await asyncio.gather(*tasks)
-        print(i)
-    results = await asyncio.gather(*tasks)
-    printResults(results)
-
-
-async def follow(addr, edges, limit=200):
-  idx = 0
-  tasks = []
-  conn = aiohttp.TCPConnector(limit=limit)
-  async with aiohttp.ClientSession(connector=conn) as session:
-    print('Adding follows...')
-    for edge in edges:
-      task = asyncio.ensure_future(
-          upload_follow(session, addr, edge[0], edge[1]))
-      tasks.append(task)
-      task = asyncio.ensure_future(
-          upload_follow(session, addr, edge[1], edge[0]))
-      tasks.append(task)
-      idx += 1
-      if idx % limit == 0:
-        _ = await asyncio.gather(*tasks)
-        print(idx)
-    results = await asyncio.gather(*tasks)
-    printResults(results)
-
-
-async def compose(addr, nodes, limit=200):
-  idx = 0
-  tasks = []
+class Progress:
+  """Prints the number of finished requests and the rate over the last interval."""
+
+  def __init__(self, prefix='', interval=5.0):
+    self.prefix = prefix
+    self.interval = interval
+    self.done = 0
+    self._start = self._last_time = time.monotonic()
+    self._last_done = 0
+
+  def update(self):
+    self.done += 1
+    now = time.monotonic()
+    if now - self._last_time >= self.interval:
+      rate = (self.done - self._last_done) / (now - self._last_time)
+      print('{}{} requests, {:.1f} req/s'.format(self.prefix, self.done, rate))
+      self._last_time = now
+      self._last_done = self.done
+
+  def finish(self):
+    elapsed = time.monotonic() - self._start
+    rate = self.done / elapsed if elapsed > 0 else 0.0
+    print('{}{} requests in {:.1f}s, {:.1f} req/s'.format(self.prefix, self.done, elapsed, rate))
+
+
+def is_duplicate(text):
+  # A retried request whose first attempt did reach the backend.
+  return 'already existed' in text
+
+
+async def run_jobs(addr, jobs, limit, phase=None, checkpoint=None, retries=0, shard=None,
+                   stats=None):
+  """Runs (upload_fn, args) jobs with at most `limit` requests in flight.
+
+  Jobs are pulled lazily from the iterable through a bounded queue and
+  results are folded into a count per response text as they complete, so
+  memory does not grow with the number of jobs.
+
+  Jobs are numbered in the order `jobs` yields them. With a `checkpoint`,
+  jobs already recorded as done for `phase` are skipped and finished jobs
+  are recorded. Requests that raise, connection errors included, and 5xx
+  responses are put on a retry queue that is drained, with back-off, after
+  the main pass, up to `retries` times.
+
+  With `shard` = (k, n), only jobs whose index is k modulo n are run.
+  Every attempt's latency is recorded per endpoint into `stats`.
+  """
+  result_type_count = collections.Counter()
+  progress = Progress('[worker {}] '.format(shard[0]) if shard else '')
+  failed = []
+
+  async def worker(session, queue, retry, final):
+    while True:
+      job = await queue.get()
+      if job is None:
+        return
+      index, (upload, args) = job
+      start = time.monotonic()
+      try:
+        status, result = await upload(session, addr, *args)
+      except Exception as e:
+        # Connection errors, timeouts and anything else one request raises,
+        # such as a reply that is not valid UTF-8, fail only that request.
+        status, result = 599, '{}: {}'.format(type(e).__name__, e)
+      if stats is not None:
+        stats.record(ENDPOINTS[upload], time.monotonic() - start)
+      if retry and is_duplicate(result):
+        status, result = 200, 'Success (retried)'
+      if not final and status >= 500:
+        failed.append(job)
+        continue
+      result_type_count[result] += 1
+      progress.update()
+      if checkpoint is not None and status < 400:
+        checkpoint.mark_done(phase, index)
+
+  async def run(session, queued, retry, final):
+    queue = asyncio.Queue(maxsize=2 * limit)
+    workers = [asyncio.ensure_future(worker(session, queue, retry, final)) for _ in range(limit)]
+
+    async def produce():
+      for job in queued:
+        await queue.put(job)
+      for _ in workers:
+        await queue.put(None)
+
+    # Gathered together, so a worker that dies stops the run with its error
+    # instead of leaving the producer blocked on a full queue.
+    tasks = workers + [asyncio.ensure_future(produce())]
+    try:
+      await asyncio.gather(*tasks)
+    finally:
+      for task in tasks:
+        task.cancel()
+
+  def numbered(jobs):
+    k, n = shard or (0, 1)
+    for index, job in enumerate(jobs):
+      if index % n != k:
+        continue
+      if checkpoint is None or not checkpoint.is_done(phase, index):
+        yield index, job
+
   conn = aiohttp.TCPConnector(limit=limit)
   async with aiohttp.ClientSession(connector=conn) as session:
-    print('Composing posts...')
-    for i in range(nodes):
-      for _ in range(random.randint(0, 20)):  # up to 20 posts per user, average 10
-        task = asyncio.ensure_future(upload_compose(session, addr, i+1, nodes))
-        tasks.append(task)
-        idx += 1
-        if idx % limit == 0:
-          _ = await asyncio.gather(*tasks)
-          print(idx)
-    results = await asyncio.gather(*tasks)
-    printResults(results)
+    await run(session, numbered(jobs), False, retries == 0)
+    for attempt in range(retries):
+      if not failed:
+        break
+      queued, failed[:] = failed[:], []
+      print('{}Retrying {} failed requests...'.format(progress.prefix, len(queued)))
+      await asyncio.sleep(min(2 ** attempt, 30))
+      await run(session, queued, True, attempt == retries - 1)
+  if checkpoint is not None:
+    checkpoint.flush()
+  progress.finish()
+  return result_type_count
+
+
+def register_jobs(nodes):
+  for i in range(nodes):
+    yield upload_register, (str(i),)
+
+
+def follow_jobs(edges):
+  for user_0, user_1 in edges:
+    user_0, user_1 = str(user_0), str(user_1)
+    yield upload_follow, (user_0, user_1)
+    yield upload_follow, (user_1, user_0)
+
+
+def compose_jobs(nodes, posts, seed=1):
+  # Post counts come from their own generator so that job numbering is the
+  # same on every run, which checkpoint resumption relies on.
+  rng = random.Random(seed)
+  for i in range(nodes):
+    for _ in range(rng.randint(0, 20)):  # up to 20 posts per user, average 10
+      yield upload_compose, (i+1, posts)
+
+
+async def register(addr, nodes, limit=200, **kwargs):
+  print('Registering Users...')
+  printResults(await run_jobs(addr, register_jobs(nodes), limit, 'register', **kwargs))
+
+
+async def follow(addr, edges, limit=200, **kwargs):
+  print('Adding follows...')
+  printResults(await run_jobs(addr, follow_jobs(edges), limit, 'follow', **kwargs))
+
+
+async def compose(addr, nodes, limit=200, **kwargs):
+  print('Composing posts...')
+  posts = PostGenerator(nodes, seed=random.getrandbits(32))
+  printResults(await run_jobs(addr, compose_jobs(nodes, posts), limit, 'compose', **kwargs))
+
+
+def run_shard(phase, addr, nodes, edges_path, use_csr, limit, shard,
+              checkpoint_path=None, retries=0, seed=1):
+  """Runs one shard of a phase in a worker process, with its own event loop
+  and ClientSession, and returns its result counts and RequestStats."""
+  random.seed(seed + shard[0])
+  if phase == 'register':
+    jobs = register_jobs(nodes)
+  elif phase == 'follow':
+    jobs = follow_jobs(open_graph_edges(edges_path, use_csr=use_csr))
+  else:
+    jobs = compose_jobs(nodes, PostGenerator(nodes, seed=seed + shard[0]))
+  checkpoint = Checkpoint(checkpoint_path, {}, resume=True) if checkpoint_path else None
+  stats = RequestStats()
+  loop = asyncio.new_event_loop()
+  try:
+    result_type_count = loop.run_until_complete(
+        run_jobs(addr, jobs, limit, phase, checkpoint, retries, shard, stats))
+    return result_type_count, stats
+  finally:
+    if checkpoint is not None:
+      checkpoint.close()
+    loop.close()
+
+
+def run_sharded(executor, workers, stats, phase, *args, **kwargs):
+  result_type_count = collections.Counter()
+  futures = [executor.submit(run_shard, phase, *args, (k, workers), **kwargs)
+             for k in range(workers)]
+  for future in futures:
+    shard_count, shard_stats = future.result()
+    result_type_count.update(shard_count)
+    stats.merge(shard_stats)
+  printResults(result_type_count)
 
 
 if __name__ == '__main__':
@@ -139,22 +268,63 @@ if __name__ == '__main__':
   parser.add_argument('--compose', action='store_true',
                       help='intialize with up to 20 posts per user', default=False)
   parser.add_argument('--limit', type=int, help='total number simultaneous connections', default=200)
+  parser.add_argument('--workers', type=int, help='number of worker processes sharing the load', default=1)
+  parser.add_argument('--retries', type=int, help='rounds of retries for failed or 5xx requests', default=3)
+  parser.add_argument('--checkpoint', help='checkpoint journal path (default: datasets/social-graph/<graph>/<graph>.checkpoint)')
+  parser.add_argument('--resume', action='store_true',
+                      help='skip work recorded as done in the checkpoint journal', default=False)
+  parser.add_argument('--stats-json', help='also write latency histograms and throughput to this JSON file')
   args = parser.parse_args()
 
-  with open(os.path.join('datasets/social-graph', args.graph, f'{args.graph}.nodes'), 'r') as f:
+  graph_dir = os.path.join('datasets/social-graph', args.graph)
+  with open(os.path.join(graph_dir, f'{args.graph}.nodes'), 'r') as f:
     nodes = getNumNodes(f)
-  with open(os.path.join('datasets/social-graph', args.graph, f'{args.graph}.edges'), 'r') as f:
-    edges = getEdges(f)
+  edges_path = os.path.join(graph_dir, f'{args.graph}.edges')
 
   random.seed(1)   # deterministic random numbers
 
+  checkpoint_path = args.checkpoint or os.path.join(graph_dir, f'{args.graph}.checkpoint')
+  checkpoint = Checkpoint(checkpoint_path,
+                          {'graph': args.graph, 'nodes': nodes, 'csr': csr_is_fresh(edges_path)},
+                          resume=args.resume)
+  if args.resume:
+    print('Resuming:', ', '.join('{} {} done'.format(phase, len(checkpoint.completed(phase)))
+                                 for phase in ('register', 'follow', 'compose')))
+  # Resumed runs must number follow jobs the same way as the original run.
+  use_csr = checkpoint.meta['csr']
+
   addr = 'http://{}:{}'.format(args.ip, args.port)
   limit = args.limit
-  loop = asyncio.new_event_loop()
-  future = asyncio.ensure_future(register(addr, nodes, limit), loop=loop)
-  loop.run_until_complete(future)
-  future = asyncio.ensure_future(follow(addr, edges, limit), loop=loop)
-  loop.run_until_complete(future)
-  if args.compose:
-    future = asyncio.ensure_future(compose(addr, nodes, limit), loop=loop)
-    loop.run_until_complete(future)
+  stats = RequestStats()
+  if args.workers > 1:
+    # Workers append to the same journal through their own descriptors.
+    checkpoint.close()
+    limit = max(1, limit // args.workers)
+    shard_args = (addr, nodes, edges_path, use_csr, limit)
+    kwargs = {'checkpoint_path': checkpoint_path, 'retries': args.retries}
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+      print('Registering Users...')
+      run_sharded(executor, args.workers, stats, 'register', *shard_args, **kwargs)
+      print('Adding follows...')
+      run_sharded(executor, args.workers, stats, 'follow', *shard_args, **kwargs)
+      if args.compose:
+        print('Composing posts...')
+        run_sharded(executor, args.workers, stats, 'compose', *shard_args, **kwargs)
+  else:
+    edges = open_graph_edges(edges_path, use_csr=use_csr)
+    kwargs = {'checkpoint': checkpoint, 'retries': args.retries, 'stats': stats}
+    loop = asyncio.new_event_loop()
+    try:
+      future = asyncio.ensure_future(register(addr, nodes, limit, **kwargs), loop=loop)
+      loop.run_until_complete(future)
+      future = asyncio.ensure_future(follow(addr, edges, limit, **kwargs), loop=loop)
+      loop.run_until_complete(future)
+      if args.compose:
+        future = asyncio.ensure_future(compose(addr, nodes, limit, **kwargs), loop=loop)
+        loop.run_until_complete(future)
+    finally:
+      checkpoint.close()
+
+  stats.print_report()
+  if args.stats_json:
+    stats.dump_json(args.stats_json)
@@ -0,0 +1,156 @@
+"""Log-linear latency histograms, and per-endpoint request stats built on them.
+
+Latencies go in and come out in seconds. Internally they are counted in
+whole microseconds: exact below 2^SUB_BUCKET_BITS, then
+2^(SUB_BUCKET_BITS-1) buckets per power of two, which bounds the relative
+error of any reported value by 1/64. Histograms are not thread-safe; each
+user either holds a lock or keeps one histogram per thread and merges.
+
+This is the only copy. The seeding loader image ships just this scripts
+directory, so the module lives here. mediaMicroservices/scripts/latency.py
+and thriftkit/histogram.py are symlinks to it.
+"""
+
+import json
+import time
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+def bucket_index(value):
+  if value < SUB_BUCKET_COUNT:
+    return value
+  shift = value.bit_length() - SUB_BUCKET_BITS
+  return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + (value >> shift) - SUB_BUCKET_HALF
+
+
+def bucket_bounds(index):
+  if index < SUB_BUCKET_COUNT:
+    return index, index
+  shift, sub = divmod(index - SUB_BUCKET_COUNT, SUB_BUCKET_HALF)
+  shift += 1
+  low = (sub + SUB_BUCKET_HALF) << shift
+  return low, low + (1 << shift) - 1
+
+
+class LatencyHistogram:
+  """HDR-style histogram of latencies with bounded relative error."""
+
+  def __init__(self):
+    self.counts = []
+    self.count = 0
+    self._total_us = 0
+    self._min_us = None
+    self._max_us = 0
+
+  def record(self, seconds):
+    value = max(0, int(seconds * 1e6))
+    index = bucket_index(value)
+    if index >= len(self.counts):
+      self.counts.extend([0] * (index + 1 - len(self.counts)))
+    self.counts[index] += 1
+    self.count += 1
+    self._total_us += value
+    if self._min_us is None or value < self._min_us:
+      self._min_us = value
+    if value > self._max_us:
+      self._max_us = value
+
+  def merge(self, other):
+    if len(other.counts) > len(self.counts):
+      self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+    for index, count in enumerate(other.counts):
+      self.counts[index] += count
+    self.count += other.count
+    self._total_us += other._total_us
+    if other._min_us is not None:
+      self._min_us = other._min_us if self._min_us is None else min(self._min_us,
+                                                                     other._min_us)
+    self._max_us = max(self._max_us, other._max_us)
+
+  @property
+  def min(self):
+    return (self._min_us or 0) / 1e6
+
+  @property
+  def max(self):
+    return self._max_us / 1e6
+
+  def percentile(self, percentile):
+    """Returns the latency in seconds at `percentile` (0-100)."""
+    if self.count == 0:
+      return 0.0
+    rank = max(1, int(percentile / 100.0 * self.count + 0.5))
+    seen = 0
+    for index, count in enumerate(self.counts):
+      seen += count
+      if seen >= rank:
+        return min(bucket_bounds(index)[1], self._max_us) / 1e6
+    return self.max
+
+  def mean(self):
+    return self._total_us / self.count / 1e6 if self.count else 0.0
+
+  def to_dict(self):
+    return {
+        'count': self.count,
+        'min_s': self.min,
+        'max_s': self.max,
+        'mean_s': self.mean(),
+        'percentiles_s': {str(p): self.percentile(p) for p in PERCENTILES},
+        'buckets': [[bucket_bounds(i)[0] / 1e6, c] for i, c in enumerate(self.counts) if c],
+    }
+
+
+class RequestStats:
+  """Per-endpoint latency histograms and a per-second completion timeline."""
+
+  def __init__(self):
+    self.histograms = {}
+    self.timeline = {}
+
+  def record(self, endpoint, seconds):
+    try:
+      histogram = self.histograms[endpoint]
+    except KeyError:
+      histogram = self.histograms[endpoint] = LatencyHistogram()
+    histogram.record(seconds)
+    second = int(time.time())
+    self.timeline[second] = self.timeline.get(second, 0) + 1
+
+  def merge(self, other):
+    for endpoint, histogram in other.histograms.items():
+      self.histograms.setdefault(endpoint, LatencyHistogram()).merge(histogram)
+    for second, count in other.timeline.items():
+      self.timeline[second] = self.timeline.get(second, 0) + count
+
+  def throughput(self):
+    """Returns completions per second, from the first second with any."""
+    if not self.timeline:
+      return []
+    first, last = min(self.timeline), max(self.timeline)
+    return [self.timeline.get(second, 0) for second in range(first, last + 1)]
+
+  def print_report(self):
+    print('{:<36} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'Latency (ms)', 'count', 'p50', 'p90', 'p99', 'p99.9', 'max'))
+    for endpoint, histogram in sorted(self.histograms.items()):
+      print('{:<36} {:>9}'.format(endpoint, histogram.count) + ''.join(
+          ' {:>9.2f}'.format(seconds * 1e3) for seconds in
+          [histogram.percentile(p) for p in PERCENTILES] + [histogram.max]))
+    throughput = self.throughput()
+    print('Throughput (req/s, one value per second):')
+    for i in range(0, len(throughput), 10):
+      print('  {:>5}s: {}'.format(i, ' '.join('{:>6}'.format(c) for c in throughput[i:i + 10])))
+
+  def dump_json(self, path):
+    with open(path, 'w') as f:
+      json.dump({
+          'endpoints': {endpoint: histogram.to_dict()
+                        for endpoint, histogram in self.histograms.items()},
+          'throughput': self.throughput(),
+      }, f, indent=2)
@@ -0,0 +1,90 @@
+import random
+import string
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+TEXT_ALPHABET = string.ascii_letters + string.digits
+URL_ALPHABET = string.ascii_lowercase + string.digits
+TEXT_LENGTH = 256
+URL_LENGTH = 64
+MEDIA_ID_LENGTH = 18
+MAX_ITEMS = 5  # mentions, urls and media per post
+
+
+class PostGenerator:
+  """Pre-produces synthetic compose-post contents in bulk.
+
+  Every post has 256 random alphanumeric characters followed by 0-5
+  mentions of users in [0, num_users] and 0-5 random 64-character urls,
+  plus 0-5 media ids of 18 digits. With NumPy, a whole batch is drawn at
+  once from random byte tables mapped onto the alphabets; without it, posts
+  are drawn one by one with the random module. Either way the sequence is
+  fully determined by `seed`.
+  """
+
+  def __init__(self, num_users, seed=1, batch_size=1024):
+    self.num_users = num_users
+    self.batch_size = batch_size
+    self._batch = []
+    if np is not None:
+      self._rng = np.random.default_rng(seed)
+      self._text_table = np.frombuffer(TEXT_ALPHABET.encode(), dtype=np.uint8)
+      self._url_table = np.frombuffer(URL_ALPHABET.encode(), dtype=np.uint8)
+      self._digit_table = np.frombuffer(string.digits.encode(), dtype=np.uint8)
+    else:
+      self._rng = random.Random(seed)
+
+  def next_post(self):
+    """Returns (text, media_ids, media_types) with the media lists JSON-encoded."""
+    if not self._batch:
+      self._batch = self._generate()
+      self._batch.reverse()
+    return self._batch.pop()
+
+  def _generate(self):
+    if np is None:
+      return [self._generate_one() for _ in range(self.batch_size)]
+    rng, n = self._rng, self.batch_size
+    texts = self._strings(self._text_table, n, TEXT_LENGTH)
+    counts = rng.integers(0, MAX_ITEMS + 1, size=(3, n))
+    mentions = rng.integers(0, self.num_users + 1, size=int(counts[0].sum())).tolist()
+    urls = self._strings(self._url_table, int(counts[1].sum()), URL_LENGTH)
+    media = self._strings(self._digit_table, int(counts[2].sum()), MEDIA_ID_LENGTH)
+
+    posts = []
+    m = u = k = 0
+    for i, (num_mentions, num_urls, num_media) in enumerate(counts.T.tolist()):
+      parts = [texts[i]]
+      parts.extend(' @username_' + str(user) for user in mentions[m:m + num_mentions])
+      parts.extend(' http://' + url for url in urls[u:u + num_urls])
+      media_ids = ['"' + media_id + '"' for media_id in media[k:k + num_media]]
+      posts.append((''.join(parts), '[' + ','.join(media_ids) + ']',
+                    '[' + ','.join(['"png"'] * num_media) + ']'))
+      m, u, k = m + num_mentions, u + num_urls, k + num_media
+    return posts
+
+  def _strings(self, table, count, length):
+    # One draw and one decode for the whole batch, then slice per string.
+    idx = self._rng.integers(0, len(table), size=count * length, dtype=np.uint8)
+    buf = table[idx].tobytes().decode('ascii')
+    return [buf[i:i + length] for i in range(0, count * length, length)]
+
+  def _generate_one(self):
+    rng = self._rng
+    text = ''.join(rng.choices(TEXT_ALPHABET, k=TEXT_LENGTH))
+    # user mentions
+    for _ in range(rng.randint(0, MAX_ITEMS)):
+      text += ' @username_' + str(rng.randint(0, self.num_users))
+    # urls
+    for _ in range(rng.randint(0, MAX_ITEMS)):
+      text += ' http://' + ''.join(rng.choices(URL_ALPHABET, k=URL_LENGTH))
+    # media
+    media_ids = []
+    media_types = []
+    for _ in range(rng.randint(0, MAX_ITEMS)):
+      media_ids.append('"' + ''.join(rng.choices(string.digits, k=MEDIA_ID_LENGTH)) + '"')
+      media_types.append('"png"')
+    return text, '[' + ','.join(media_ids) + ']', '[' + ','.join(media_types) + ']'
@@ -0,0 +1,189 @@
+import argparse
+import mmap
+import os
+import struct
+from array import array
+
+# Binary CSR layout, all little-endian:
+#   header:    magic (8s), num_nodes (Q), num_edges (Q)
+#   offsets:   num_nodes + 1 x uint64, neighbors of u are offsets[u]:offsets[u+1]
+#   neighbors: num_edges x uint32
+CSR_MAGIC = b'DSBCSR1\0'
+CSR_HEADER = struct.Struct('<8sQQ')
+
+
+def iter_edge_batches(path, chunk_size=1 << 20):
+  """Yields the edges of a `.edges` file as flat array('I') batches.
+
+  Each batch holds [src_0, dst_0, src_1, dst_1, ...]. The file is
+  memory-mapped and parsed `chunk_size` bytes at a time (extended to the
+  next line break), so only one chunk worth of Python objects is alive at
+  any point.
+  """
+  with open(path, 'rb') as f:
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+      return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      if hasattr(mm, 'madvise'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+      start = 0
+      while start < size:
+        end = mm.find(b'\n', min(start + chunk_size, size) - 1)
+        end = size if end < 0 else end + 1
+        batch = _parse_chunk(mm[start:end])
+        if batch:
+          yield batch
+        start = end
+
+
+def iter_edges(path, chunk_size=1 << 20):
+  """Yields (src, dst) integer pairs of a `.edges` file."""
+  for batch in iter_edge_batches(path, chunk_size):
+    it = iter(batch)
+    yield from zip(it, it)
+
+
+def _parse_chunk(chunk):
+  fields = chunk.split()
+  if (len(fields) == 2 * len(chunk.splitlines())
+      and b'%' not in chunk and b'#' not in chunk):
+    return array('I', map(int, fields))
+  # Slow path for comment lines, blank lines or extra (weight) columns.
+  batch = array('I')
+  for line in chunk.splitlines():
+    fields = line.split()
+    if len(fields) >= 2 and not line.startswith((b'%', b'#')):
+      batch.append(int(fields[0]))
+      batch.append(int(fields[1]))
+  return batch
+
+
+def csr_path(edges_path):
+  return os.path.splitext(edges_path)[0] + '.csr'
+
+
+def convert_to_csr(edges_path, out_path=None, num_nodes=0, chunk_size=1 << 20):
+  """Compiles a `.edges` file into the binary CSR format and returns its path.
+
+  Two streaming passes are made over the edge list: one to count out-degrees
+  and one to scatter neighbors into the memory-mapped output file. The node
+  count is `num_nodes` or one past the largest node id, whichever is larger.
+  """
+  out_path = out_path or csr_path(edges_path)
+  degrees = array('Q', bytes(8 * num_nodes))
+  num_edges = 0
+  for batch in iter_edge_batches(edges_path, chunk_size):
+    top = max(batch) + 1
+    if top > len(degrees):
+      degrees.frombytes(bytes(8 * (top - len(degrees))))
+    for src in batch[::2]:
+      degrees[src] += 1
+    num_edges += len(batch) // 2
+  num_nodes = len(degrees)
+
+  offsets = array('Q', [0])
+  total = 0
+  for degree in degrees:
+    total += degree
+    offsets.append(total)
+  del degrees
+
+  neighbors_start = CSR_HEADER.size + 8 * (num_nodes + 1)
+  tmp_path = out_path + '.tmp'
+  with open(tmp_path, 'wb+') as f:
+    f.write(CSR_HEADER.pack(CSR_MAGIC, num_nodes, num_edges))
+    f.write(offsets.tobytes())
+    f.truncate(neighbors_start + 4 * num_edges)
+    if num_edges:
+      with mmap.mmap(f.fileno(), 0) as mm:
+        neighbors = memoryview(mm)[neighbors_start:].cast('I')
+        cursor = offsets[:-1]
+        for batch in iter_edge_batches(edges_path, chunk_size):
+          for i in range(0, len(batch), 2):
+            src = batch[i]
+            neighbors[cursor[src]] = batch[i + 1]
+            cursor[src] += 1
+        neighbors.release()
+  os.replace(tmp_path, out_path)
+  return out_path
+
+
+class CSRGraph:
+  """Read-only, memory-mapped view of a graph in the binary CSR format.
+
+  Opening is O(1): nothing is parsed beyond the header, and pages of the
+  offset and neighbor arrays are faulted in only as they are accessed.
+  """
+
+  def __init__(self, path):
+    self._file = open(path, 'rb')
+    self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, self.num_nodes, self.num_edges = CSR_HEADER.unpack_from(self._mm)
+    if magic != CSR_MAGIC:
+      self.close()
+      raise ValueError('{} is not a CSR graph file'.format(path))
+    view = memoryview(self._mm)
+    neighbors_start = CSR_HEADER.size + 8 * (self.num_nodes + 1)
+    self.offsets = view[CSR_HEADER.size:neighbors_start].cast('Q')
+    self.neighbors = view[neighbors_start:].cast('I')
+    view.release()
+
+  def degree(self, node):
+    return self.offsets[node + 1] - self.offsets[node]
+
+  def neighbors_of(self, node):
+    return self.neighbors[self.offsets[node]:self.offsets[node + 1]]
+
+  def edges(self):
+    """Yields (src, dst) pairs grouped by source node."""
+    offsets, neighbors = self.offsets, self.neighbors
+    for src in range(self.num_nodes):
+      for i in range(offsets[src], offsets[src + 1]):
+        yield src, neighbors[i]
+
+  def close(self):
+    for view in ('offsets', 'neighbors'):
+      if hasattr(self, view):
+        getattr(self, view).release()
+    self._mm.close()
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def csr_is_fresh(edges_path):
+  path = csr_path(edges_path)
+  return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(edges_path)
+
+
+def open_graph_edges(edges_path, use_csr=None):
+  """Returns an iterator of (src, dst) pairs. By default the CSR file is
+  used when it is present and not older than the text edge list."""
+  if use_csr is None:
+    use_csr = csr_is_fresh(edges_path)
+  if use_csr:
+    path = csr_path(edges_path)
+    def csr_edges():
+      with CSRGraph(path) as graph:
+        yield from graph.edges()
+    return csr_edges()
+  return iter_edges(edges_path)
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser('Compile a social graph into the binary CSR format.')
+  parser.add_argument(
+      '--graph', help='Graph name. (`socfb-Reed98`, `ego-twitter`, or `soc-twitter-follows-mun`)', default='socfb-Reed98')
+  args = parser.parse_args()
+
+  graph_dir = os.path.join('datasets/social-graph', args.graph)
+  with open(os.path.join(graph_dir, f'{args.graph}.nodes'), 'r') as f:
+    nodes = int(f.readline())
+  out = convert_to_csr(os.path.join(graph_dir, f'{args.graph}.edges'), num_nodes=nodes)
+  with CSRGraph(out) as graph:
+    print('Wrote {}: {} nodes, {} edges'.format(out, graph.num_nodes, graph.num_edges))
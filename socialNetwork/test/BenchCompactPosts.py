@@ -0,0 +1,81 @@
+import sys
+sys.path.append('../gen-py')
+sys.path.append('../..')
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+import social_network.ttypes
+from social_network import PostStorageService
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+from thriftkit import binary_protocol
+from thriftkit.compact import compact
+
+# Compares the generated __dict__ structs with their __slots__ variant on a
+# dump of synthetic posts: construction, memory per post, and decoding the
+# dump as a ReadPosts reply.
+
+def make_posts(ttypes, num_posts):
+  posts = []
+  for i in range(num_posts):
+    posts.append(ttypes.Post(
+        post_id=i,
+        creator=ttypes.Creator(user_id=i % 962, username="username_" + str(i % 962)),
+        req_id=i,
+        text="post text " + str(i) + " @username_1 http://short-url/abcdefghij",
+        user_mentions=[ttypes.UserMention(user_id=1, username="username_1")],
+        media=[ttypes.Media(media_id=i, media_type="png")],
+        urls=[ttypes.Url(shortened_url="http://short-url/abcdefghij",
+                         expanded_url="http://expanded/" + str(i))],
+        timestamp=1600000000000 + i,
+        post_type=ttypes.PostType.POST))
+  return posts
+
+def measure(build):
+  gc.collect()
+  start = time.perf_counter()
+  result = build()
+  elapsed = time.perf_counter() - start
+  del result
+  gc.collect()
+  tracemalloc.start()
+  result = build()
+  retained = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  return elapsed, retained, result
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--posts', type=int, default=1000000)
+  args = parser.parse_args()
+
+  plain = social_network.ttypes
+  slots = compact(plain)
+  slots_service = compact(PostStorageService)
+
+  buf = TTransport.TMemoryBuffer()
+  PostStorageService.ReadPosts_result(success=make_posts(plain, args.posts)).write(
+      TBinaryProtocol.TBinaryProtocolAccelerated(buf))
+  dump = buf.getvalue()
+  print("dump: {} posts, {:.1f} MiB".format(args.posts, len(dump) / 2.0 ** 20))
+
+  def decode(service):
+    result = service.ReadPosts_result()
+    result.read(binary_protocol(TTransport.TMemoryBuffer(dump)))
+    return result.success
+
+  print("{:<22} {:>12} {:>14}".format("", "seconds", "bytes/post"))
+  for label, build in [
+      ("construct __dict__", lambda: make_posts(plain, args.posts)),
+      ("construct __slots__", lambda: make_posts(slots, args.posts)),
+      ("decode __dict__", lambda: decode(PostStorageService)),
+      ("decode __slots__", lambda: decode(slots_service))]:
+    elapsed, retained, posts = measure(build)
+    print("{:<22} {:>12.2f} {:>14.0f}".format(label, elapsed, retained / float(args.posts)))
+    del posts
+
+if __name__ == '__main__':
+  main()
@@ -1,5 +1,6 @@
 import sys
 sys.path.append('../gen-py')
+sys.path.append('../..')
 
 import uuid
 from social_network import TextService
@@ -9,9 +10,7 @@ from social_network import UserService
 from social_network.ttypes import PostType
 
 from thrift import Thrift
-from thrift.transport import TSocket
-from thrift.transport import TTransport
-from thrift.protocol import TBinaryProtocol
+from thriftkit import PoolManager
 
 def main():
   req_id = uuid.uuid4().int & 0x7FFFFFFFFFFFFFFF
@@ -22,37 +21,19 @@ def main():
   media_ids = [1, 2, 3, 4]
   creator = "username_0"
 
-  text_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10007)
-  text_transport = TTransport.TFramedTransport(text_socket)
-  text_protocol = TBinaryProtocol.TBinaryProtocol(text_transport)
-  text_client = TextService.Client(text_protocol)
-  text_transport.open()
-  text_client.UploadText(req_id, text, {})
-  text_transport.close()
-
-  media_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10006)
-  media_transport = TTransport.TFramedTransport(media_socket)
-  media_protocol = TBinaryProtocol.TBinaryProtocol(media_transport)
-  media_client = MediaService.Client(media_protocol)
-  media_transport.open()
-  print(media_client.UploadMedia(req_id, media_types, media_ids, {}))
-  media_transport.close()
-
-  user_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10005)
-  user_transport = TTransport.TFramedTransport(user_socket)
-  user_protocol = TBinaryProtocol.TBinaryProtocol(user_transport)
-  user_client = UserService.Client(user_protocol)
-  user_transport.open()
-  user_client.UploadCreatorWithUsername(req_id, creator, {})
-  user_transport.close()
-
-  post_id_socket = TSocket.TSocket("ath-8.ece.cornell.edu", 10008)
-  post_id_transport = TTransport.TFramedTransport(post_id_socket)
-  post_id_protocol = TBinaryProtocol.TBinaryProtocol(post_id_transport)
-  post_id_client = UniqueIdService.Client(post_id_protocol)
-  post_id_transport.open()
-  post_id_client.UploadUniqueId(req_id, post_tyoe, {})
-  post_id_transport.close()
+  pools = PoolManager()
+  with pools.client(TextService, "ath-8.ece.cornell.edu", 10007) as text_client:
+    text_client.UploadText(req_id, text, {})
+
+  with pools.client(MediaService, "ath-8.ece.cornell.edu", 10006) as media_client:
+    print(media_client.UploadMedia(req_id, media_types, media_ids, {}))
+
+  with pools.client(UserService, "ath-8.ece.cornell.edu", 10005) as user_client:
+    user_client.UploadCreatorWithUsername(req_id, creator, {})
+
+  with pools.client(UniqueIdService, "ath-8.ece.cornell.edu", 10008) as post_id_client:
+    post_id_client.UploadUniqueId(req_id, post_tyoe, {})
+  pools.close()
 
 
 
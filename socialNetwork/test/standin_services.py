@@ -0,0 +1,617 @@
+"""In-process stand-ins for every social_network Thrift service.
+
+Each service is a Python implementation of the generated Iface, backed by
+in-memory dicts and served by the generated Processor on its own loopback
+port. Calls between services go over real Thrift hops, following the call
+graph of the C++ handlers in src/:
+
+  ComposePost -> ComposeText -> ComposeUrls, ComposeUserMentions
+              -> ComposeCreatorWithUserId, ComposeMedia, ComposeUniqueId
+              -> StorePost, WriteUserTimeline,
+                 WriteHomeTimeline -> GetFollowers
+  ReadUserTimeline, ReadHomeTimeline -> ReadPosts
+  FollowWithUsername, UnfollowWithUsername -> GetUserId
+  RegisterUser(WithId) -> InsertUser
+
+A handler makes its downstream calls one after another on its own
+thread.
+
+Every handler call first sleeps for its service's service time (constant,
+exponential or lognormal), and the seeded social graph gives each user
+`followers` followers, which sets the WriteHomeTimeline fan-out.
+
+Run a cluster in the foreground and point clients at 127.0.0.1 on the
+docker-compose ports:
+
+  python3 standin_services.py --service-time 0.5 --service-time social-graph-service=2 \
+      --distribution exponential --users 1000 --followers 20
+
+or benchmark ComposePost and ReadHomeTimeline against it:
+
+  python3 standin_services.py --bench 10000 --concurrency 16
+"""
+
+import sys
+sys.path.append('../gen-py')
+sys.path.append('../..')
+
+import argparse
+import hashlib
+import itertools
+import random
+import re
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from social_network import ComposePostService
+from social_network import HomeTimelineService
+from social_network import MediaService
+from social_network import PostStorageService
+from social_network import SocialGraphService
+from social_network import TextService
+from social_network import UniqueIdService
+from social_network import UrlShortenService
+from social_network import UserMentionService
+from social_network import UserService
+from social_network import UserTimelineService
+from social_network.ttypes import Creator, ErrorCode, Media, Post, PostType
+from social_network.ttypes import ServiceException, TextServiceReturn, Url, User, UserMention
+
+from thriftkit import PoolManager, ProcessorMetrics, ThriftServer
+from thriftkit.histogram import LatencyHistogram
+from thriftkit.server import StatsReporter
+from thriftkit.tracing import Tracer, traced_checkout
+
+# The host ports docker-compose.yml maps each service to.
+PORTS = {
+    'social-graph-service': 10000,
+    'compose-post-service': 10001,
+    'post-storage-service': 10002,
+    'user-timeline-service': 10003,
+    'url-shorten-service': 10004,
+    'user-service': 10005,
+    'media-service': 10006,
+    'text-service': 10007,
+    'unique-id-service': 10008,
+    'user-mention-service': 10009,
+    'home-timeline-service': 10010,
+}
+
+SERVICES = {
+    'social-graph-service': SocialGraphService,
+    'compose-post-service': ComposePostService,
+    'post-storage-service': PostStorageService,
+    'user-timeline-service': UserTimelineService,
+    'url-shorten-service': UrlShortenService,
+    'user-service': UserService,
+    'media-service': MediaService,
+    'text-service': TextService,
+    'unique-id-service': UniqueIdService,
+    'user-mention-service': UserMentionService,
+    'home-timeline-service': HomeTimelineService,
+}
+
+MENTION_RE = re.compile(r"@[a-zA-Z0-9-_]+")
+URL_RE = re.compile(r"(http://|https://)([a-zA-Z0-9_!~*'().&=+$%-]+)")
+SHORT_URL_HOST = 'http://short-url/'
+DISTRIBUTIONS = ('constant', 'exponential', 'lognormal')
+
+
+def _error(message):
+  return ServiceException(errorCode=ErrorCode.SE_THRIFT_HANDLER_ERROR, message=message)
+
+
+class Handler:
+  """Base of the stand-in handlers: service time and downstream clients."""
+
+  name = None
+
+  def __init__(self, cluster):
+    self.cluster = cluster
+    self.lock = threading.Lock()
+
+  def work(self):
+    self.cluster.pause(self.name)
+
+  def client(self, name):
+    return self.cluster.client(name)
+
+
+class UniqueIdHandler(Handler):
+  name = 'unique-id-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.counter = itertools.count(1)
+
+  def ComposeUniqueId(self, req_id, post_type, carrier):
+    self.work()
+    return next(self.counter)
+
+
+class MediaHandler(Handler):
+  name = 'media-service'
+
+  def ComposeMedia(self, req_id, media_types, media_ids, carrier):
+    self.work()
+    if len(media_types) != len(media_ids):
+      raise _error('The lengths of media_id list and media_type list are not equal')
+    return [Media(media_id=media_id, media_type=media_type)
+            for media_id, media_type in zip(media_ids, media_types)]
+
+
+class UrlShortenHandler(Handler):
+  name = 'url-shorten-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.urls = {}
+
+  def ComposeUrls(self, req_id, urls, carrier):
+    self.work()
+    rng = self.cluster.rng
+    result = [Url(shortened_url=SHORT_URL_HOST + ''.join(
+        rng.choices(string.ascii_letters + string.digits, k=10)), expanded_url=url)
+              for url in urls]
+    with self.lock:
+      for url in result:
+        self.urls[url.shortened_url] = url.expanded_url
+    return result
+
+  def GetExtendedUrls(self, req_id, shortened_urls, carrier):
+    self.work()
+    return [self.urls.get(url, '') for url in shortened_urls]
+
+
+class UserHandler(Handler):
+  name = 'user-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.users = {}
+    self.counter = itertools.count(1 << 32)
+
+  def _register(self, req_id, first_name, last_name, username, password, user_id, carrier):
+    salt = ''.join(self.cluster.rng.choices(string.ascii_letters + string.digits, k=32))
+    user = User(user_id=user_id, first_name=first_name, last_name=last_name,
+                username=username, salt=salt,
+                password_hashed=hashlib.sha256((password + salt).encode()).hexdigest())
+    with self.lock:
+      if username in self.users:
+        raise _error('User %s already existed' % username)
+      self.users[username] = user
+    with self.client('social-graph-service') as social_graph:
+      social_graph.InsertUser(req_id, user_id, carrier)
+
+  def RegisterUser(self, req_id, first_name, last_name, username, password, carrier):
+    self.work()
+    self._register(req_id, first_name, last_name, username, password,
+                   next(self.counter), carrier)
+
+  def RegisterUserWithId(self, req_id, first_name, last_name, username, password, user_id,
+                         carrier):
+    self.work()
+    self._register(req_id, first_name, last_name, username, password, user_id, carrier)
+
+  def _user(self, username):
+    user = self.users.get(username)
+    if user is None:
+      raise _error('User: %s is not registered' % username)
+    return user
+
+  def Login(self, req_id, username, password, carrier):
+    self.work()
+    user = self._user(username)
+    if hashlib.sha256((password + user.salt).encode()).hexdigest() != user.password_hashed:
+      raise ServiceException(errorCode=ErrorCode.SE_UNAUTHORIZED,
+                             message='Incorrect username or password')
+    return 'token-%d-%d' % (user.user_id, int(time.time()))
+
+  def ComposeCreatorWithUserId(self, req_id, user_id, username, carrier):
+    self.work()
+    return Creator(user_id=user_id, username=username)
+
+  def ComposeCreatorWithUsername(self, req_id, username, carrier):
+    self.work()
+    return Creator(user_id=self._user(username).user_id, username=username)
+
+  def GetUserId(self, req_id, username, carrier):
+    self.work()
+    return self._user(username).user_id
+
+
+class UserMentionHandler(Handler):
+  name = 'user-mention-service'
+
+  def ComposeUserMentions(self, req_id, usernames, carrier):
+    self.work()
+    # Reads the user-service store directly, as the C++ service reads the
+    # user memcached and MongoDB.
+    users = self.cluster.handlers['user-service'].users
+    return [UserMention(user_id=users[username].user_id, username=username)
+            for username in usernames if username in users]
+
+
+class TextHandler(Handler):
+  name = 'text-service'
+
+  def ComposeText(self, req_id, text, carrier):
+    self.work()
+    usernames = [mention[1:] for mention in MENTION_RE.findall(text)]
+    urls = [match.group(0) for match in URL_RE.finditer(text)]
+
+    def compose_urls():
+      with self.client('url-shorten-service') as url_shorten:
+        return url_shorten.ComposeUrls(req_id, urls, carrier)
+
+    def compose_user_mentions():
+      with self.client('user-mention-service') as user_mention:
+        return user_mention.ComposeUserMentions(req_id, usernames, carrier)
+
+    shortened = compose_urls()
+    user_mentions = compose_user_mentions()
+    for url in shortened:
+      text = text.replace(url.expanded_url, url.shortened_url, 1)
+    return TextServiceReturn(text=text, user_mentions=user_mentions, urls=shortened)
+
+
+class SocialGraphHandler(Handler):
+  name = 'social-graph-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    # user_id -> {user_id: timestamp}, in follow order.
+    self.followers = {}
+    self.followees = {}
+
+  def GetFollowers(self, req_id, user_id, carrier):
+    self.work()
+    return list(self.followers.get(user_id, ()))
+
+  def GetFollowees(self, req_id, user_id, carrier):
+    self.work()
+    return list(self.followees.get(user_id, ()))
+
+  def _follow(self, user_id, followee_id):
+    now = int(time.time() * 1000)
+    with self.lock:
+      self.followees.setdefault(user_id, {})[followee_id] = now
+      self.followers.setdefault(followee_id, {})[user_id] = now
+
+  def _unfollow(self, user_id, followee_id):
+    with self.lock:
+      self.followees.get(user_id, {}).pop(followee_id, None)
+      self.followers.get(followee_id, {}).pop(user_id, None)
+
+  def _user_ids(self, req_id, usernames, carrier):
+    with self.client('user-service') as user_service:
+      return [user_service.GetUserId(req_id, username, carrier) for username in usernames]
+
+  def Follow(self, req_id, user_id, followee_id, carrier):
+    self.work()
+    self._follow(user_id, followee_id)
+
+  def Unfollow(self, req_id, user_id, followee_id, carrier):
+    self.work()
+    self._unfollow(user_id, followee_id)
+
+  def FollowWithUsername(self, req_id, user_usernmae, followee_username, carrier):
+    self.work()
+    self._follow(*self._user_ids(req_id, (user_usernmae, followee_username), carrier))
+
+  def UnfollowWithUsername(self, req_id, user_usernmae, followee_username, carrier):
+    self.work()
+    self._unfollow(*self._user_ids(req_id, (user_usernmae, followee_username), carrier))
+
+  def InsertUser(self, req_id, user_id, carrier):
+    self.work()
+    with self.lock:
+      self.followers.setdefault(user_id, {})
+      self.followees.setdefault(user_id, {})
+
+
+class PostStorageHandler(Handler):
+  name = 'post-storage-service'
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.posts = {}
+
+  def StorePost(self, req_id, post, carrier):
+    self.work()
+    self.posts[post.post_id] = post
+
+  def ReadPost(self, req_id, post_id, carrier):
+    self.work()
+    post = self.posts.get(post_id)
+    if post is None:
+      raise _error('Post_id: %d doesn\'t exist in MongoDB' % post_id)
+    return post
+
+  def ReadPosts(self, req_id, post_ids, carrier):
+    self.work()
+    return [self.posts[post_id] for post_id in post_ids if post_id in self.posts]
+
+
+class _Timelines(Handler):
+  """Per-user post id lists, newest first."""
+
+  def __init__(self, cluster):
+    super().__init__(cluster)
+    self.timelines = {}
+
+  def _append(self, user_ids, post_id):
+    with self.lock:
+      for user_id in user_ids:
+        self.timelines.setdefault(user_id, []).append(post_id)
+
+  def _read(self, req_id, user_id, start, stop, carrier):
+    timeline = self.timelines.get(user_id, [])
+    if start < 0 or stop <= start:
+      return []
+    end = len(timeline)
+    post_ids = timeline[max(0, end - stop):end - start][::-1]
+    if not post_ids:
+      return []
+    with self.client('post-storage-service') as post_storage:
+      return post_storage.ReadPosts(req_id, post_ids, carrier)
+
+
+class UserTimelineHandler(_Timelines):
+  name = 'user-timeline-service'
+
+  def WriteUserTimeline(self, req_id, post_id, user_id, timestamp, carrier):
+    self.work()
+    self._append((user_id,), post_id)
+
+  def ReadUserTimeline(self, req_id, user_id, start, stop, carrier):
+    self.work()
+    return self._read(req_id, user_id, start, stop, carrier)
+
+
+class HomeTimelineHandler(_Timelines):
+  name = 'home-timeline-service'
+
+  def WriteHomeTimeline(self, req_id, post_id, user_id, timestamp, user_mentions_id,
+                        carrier):
+    self.work()
+    with self.client('social-graph-service') as social_graph:
+      followers = social_graph.GetFollowers(req_id, user_id, carrier)
+    self._append(dict.fromkeys(followers + list(user_mentions_id)), post_id)
+
+  def ReadHomeTimeline(self, req_id, user_id, start, stop, carrier):
+    self.work()
+    return self._read(req_id, user_id, start, stop, carrier)
+
+
+class ComposePostHandler(Handler):
+  name = 'compose-post-service'
+
+  def _call(self, name, method, *args):
+    with self.client(name) as client:
+      return getattr(client, method)(*args)
+
+  def ComposePost(self, req_id, username, user_id, text, media_ids, media_types, post_type,
+                  carrier):
+    self.work()
+    text_return = self._call('text-service', 'ComposeText', req_id, text, carrier)
+    creator = self._call('user-service', 'ComposeCreatorWithUserId',
+                         req_id, user_id, username, carrier)
+    media = self._call('media-service', 'ComposeMedia', req_id, media_types, media_ids, carrier)
+    post_id = self._call('unique-id-service', 'ComposeUniqueId', req_id, post_type, carrier)
+    post = Post(post_id=post_id, creator=creator, req_id=req_id,
+                text=text_return.text, user_mentions=text_return.user_mentions,
+                media=media, urls=text_return.urls,
+                timestamp=int(time.time() * 1000), post_type=post_type)
+    mention_ids = [mention.user_id for mention in post.user_mentions]
+    self._call('post-storage-service', 'StorePost', req_id, post, carrier)
+    self._call('user-timeline-service', 'WriteUserTimeline',
+               req_id, post_id, user_id, post.timestamp, carrier)
+    self._call('home-timeline-service', 'WriteHomeTimeline',
+               req_id, post_id, user_id, post.timestamp, mention_ids, carrier)
+
+
+HANDLERS = [
+    SocialGraphHandler, ComposePostHandler, PostStorageHandler, UserTimelineHandler,
+    UrlShortenHandler, UserHandler, MediaHandler, TextHandler, UniqueIdHandler,
+    UserMentionHandler, HomeTimelineHandler,
+]
+
+
+class StandInCluster:
+  """Serves every social_network stand-in on `host`, one port per service.
+
+  `service_time` is the mean time in seconds each handler call spends
+  before doing its work, overridden per service name by `service_times`;
+  `distribution` is 'constant', 'exponential' or 'lognormal' (with shape
+  `sigma`, the service time being its median). With `metrics`, a
+  thriftkit ProcessorMetrics, every Processor is instrumented;
+  with `tracer`, a thriftkit Tracer, every call is traced.
+  """
+
+  def __init__(self, host='127.0.0.1', ports=None, service_time=0.0,
+               distribution='constant', service_times=None, sigma=0.5, workers=64, seed=1,
+               server_mode='threads', report_interval=None, metrics=None,
+               tracer=None):
+    if distribution not in DISTRIBUTIONS:
+      raise ValueError('unknown service time distribution %r' % distribution)
+    self.host = host
+    self.ports = dict(PORTS, **(ports or {}))
+    self.service_time = service_time
+    self.distribution = distribution
+    self.service_times = dict(service_times or {})
+    self.sigma = sigma
+    self.rng = random.Random(seed)
+    self.pools = PoolManager()
+    self.handlers = {cls.name: cls(self) for cls in HANDLERS}
+    self.workers = workers
+    self.server_mode = server_mode
+    self.report_interval = report_interval
+    self.metrics = metrics
+    self.tracer = tracer
+    self.servers = {}
+    self.reporter = None
+
+  def pause(self, name):
+    mean = self.service_times.get(name, self.service_time)
+    if mean <= 0:
+      return
+    if self.distribution == 'exponential':
+      mean = self.rng.expovariate(1.0 / mean)
+    elif self.distribution == 'lognormal':
+      mean *= self.rng.lognormvariate(0.0, self.sigma)
+    time.sleep(mean)
+
+  def client(self, name):
+    checkout = self.pools.client(SERVICES[name], self.host, self.ports[name])
+    if self.tracer is not None:
+      checkout = traced_checkout(checkout, SERVICES[name], self.tracer, name)
+    return checkout
+
+  def start(self):
+    for name, handler in self.handlers.items():
+      processor = SERVICES[name].Processor(handler)
+      if self.metrics is not None:
+        self.metrics.instrument(processor, name)
+      if self.tracer is not None:
+        self.tracer.instrument(processor, name)
+      self.servers[name] = ThriftServer(processor, self.host, self.ports[name],
+                                        mode=self.server_mode, workers=self.workers).start()
+    if self.report_interval:
+      self.reporter = StatsReporter(self.server_stats, self.report_interval).start()
+    return self
+
+  def server_stats(self):
+    """Returns {'<service>.<method>': LatencyHistogram} over all servers."""
+    return {'%s.%s' % (name, method): histogram
+            for name, server in self.servers.items()
+            for method, histogram in server.stats.snapshot().items()}
+
+  def stop(self):
+    if self.reporter is not None:
+      self.reporter.stop()
+      self.reporter = None
+    for server in self.servers.values():
+      server.stop()
+    self.servers = {}
+    self.pools.close()
+
+  def seed(self, num_users, followers):
+    """Registers username_0 .. username_<num_users - 1> with ids 0.. and has
+    each user followed by the next `followers` users."""
+    users = self.handlers['user-service']
+    graph = self.handlers['social-graph-service']
+    for user_id in range(num_users):
+      username = 'username_%d' % user_id
+      users.users[username] = User(user_id=user_id, first_name='first_name_%d' % user_id,
+                                   last_name='last_name_%d' % user_id, username=username,
+                                   password_hashed='', salt='')
+      graph.followers.setdefault(user_id, {})
+      graph.followees.setdefault(user_id, {})
+    for user_id in range(num_users):
+      for k in range(1, min(followers, num_users - 1) + 1):
+        graph._follow((user_id + k) % num_users, user_id)
+
+
+def bench(cluster, num_users, requests, concurrency):
+  """Composes `requests` posts, then reads as many home timelines, and
+  prints throughput and latency percentiles for each."""
+  rng = random.Random(2)
+
+  def compose(i):
+    user_id = rng.randrange(num_users)
+    text = ''.join(rng.choices(string.ascii_letters, k=64))
+    text += ' @username_%d http://%s' % (rng.randrange(num_users),
+                                         ''.join(rng.choices(string.ascii_lowercase, k=32)))
+    with cluster.client('compose-post-service') as client:
+      client.ComposePost(i, 'username_%d' % user_id, user_id, text, [i], ['png'],
+                         PostType.POST, {})
+
+  def read(i):
+    with cluster.client('home-timeline-service') as client:
+      client.ReadHomeTimeline(i, rng.randrange(num_users), 0, 10, {})
+
+  for label, call in (('ComposePost', compose), ('ReadHomeTimeline', read)):
+    histogram = LatencyHistogram()
+    lock = threading.Lock()
+
+    def timed(i):
+      start = time.monotonic()
+      call(i)
+      with lock:
+        histogram.record(time.monotonic() - start)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(concurrency) as pool:
+      list(pool.map(timed, range(requests)))
+    elapsed = time.monotonic() - start
+    print('{:<18} {:>9.0f} req/s  p50 {:>7.2f} ms  p99 {:>7.2f} ms'.format(
+        label, requests / elapsed, histogram.percentile(50) * 1e3,
+        histogram.percentile(99) * 1e3))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--service-time', action='append', default=[],
+                      metavar='[SERVICE=]MS',
+                      help='mean service time per handler call in ms, e.g. 0.5, or '
+                           'page-service=2 for one service')
+  parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='constant')
+  parser.add_argument('--sigma', type=float, default=0.5,
+                      help='shape of the lognormal distribution, whose median is the '
+                           'service time')
+  parser.add_argument('--users', type=int, default=1000)
+  parser.add_argument('--followers', type=int, default=10,
+                      help='followers per user, i.e. the home timeline fan-out')
+  parser.add_argument('--bench', type=int, default=0, metavar='REQUESTS',
+                      help='run a ComposePost/ReadHomeTimeline benchmark and exit')
+  parser.add_argument('--concurrency', type=int, default=8)
+  parser.add_argument('--server-mode', choices=('threads', 'asyncio'), default='threads',
+                      help='thriftkit server mode; asyncio runs handlers, and so their '
+                           'delays, one at a time per service')
+  parser.add_argument('--report-interval', type=float, default=None,
+                      help='print per-method QPS and latency every this many seconds')
+  parser.add_argument('--metrics-port', type=int, default=None,
+                      help='serve per-method decode/handler/encode histograms at '
+                           'http://HOST:PORT/metrics')
+  parser.add_argument('--trace', metavar='PATH', default=None,
+                      help='record client and server spans to this binary log')
+  args = parser.parse_args()
+
+  metrics = None
+  if args.metrics_port:
+    metrics = ProcessorMetrics()
+    metrics.serve(args.host, args.metrics_port)
+  tracer = Tracer(args.trace) if args.trace else None
+
+  service_time, service_times = 0.0, {}
+  for spec in args.service_time:
+    name, _, ms = spec.rpartition('=')
+    if name:
+      service_times[name] = float(ms) / 1000.0
+    else:
+      service_time = float(ms) / 1000.0
+  cluster = StandInCluster(args.host, service_time=service_time,
+                           distribution=args.distribution, service_times=service_times,
+                           sigma=args.sigma, server_mode=args.server_mode,
+                           report_interval=args.report_interval, metrics=metrics,
+                           tracer=tracer).start()
+  cluster.seed(args.users, args.followers)
+  if args.bench:
+    bench(cluster, args.users, args.bench, args.concurrency)
+    cluster.stop()
+    return
+  for name in SERVICES:
+    print('{:<24} {}:{}'.format(name, args.host, cluster.ports[name]))
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    cluster.stop()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,41 @@
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in ('', 'socialNetwork/gen-py', 'mediaMicroservices/gen-py', 'socialNetwork/scripts',
+             'mediaMicroservices/scripts', 'socialNetwork/test', 'mediaMicroservices/test'):
+  path = os.path.join(ROOT, path)
+  if path not in sys.path:
+    sys.path.append(path)
+
+
+@pytest.fixture
+def serve_once():
+  """Returns start(reply): a server on a free port that reads one frame and
+  answers it with the bytes `reply`, or hangs up when `reply` is None."""
+
+  def start(reply):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+
+    def run():
+      conn, _ = listener.accept()
+      listener.close()
+      with conn:
+        size = int.from_bytes(conn.recv(4, socket.MSG_WAITALL), 'big')
+        conn.recv(size, socket.MSG_WAITALL)
+        if reply is not None:
+          conn.sendall(reply)
+          time.sleep(0.5)  # stay connected while the client reacts
+
+    threading.Thread(target=run, daemon=True).start()
+    return listener.getsockname()[1]
+
+  return start
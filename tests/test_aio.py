@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+import pytest
+from thrift.transport.TTransport import TTransportException
+
+from social_network import UniqueIdService
+from thriftkit.aio import client_class
+
+BAD_FRAME = (2).to_bytes(4, 'big') + b'ab'  # too short for a message header
+
+
+@pytest.mark.parametrize('reply, error_type', [(None, TTransportException.END_OF_FILE),
+                                                (BAD_FRAME, TTransportException.UNKNOWN)])
+def test_calls_fail_fast_after_reader_stops(serve_once, reply, error_type):
+  async def run():
+    client = await client_class(UniqueIdService)('127.0.0.1', serve_once(reply),
+                                                 timeout=5).open()
+    with pytest.raises(TTransportException) as first:
+      await client.ComposeUniqueId(1, 0, {})
+    assert first.value.type == error_type
+    start = time.monotonic()
+    with pytest.raises(TTransportException) as second:
+      await client.ComposeUniqueId(2, 0, {})
+    assert second.value.type == error_type
+    assert time.monotonic() - start < 1
+    await client.close()
+
+  asyncio.run(run())
@@ -0,0 +1,101 @@
+import pytest
+
+from social_network.PostStorageService import ReadPosts_result
+from social_network.ttypes import Creator, Post
+from thriftkit import CachingClient, LRUCache
+from thriftkit.fastdecode import LAZY_MIN_LENGTH, decoder_for
+
+from test_lazy_lists import encode
+
+
+class PostStorage:
+  """Serves posts with ids below 100 and records what it was asked for."""
+
+  def __init__(self):
+    self.calls = []
+
+  def ReadPost(self, req_id, post_id, carrier):
+    self.calls.append(('ReadPost', post_id))
+    return Post(post_id=post_id)
+
+  def ReadPosts(self, req_id, post_ids, carrier):
+    self.calls.append(('ReadPosts', list(post_ids)))
+    return [Post(post_id=post_id) for post_id in post_ids if post_id < 100]
+
+  def GetExtendedUrls(self, req_id, shortened_urls, carrier):
+    self.calls.append(('GetExtendedUrls', list(shortened_urls)))
+    return ['http://example.com/' + url for url in shortened_urls]
+
+  def StorePost(self, req_id, post, carrier):
+    self.calls.append(('StorePost', post.post_id))
+
+
+def test_lru_evicts_the_least_recently_used_key():
+  cache = LRUCache(maxsize=2)
+  cache.put('a', 1)
+  cache.put('b', 2)
+  assert cache.get('a') == 1  # now b is the oldest
+  cache.put('c', 3)
+  assert len(cache) == 2 and cache.evictions == 1
+  assert cache.get('b') is None
+  assert cache.get('a') == 1 and cache.get('c') == 3
+  cache.put('a', 4)  # replacing a key does not evict
+  assert cache.evictions == 1 and cache.get('a') == 4
+
+
+def test_batch_reads_fetch_only_missing_keys():
+  storage = PostStorage()
+  posts = CachingClient(storage)
+  assert [post.post_id for post in posts.ReadPosts(0, [1, 2, 3], {})] == [1, 2, 3]
+  assert [post.post_id for post in posts.ReadPosts(0, [2, 4, 3, 2], {})] == [2, 4, 3, 2]
+  assert storage.calls == [('ReadPosts', [1, 2, 3]), ('ReadPosts', [4])]
+  # Entries are shared with ReadPost.
+  assert posts.ReadPost(0, 4, {}).post_id == 4
+  assert posts.ReadPost(0, 5, {}).post_id == 5
+  assert storage.calls[2:] == [('ReadPost', 5)]
+  assert posts.stats() == {'post': {'hits': 3, 'misses': 5}}
+
+
+def test_keys_the_service_leaves_out_are_not_cached():
+  storage = PostStorage()
+  posts = CachingClient(storage)
+  assert [post.post_id for post in posts.ReadPosts(0, [1, 100], {})] == [1]
+  assert [post.post_id for post in posts.ReadPosts(0, [1, 100], {})] == [1]
+  assert storage.calls == [('ReadPosts', [1, 100]), ('ReadPosts', [100])]
+
+
+def test_positional_results_and_pass_through():
+  storage = PostStorage()
+  urls = CachingClient(storage, maxsize=2)
+  assert urls.GetExtendedUrls(0, ['a', 'b'], {}) == ['http://example.com/a',
+                                                     'http://example.com/b']
+  assert urls.GetExtendedUrls(0, ['c', 'a'], {}) == ['http://example.com/c',
+                                                     'http://example.com/a']
+  assert storage.calls == [('GetExtendedUrls', ['a', 'b']), ('GetExtendedUrls', ['c'])]
+  assert urls.cache.evictions == 1
+  urls.StorePost(0, Post(post_id=9), {})
+  assert storage.calls[-1] == ('StorePost', 9)
+  assert urls.stats() == {'url': {'hits': 1, 'misses': 3}}
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_cached_lazy_results_release_their_frame(batch):
+  posts = [Post(post_id=i, creator=Creator(user_id=i, username='u' * LAZY_MIN_LENGTH),
+                text='t' * LAZY_MIN_LENGTH) for i in range(3)]
+  frame = bytearray(encode(ReadPosts_result(success=posts) if batch else posts[0]))
+
+  class LazyStorage:
+    def ReadPost(self, req_id, post_id, carrier):
+      return decoder_for(Post, lazy=True)(frame, 0, None)[0]
+
+    def ReadPosts(self, req_id, post_ids, carrier):
+      return decoder_for(ReadPosts_result, lazy=True, list_views=True)(frame, 0, None)[0].success
+
+  client = CachingClient(LazyStorage())
+  if batch:
+    assert client.ReadPosts(0, [0, 1, 2], {}) == posts
+  else:
+    assert client.ReadPost(0, 0, {}) == posts[0]
+  frame.extend(b'next frame')  # raises BufferError while a view is held
+  assert client.ReadPost(0, 0, {}) == posts[0]
+  assert client.ReadPost(0, 0, {}).creator.username == 'u' * LAZY_MIN_LENGTH
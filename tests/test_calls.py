@@ -0,0 +1,20 @@
+from social_network import UserService
+from thriftkit.calls import service_methods
+
+
+def test_service_methods_in_idl_order():
+  assert service_methods(UserService) == [
+      'RegisterUser', 'RegisterUserWithId', 'Login', 'ComposeCreatorWithUserId',
+      'ComposeCreatorWithUsername', 'GetUserId']
+
+
+def test_service_methods_of_an_extended_service():
+  class Iface(UserService.Iface):
+    def Logout(self, req_id, carrier):
+      pass
+
+  class Extended:
+    pass
+
+  Extended.Iface = Iface
+  assert service_methods(Extended) == service_methods(UserService) + ['Logout']
@@ -0,0 +1,70 @@
+import json
+import random
+
+import pytest
+
+from checkpoint import Checkpoint, IndexRanges
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_index_ranges_match_a_set(seed):
+  rng = random.Random(seed)
+  ranges, model = IndexRanges(), set()
+  for _ in range(200):
+    start = rng.randrange(100)
+    end = start + rng.randrange(-1, 8)
+    ranges.add_range(start, end)
+    model.update(range(start, end))
+    spans = list(ranges)
+    assert all(s < e for s, e in spans)
+    # Sorted, and merged: neither overlapping nor touching.
+    assert all(e1 < s2 for (_, e1), (s2, _) in zip(spans, spans[1:]))
+    assert set(i for s, e in spans for i in range(s, e)) == model
+    assert len(ranges) == len(model)
+  assert all((i in ranges) == (i in model) for i in range(-2, 110))
+
+
+def test_index_ranges_merge_adjacent_and_bridging_ranges():
+  ranges = IndexRanges([(10, 12), (0, 2), (5, 6)])
+  assert list(ranges) == [(0, 2), (5, 6), (10, 12)]
+  ranges.add(2)
+  assert list(ranges) == [(0, 3), (5, 6), (10, 12)]
+  ranges.add_range(3, 11)
+  assert list(ranges) == [(0, 12)]
+  ranges.add_range(4, 4)
+  assert list(ranges) == [(0, 12)]
+  assert not IndexRanges([(3, 3)])
+
+
+def test_resume_replays_flushed_lines(tmp_path):
+  path = str(tmp_path / 'journal')
+  checkpoint = Checkpoint(path, {'users': 10})
+  for index in (0, 1, 2, 7):
+    checkpoint.mark_done('follow', index)
+  checkpoint.flush()
+  checkpoint.mark_done('register', 4)
+  checkpoint.close()
+
+  resumed = Checkpoint(path, {'users': 99}, resume=True)
+  assert resumed.meta == {'users': 10}
+  assert list(resumed.completed('follow')) == [(0, 3), (7, 8)]
+  assert resumed.is_done('register', 4) and not resumed.is_done('register', 5)
+  resumed.close()
+
+
+def test_resume_after_torn_last_line(tmp_path):
+  path = str(tmp_path / 'journal')
+  checkpoint = Checkpoint(path, {'users': 10})
+  checkpoint.mark_done('follow', 1)
+  checkpoint.close()
+  with open(path, 'a') as f:
+    f.write(json.dumps({'phase': 'follow', 'ranges': [[5, 9]]})[:20])  # crash mid-write
+
+  resumed = Checkpoint(path, {}, resume=True)
+  assert list(resumed.completed('follow')) == [(1, 2)]
+  resumed.mark_done('follow', 3)
+  resumed.close()
+
+  again = Checkpoint(path, {}, resume=True)
+  assert list(again.completed('follow')) == [(1, 2), (3, 4)]
+  again.close()
@@ -0,0 +1,163 @@
+import struct
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from thrift.Thrift import TType
+from thrift.protocol import TBinaryProtocol
+from thrift.protocol.TProtocol import TProtocolException
+from thrift.transport import TTransport
+
+from media_service.ttypes import Cast, CastInfo, MovieInfo, Page
+from social_network.PostStorageService import ReadPosts_result
+from social_network.ttypes import Creator, Media, Post, Url, UserMention
+from thriftkit.columnar import POST_COLUMNS, StringColumn, extract_columns
+from thriftkit.fastdecode import decoder_for
+
+
+def encode(value):
+  buf = TTransport.TMemoryBuffer()
+  value.write(TBinaryProtocol.TBinaryProtocol(buf))
+  return buf.getvalue()
+
+
+def struct_rows(values, prefix=b''):
+  """The structs back to back, each preceded by `prefix`, and their offsets."""
+  buf, offsets = bytearray(), []
+  for value in values:
+    offsets.append(len(buf))
+    buf += prefix + encode(value)
+  return bytes(buf), offsets
+
+
+POSTS = [
+    Post(post_id=1, creator=Creator(user_id=10, username='a'), req_id=5, text='héllo',
+         user_mentions=[UserMention(user_id=11, username='b')],
+         media=[Media(media_id=1, media_type='png'), Media(media_id=2, media_type='gif')],
+         urls=[], timestamp=1600000000123, post_type=1),
+    # Missing fields come out as 0, an empty string or a zero count.
+    Post(post_id=2),
+    Post(post_id=-3, creator=Creator(user_id=1 << 40), text='', urls=[Url('s', 'e')],
+         timestamp=-1),
+]
+
+POST_VALUES = {
+    'post_id': [1, 2, -3],
+    'timestamp': [1600000000123, 0, -1],
+    'creator.user_id': [10, 0, 1 << 40],
+    'text': ['héllo', '', ''],
+    'media_count': [2, 0, 0],
+    'urls_count': [0, 0, 1],
+    'user_mentions_count': [1, 0, 0],
+}
+
+
+def post_batch(posts=POSTS):
+  data = encode(ReadPosts_result(success=posts))
+  result, _ = decoder_for(ReadPosts_result, False, True)(data, 0, None)
+  return result.success.columns(*POST_COLUMNS)
+
+
+def test_post_columns():
+  batch = post_batch()
+  assert len(batch) == len(POSTS)
+  assert list(batch.columns) == list(POST_VALUES)
+  for name, values in POST_VALUES.items():
+    assert list(batch[name]) == values
+  assert isinstance(batch['text'], StringColumn)
+
+
+def test_post_columns_to_numpy():
+  columns = post_batch().to_numpy()
+  for name in ('post_id', 'timestamp', 'creator.user_id'):
+    assert columns[name].dtype == np.int64
+    assert columns[name].tolist() == POST_VALUES[name]
+  for name in ('media_count', 'urls_count', 'user_mentions_count'):
+    assert columns[name].dtype == np.int32
+    assert columns[name].tolist() == POST_VALUES[name]
+  offsets, data = columns['text']
+  assert offsets.dtype == np.int64 and data.dtype == np.uint8
+  assert offsets.tolist() == [0, 6, 6, 6]
+  assert data.tobytes() == 'héllo'.encode('utf-8')
+
+
+def test_post_columns_to_arrow():
+  batch = post_batch().to_arrow()
+  assert batch.schema == pa.schema([
+      ('post_id', pa.int64()), ('timestamp', pa.int64()), ('creator.user_id', pa.int64()),
+      ('text', pa.large_string()), ('media_count', pa.int32()), ('urls_count', pa.int32()),
+      ('user_mentions_count', pa.int32())])
+  batch.validate(full=True)
+  # Missing values are zeros, not nulls.
+  assert all(column.null_count == 0 for column in batch.columns)
+  assert batch.to_pydict() == POST_VALUES
+
+
+def test_no_rows():
+  batch = post_batch([])
+  assert len(batch) == 0
+  arrow = batch.to_arrow()
+  arrow.validate(full=True)
+  assert arrow.num_rows == 0 and arrow.num_columns == len(POST_VALUES)
+  assert post_batch([]).to_numpy()['post_id'].shape == (0,)
+
+
+def test_bool_and_double_columns():
+  pages = [
+      Page(movie_info=MovieInfo(movie_id='m1', avg_rating=7.25, casts=[Cast(1, 'c', 2)] * 3),
+           cast_infos=[CastInfo(1, 'x', True, ''), CastInfo(2, 'y', False, '')]),
+      Page(plot='no movie info'),
+  ]
+  data, offsets = struct_rows(pages)
+  paths = ('movie_info.avg_rating', 'movie_info.casts', 'cast_infos', 'plot')
+  batch = extract_columns(data, offsets, Page, paths)
+  assert batch.to_arrow().to_pydict() == {
+      'movie_info.avg_rating': [7.25, 0.0], 'movie_info.casts_count': [3, 0],
+      'cast_infos_count': [2, 0], 'plot': ['', 'no movie info']}
+  assert batch.to_numpy()['movie_info.avg_rating'].dtype == np.float64
+
+  infos = [CastInfo(1, 'x', True, 'i'), CastInfo(2, 'y', False, 'j'), CastInfo(3, 'z')]
+  data, offsets = struct_rows(infos)
+  batch = extract_columns(data, offsets, CastInfo, ('gender', 'cast_info_id'))
+  arrow = batch.to_arrow()
+  assert arrow.schema.field('gender').type == pa.bool_()
+  assert arrow.column('gender').to_pylist() == [True, False, False]
+  gender = batch.to_numpy()['gender']
+  assert gender.dtype == np.bool_ and gender.tolist() == [True, False, False]
+
+
+def test_unknown_and_reordered_fields():
+  # An unknown field ahead of the known ones sends the extractor down its
+  # general loop, which must find the same values.
+  unknown = (struct.pack('!bhi', TType.I32, 77, 12345) +
+             struct.pack('!bhi', TType.STRING, 78, 2) + b'zz')
+  data, offsets = struct_rows(POSTS, prefix=unknown)
+  batch = extract_columns(data, offsets, Post, POST_COLUMNS)
+  assert batch.to_arrow().to_pydict() == POST_VALUES
+
+
+@pytest.mark.parametrize('paths', [('no_such_field',), ('creator',), ('text.length',),
+                                   ('creator.no_such_field',)])
+def test_bad_paths(paths):
+  data, offsets = struct_rows(POSTS)
+  with pytest.raises(ValueError):
+    extract_columns(data, offsets, Post, paths)
+
+
+def bad_post(ftype, fid, prefix, n):
+  return (struct.pack('!bhq', TType.I64, 1, 7) + struct.pack('!bh', ftype, fid) + prefix +
+          struct.pack('!i', n) + b'\0' * 8)
+
+
+@pytest.mark.parametrize('n, error', [(-9, TProtocolException.NEGATIVE_SIZE),
+                                      (99, TProtocolException.SIZE_LIMIT)])
+@pytest.mark.parametrize('ftype, fid, prefix', [
+    (TType.STRING, 4, b''),                    # an extracted string
+    (TType.LIST, 5, bytes([TType.STRUCT])),    # a counted list
+    (TType.STRING, 900, b''),                  # a skipped unknown field
+], ids=['string', 'count', 'skipped'])
+def test_bad_sizes_are_rejected(ftype, fid, prefix, n, error):
+  data = bad_post(ftype, fid, prefix, n)
+  with pytest.raises(TProtocolException) as info:
+    extract_columns(data, [0], Post, POST_COLUMNS)
+  assert info.value.type == error
@@ -0,0 +1,40 @@
+import pickle
+
+import pytest
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+import social_network.ttypes
+from social_network import PostStorageService
+from thriftkit.compact import compact
+
+ttypes = compact(social_network.ttypes)
+service = compact(PostStorageService)
+
+
+def round_trip(value, cls):
+  buf = TTransport.TMemoryBuffer()
+  value.write(TBinaryProtocol.TBinaryProtocol(buf))
+  decoded = cls()
+  decoded.read(TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(buf.getvalue())))
+  return decoded
+
+
+def test_structs_use_slots():
+  post = ttypes.Post(post_id=1, creator=ttypes.Creator(user_id=2, username='u'))
+  assert not hasattr(post, '__dict__')
+  decoded = round_trip(post, ttypes.Post)
+  assert decoded == post
+  assert type(decoded.creator) is ttypes.Creator
+  assert pickle.loads(pickle.dumps(decoded)) == post
+
+
+def test_exceptions_are_the_generated_classes():
+  assert ttypes.ServiceException is social_network.ttypes.ServiceException
+  error = social_network.ttypes.ServiceException(
+      errorCode=social_network.ttypes.ErrorCode.SE_THRIFT_HANDLER_ERROR, message='boom')
+  result = round_trip(service.ReadPost_result(se=error), service.ReadPost_result)
+  assert type(result.se) is social_network.ttypes.ServiceException
+  with pytest.raises(social_network.ttypes.ServiceException) as raised:
+    raise result.se
+  assert raised.value.message == 'boom'
@@ -0,0 +1,249 @@
+import importlib
+import itertools
+import pkgutil
+import struct
+
+import pytest
+from thrift.Thrift import TType
+from thrift.protocol import TBinaryProtocol
+from thrift.protocol.TProtocol import TProtocolException
+from thrift.transport import TTransport
+from thrift.transport.TTransport import TTransportException
+
+import media_service
+import social_network
+from social_network.PostStorageService import ReadPosts_args
+from social_network.ttypes import Media, Post
+from thriftkit.fastdecode import (LAZY_MIN_LENGTH, LazyStructList, TBinaryProtocolFastDecode,
+                                  decoder_for)
+
+
+def generated_structs():
+  structs = []
+  for package in (social_network, media_service):
+    for info in pkgutil.iter_modules(package.__path__):
+      module = importlib.import_module(package.__name__ + '.' + info.name)
+      for value in vars(module).values():
+        if (isinstance(value, type) and value.__module__ == module.__name__ and
+            getattr(value, 'thrift_spec', None) is not None):
+          structs.append(value)
+  return structs
+
+
+STRUCTS = generated_structs()
+_counter = itertools.count(1)
+
+
+def sample(ttype, arg, depth=0):
+  """A value of `ttype` that differs from every other one generated."""
+  n = next(_counter)
+  if ttype == TType.BOOL:
+    return bool(n % 2)
+  if ttype == TType.BYTE:
+    return n % 100
+  if ttype == TType.I16:
+    return n % 30000
+  if ttype == TType.I32:
+    return n * 7919
+  if ttype == TType.I64:
+    return n << 36
+  if ttype == TType.DOUBLE:
+    return n + 0.25
+  if ttype == TType.STRING:
+    text = 'v%d-é' % n
+    if n % 3 == 0:
+      text *= LAZY_MIN_LENGTH  # long enough to be left lazy
+    return text.encode('utf-8') if arg == 'BINARY' else text
+  if ttype == TType.STRUCT:
+    return populate(arg[0], depth + 1)
+  if ttype in (TType.LIST, TType.SET):
+    values = [sample(arg[0], arg[1], depth) for _ in range(0 if depth > 2 else 2)]
+    return set(values) if ttype == TType.SET else values
+  if ttype == TType.MAP:
+    return {sample(arg[0], arg[1], depth): sample(arg[2], arg[3], depth)
+            for _ in range(0 if depth > 2 else 2)}
+  raise AssertionError('unexpected type %d' % ttype)
+
+
+def populate(cls, depth=0):
+  fields = {spec[2]: sample(spec[1], spec[3], depth)
+            for spec in cls.thrift_spec if spec is not None}
+  return cls(**fields)
+
+
+def encode(value):
+  buf = TTransport.TMemoryBuffer()
+  value.write(TBinaryProtocol.TBinaryProtocol(buf))
+  return buf.getvalue()
+
+
+def read(cls, protocol):
+  if isinstance(vars(cls).get('read'), classmethod):  # immutable exceptions
+    return cls.read(protocol)
+  value = cls()
+  value.read(protocol)
+  return value
+
+
+def reference(cls, data):
+  return read(cls, TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(data)))
+
+
+def plain(value):
+  """Nested fields as builtins, whatever classes the decoder used."""
+  if isinstance(value, (list, LazyStructList)):
+    return [plain(item) for item in value]
+  if isinstance(value, set):
+    return {plain(item) for item in value}
+  if isinstance(value, dict):
+    return {plain(key): plain(item) for key, item in value.items()}
+  spec = getattr(value, 'thrift_spec', None)
+  if spec is None:
+    return value
+  return tuple((field[2], plain(getattr(value, field[2]))) for field in spec if field)
+
+
+def struct_id(cls):
+  return cls.__module__.split('.')[0] + '.' + cls.__qualname__
+
+
+@pytest.mark.parametrize('cls', STRUCTS, ids=struct_id)
+def test_round_trip_matches_binary_protocol(cls):
+  data = encode(populate(cls))
+  expected = reference(cls, data)
+  assert read(cls, TBinaryProtocolFastDecode(TTransport.TMemoryBuffer(data))) == expected
+  for lazy, list_views in ((False, False), (True, False), (False, True), (True, True)):
+    decoded, end = decoder_for(cls, lazy, list_views)(data, 0, None)
+    assert end == len(data)
+    assert plain(decoded) == plain(expected)
+
+
+def unknown_fields():
+  """Fields with ids no struct uses, one of every wire type."""
+  buf = TTransport.TMemoryBuffer()
+  out = TBinaryProtocol.TBinaryProtocol(buf)
+  fid = iter(range(900, 1000))
+
+  def field(ttype):
+    out.writeFieldBegin('unknown', ttype, next(fid))
+
+  field(TType.BOOL), out.writeBool(True)
+  field(TType.BYTE), out.writeByte(1)
+  field(TType.DOUBLE), out.writeDouble(2.5)
+  field(TType.I16), out.writeI16(3)
+  field(TType.I32), out.writeI32(4)
+  field(TType.I64), out.writeI64(5)
+  field(TType.STRING), out.writeString('skipped')
+  field(TType.STRUCT)
+  out.writeFieldBegin('inner', TType.LIST, 1)
+  out.writeListBegin(TType.STRING, 2)
+  out.writeString('a')
+  out.writeString('b')
+  out.writeFieldStop()
+  field(TType.MAP)
+  out.writeMapBegin(TType.I32, TType.LIST, 1)
+  out.writeI32(1)
+  out.writeListBegin(TType.I64, 2)
+  out.writeI64(1)
+  out.writeI64(2)
+  field(TType.SET)
+  out.writeSetBegin(TType.STRING, 1)
+  out.writeString('s')
+  return buf.getvalue()
+
+
+@pytest.mark.parametrize('cls', STRUCTS, ids=struct_id)
+def test_unknown_fields_are_skipped(cls):
+  data = encode(populate(cls))
+  # A binary struct is just its fields and a stop byte, so unknown fields
+  # can go in front of the known ones.
+  data = unknown_fields() + data
+  expected = reference(cls, data)
+  assert read(cls, TBinaryProtocolFastDecode(TTransport.TMemoryBuffer(data))) == expected
+  decoded, end = decoder_for(cls)(data, 0, None)
+  assert end == len(data)
+  assert plain(decoded) == plain(expected)
+
+
+class Frame(TTransport.CReadableTransport):
+  """One received frame, decoded in place like TReusableFramedTransport's."""
+
+  def __init__(self, data):
+    self.data = bytearray(data)
+    self.pos = 0
+
+  def frame_buffer(self):
+    return self.data, self.pos, len(self.data)
+
+  def consume(self, end):
+    self.pos = end
+
+
+@pytest.mark.parametrize('cls', [cls for cls in STRUCTS if cls.__name__ in (
+    'Post', 'Page', 'Review', 'MovieInfo', 'ReadPosts_result', 'ReadPage_result')],
+                         ids=struct_id)
+def test_truncated_input_is_rejected(cls):
+  data = encode(populate(cls))
+  for size in range(len(data)):
+    with pytest.raises(TProtocolException):
+      read(cls, TBinaryProtocolFastDecode(Frame(data[:size])))
+    # Unframed, the decoder hands over to the generated code, which runs
+    # out of input the same way TBinaryProtocol does.
+    with pytest.raises(EOFError):
+      read(cls, TBinaryProtocolFastDecode(TTransport.TMemoryBuffer(data[:size])))
+
+
+def header(ttype, fid):
+  return struct.pack('!bh', ttype, fid)
+
+
+def size(n):
+  return struct.pack('!i', n)
+
+
+NEGATIVE, TOO_LONG = TProtocolException.NEGATIVE_SIZE, TProtocolException.SIZE_LIMIT
+BAD_SIZES = {
+    'string': (Media, header(TType.STRING, 2) + size(-7), header(TType.STRING, 2) + size(99)),
+    'string_out_of_order': (Media, header(TType.I64, 1) + b'\0' * 8 + header(TType.STRING, 2),
+                            None),
+    'lazy_string': (Post, header(TType.STRING, 4) + size(-7), header(TType.STRING, 4) + size(99)),
+    'fixed_list': (ReadPosts_args, header(TType.LIST, 2) + bytes([TType.I64]) + size(-1),
+                   header(TType.LIST, 2) + bytes([TType.I64]) + size(99)),
+    'struct_list': (Post, header(TType.LIST, 6) + bytes([TType.STRUCT]) + size(-1),
+                    header(TType.LIST, 6) + bytes([TType.STRUCT]) + size(99)),
+    'map': (ReadPosts_args, header(TType.MAP, 3) + bytes([TType.STRING] * 2) + size(-1),
+            header(TType.MAP, 3) + bytes([TType.STRING] * 2) + size(99)),
+    'skipped_string': (Media, header(TType.STRING, 900) + size(-7),
+                       header(TType.STRING, 900) + size(99)),
+    'skipped_list': (Media, header(TType.LIST, 900) + bytes([TType.STRUCT]) + size(-3),
+                     header(TType.LIST, 900) + bytes([TType.STRUCT]) + size(99)),
+    'skipped_map': (Media, header(TType.MAP, 900) + bytes([TType.I32] * 2) + size(-3),
+                    header(TType.MAP, 900) + bytes([TType.I32] * 2) + size(99)),
+}
+
+
+def bad_size_cases():
+  for name, (cls, negative, too_long) in BAD_SIZES.items():
+    if too_long is None:  # the prefix of a field whose size follows
+      negative, too_long = negative + size(-7), negative + size(99)
+    # Some well-formed bytes after the size, so that a decoder stepping
+    # back or forward by it still finds something to parse.
+    tail = b'\0' * 16
+    yield pytest.param(cls, negative + tail, NEGATIVE, id=name + '-negative')
+    yield pytest.param(cls, too_long + tail, TOO_LONG, id=name + '-too-long')
+
+
+@pytest.mark.parametrize('cls, data, error', list(bad_size_cases()))
+def test_bad_sizes_are_rejected(cls, data, error):
+  for lazy, list_views in ((False, False), (True, False), (False, True), (True, True)):
+    with pytest.raises(TProtocolException) as info:
+      decoder_for(cls, lazy, list_views)(data, 0, None)
+    assert info.value.type == error
+  with pytest.raises(TProtocolException) as info:
+    read(cls, TBinaryProtocolFastDecode(Frame(data)))
+  assert info.value.type == error
+  # Unframed, the generated code gets to reject it, as TBinaryProtocol does.
+  with pytest.raises((TProtocolException, TTransportException, EOFError)) as info:
+    reference(cls, data)
+  with pytest.raises(info.type):
+    read(cls, TBinaryProtocolFastDecode(TTransport.TMemoryBuffer(data)))
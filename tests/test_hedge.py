@@ -0,0 +1,78 @@
+import time
+
+import pytest
+from thrift.transport.TTransport import TTransportException
+
+from social_network import PostStorageService, UniqueIdService
+from thriftkit.hedge import IDEMPOTENT_READS, hedged_class
+from thriftkit.server import ThriftServer
+
+# Test ports stay below the ephemeral range.
+PORTS = (22903, 22904)
+SLOW = 0.5
+
+
+class Replica:
+  def __init__(self, delay):
+    self.delay = delay
+    self.calls = 0
+
+  def ComposeUniqueId(self, req_id, post_type, carrier):
+    self.calls += 1
+    time.sleep(self.delay)
+    return req_id
+
+
+@pytest.fixture
+def replicas():
+  """A slow replica and a fast one, in that order."""
+  handlers = [Replica(SLOW), Replica(0)]
+  servers = [ThriftServer(UniqueIdService.Processor(handler), '127.0.0.1', port,
+                          workers=2).start()
+             for handler, port in zip(handlers, PORTS)]
+  yield handlers
+  for server in servers:
+    server.stop()
+
+
+def connect(**kwargs):
+  return hedged_class(UniqueIdService)([('127.0.0.1', port) for port in PORTS],
+                                       timeout=5, **kwargs).open()
+
+
+def test_nothing_is_hedged_by_default():
+  cls = hedged_class(PostStorageService)
+  assert cls([('127.0.0.1', PORTS[0])]).hedge == frozenset()
+  assert cls([('127.0.0.1', PORTS[0])], hedge=IDEMPOTENT_READS).hedge == {'ReadPost', 'ReadPosts'}
+
+
+def test_deadline_drops_the_late_reply(replicas):
+  client = connect(default_deadline=0.05)
+  try:
+    with pytest.raises(TTransportException) as raised:
+      client.ComposeUniqueId(1, 0, {})
+    assert raised.value.type == TTransportException.TIMED_OUT
+    assert client._clients[0].in_flight() == 0
+    assert replicas[1].calls == 0  # not hedged
+    time.sleep(SLOW + 0.2)  # the late reply arrives and is dropped
+    assert client.ComposeUniqueId(2, 0, {}) == 2
+    assert client._clients[0].ComposeUniqueId(3, 0, {}) == 3
+  finally:
+    client.close()
+  assert client.stats()['ComposeUniqueId']['timeouts'] == 1
+
+
+def test_hedge_win_drops_the_slow_reply(replicas):
+  client = connect(hedge=['ComposeUniqueId'], initial_delay=0.02)
+  try:
+    start = time.monotonic()
+    assert client.ComposeUniqueId(1, 0, {}) == 1
+    assert time.monotonic() - start < SLOW
+    assert [replica.calls for replica in replicas] == [1, 1]
+    assert client._clients[0].in_flight() == 0
+    time.sleep(SLOW + 0.2)
+    assert client._clients[0].ComposeUniqueId(2, 0, {}) == 2
+  finally:
+    client.close()
+  stats = client.stats()['ComposeUniqueId']
+  assert (stats['hedged'], stats['hedge_wins'], stats['timeouts']) == (1, 1, 0)
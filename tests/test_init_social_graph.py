@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+import init_social_graph
+
+
+async def flaky_upload(session, addr, i):
+  await asyncio.sleep(0)
+  if i % 3 == 0:
+    raise ValueError('bad reply %d' % i)
+  if i % 3 == 1:
+    b'\xff'.decode('utf-8')
+  return 200, 'Success'
+
+
+def run(coro):
+  # The old failure mode was a hang, so bound it.
+  return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_unexpected_errors_fail_only_their_request():
+  jobs = [(flaky_upload, (i,)) for i in range(60)]
+  counts = run(init_social_graph.run_jobs('http://unused', jobs, 2))
+  assert sum(counts.values()) == 60
+  assert counts['Success'] == 20
+  assert sum(count for result, count in counts.items()
+             if result.startswith('ValueError: bad reply')) == 20
+  assert sum(count for result, count in counts.items()
+             if result.startswith('UnicodeDecodeError')) == 20
+
+
+def test_unexpected_errors_are_retried():
+  attempts = {}
+
+  async def upload(session, addr, i):
+    attempts[i] = attempts.get(i, 0) + 1
+    if attempts[i] == 1:
+      raise RuntimeError('first attempt')
+    return 200, 'Success'
+
+  jobs = [(upload, (i,)) for i in range(10)]
+  counts = run(init_social_graph.run_jobs('http://unused', jobs, 2, retries=1))
+  assert counts == {'Success': 10}
+  assert attempts == {i: 2 for i in range(10)}
+
+
+class BrokenCheckpoint:
+  def is_done(self, phase, index):
+    return False
+
+  def mark_done(self, phase, index):
+    raise OSError('journal is full')
+
+  def flush(self):
+    pass
+
+
+def test_worker_failure_stops_the_run():
+  jobs = [(flaky_upload, (3 * i + 2,)) for i in range(60)]
+  with pytest.raises(OSError, match='journal is full'):
+    run(init_social_graph.run_jobs('http://unused', jobs, 2, 'follow', BrokenCheckpoint()))
@@ -0,0 +1,36 @@
+import io
+import json
+
+import pytest
+
+from json_stream import iter_json_array
+
+DOCUMENT = r'''
+ [ {"id": 1, "name": "Zoë \"Z\" O'Neil", "biography": "line\nbreak, tab\t, ] and [ inside"},
+   {"id": 22, "cast": [{"id": 3, "character": "é😀\\"}], "nested": {"a": [1, [2, {}]]}},
+   -12.5e-3 , 1234567890123 , 0.5 , 1E+2 , true , false , null , "" , [] , {} ,
+   "\/\b\f\rA" ]
+'''
+
+
+@pytest.mark.parametrize('chunk_size', list(range(1, 40)) + [1 << 16])
+def test_elements_survive_every_chunk_boundary(chunk_size):
+  assert list(iter_json_array(io.StringIO(DOCUMENT), chunk_size)) == json.loads(DOCUMENT)
+
+
+@pytest.mark.parametrize('text', ['[]', ' [ ] ', '[\n]'])
+def test_empty_arrays(text):
+  assert list(iter_json_array(io.StringIO(text), 1)) == []
+
+
+@pytest.mark.parametrize('text', ['{"a": 1}', '', '1'])
+def test_rejects_non_arrays(text):
+  with pytest.raises(ValueError):
+    list(iter_json_array(io.StringIO(text)))
+
+
+@pytest.mark.parametrize('text', ['[1, 2', '[1 2]', '[{"a": 1}, {"b": ', '["unterminated]'])
+def test_rejects_malformed_arrays(text):
+  for chunk_size in (1, 3, 1 << 16):
+    with pytest.raises(ValueError):
+      list(iter_json_array(io.StringIO(text), chunk_size))
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from latency import LatencyHistogram, RequestStats
+
+
+def test_values_in_and_out_are_seconds():
+  histogram = LatencyHistogram()
+  for ms in range(1, 1001):
+    histogram.record(ms / 1e3)
+  assert histogram.count == 1000
+  assert histogram.min == pytest.approx(0.001)
+  assert histogram.max == pytest.approx(1.0)
+  assert histogram.mean() == pytest.approx(0.5005)
+  for percentile in (50, 90, 99):
+    assert histogram.percentile(percentile) == pytest.approx(percentile / 100.0, rel=1 / 64)
+
+
+def test_merge_matches_recording_into_one():
+  one, left, right = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+  for i in range(500):
+    seconds = (i * 37 % 1000) * 1e-5
+    one.record(seconds)
+    (left if i % 2 else right).record(seconds)
+  left.merge(right)
+  assert (left.counts, left.count, left.min, left.max) == (one.counts, one.count, one.min,
+                                                           one.max)
+  assert left.mean() == one.mean()
+
+
+def test_empty_histogram_reports_zero():
+  histogram = LatencyHistogram()
+  assert (histogram.percentile(99), histogram.mean(), histogram.min, histogram.max) == (0, 0, 0, 0)
+
+
+def test_request_stats_json_is_in_seconds(tmp_path):
+  stats = RequestStats()
+  stats.record('/follow', 0.002)
+  stats.record('/follow', 0.004)
+  path = tmp_path / 'stats.json'
+  stats.dump_json(str(path))
+  follow = json.loads(path.read_text())['endpoints']['/follow']
+  assert follow['count'] == 2
+  assert follow['max_s'] == pytest.approx(0.004)
+  assert follow['percentiles_s']['50.0'] == pytest.approx(0.002, rel=1 / 64)
+  assert sum(count for _, count in follow['buckets']) == 2
@@ -0,0 +1,106 @@
+import struct
+from array import array
+
+import pytest
+from thrift.Thrift import TType
+from thrift.protocol import TBinaryProtocol
+from thrift.protocol.TProtocol import TProtocolException
+from thrift.transport import TTransport
+
+from social_network.PostStorageService import ReadPosts_result
+from social_network.ttypes import Creator, Media, Post, Url, UserMention
+from thriftkit.fastdecode import LAZY_MIN_LENGTH, LazyStructList, decoder_for
+
+
+def make_post(i):
+  return Post(post_id=1000 + i, creator=Creator(user_id=i, username='user_%d' % i),
+              req_id=i << 40, text='post %d ' % i * (LAZY_MIN_LENGTH if i % 2 else 1),
+              user_mentions=[UserMention(user_id=i + 1, username='user_%d' % (i + 1))],
+              media=[Media(media_id=i, media_type='png')] * (i % 3),
+              urls=[Url(shortened_url='s/%d' % i, expanded_url='e/%d' % i)],
+              timestamp=1600000000 + i, post_type=i % 4)
+
+
+POSTS = [make_post(i) for i in range(7)]
+
+
+def encode(value):
+  buf = TTransport.TMemoryBuffer()
+  value.write(TBinaryProtocol.TBinaryProtocol(buf))
+  return buf.getvalue()
+
+
+def decode_posts(posts, lazy=False):
+  data = encode(ReadPosts_result(success=posts))
+  result, end = decoder_for(ReadPosts_result, lazy, True)(data, 0, None)
+  assert end == len(data)
+  return result.success
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_sequence_protocol(lazy):
+  posts = decode_posts(POSTS, lazy)
+  assert isinstance(posts, LazyStructList)
+  assert posts.element_cls is Post
+  assert len(posts) == len(POSTS)
+  assert posts[0] == POSTS[0] and posts[-1] == POSTS[-1]
+  assert posts[1:6:2] == POSTS[1:6:2]
+  assert posts[::-1] == POSTS[::-1]
+  assert posts[10:] == []
+  assert list(posts) == POSTS
+  assert POSTS[3] in posts and posts.index(POSTS[3]) == 3
+  with pytest.raises(IndexError):
+    posts[len(POSTS)]
+  # Each element is decoded once and then kept.
+  assert posts[2] is posts[2]
+
+
+def test_equality():
+  posts = decode_posts(POSTS)
+  assert posts == POSTS and POSTS == posts
+  assert posts == decode_posts(POSTS, lazy=True)
+  assert posts != POSTS[:-1]
+  assert posts != POSTS[:-1] + [make_post(99)]
+  assert posts != tuple(POSTS)
+  assert decode_posts([]) == []
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+@pytest.mark.parametrize('name', [spec[2] for spec in Post.thrift_spec if spec])
+def test_field_matches_decoded_elements(lazy, name):
+  posts = decode_posts(POSTS, lazy)
+  expected = [getattr(post, name) for post in POSTS]
+  assert posts.field(name) == expected
+  # Elements already decoded are read from, not re-parsed.
+  posts[1], posts[4]
+  assert posts.field(name) == expected
+
+
+def test_field_of_missing_and_unknown_fields():
+  posts = decode_posts([Post(post_id=1), Post(post_id=2, text='two')])
+  assert posts.field('text') == [None, 'two']
+  assert posts.field('timestamp') == [None, None]
+  with pytest.raises(ValueError):
+    posts.field('no_such_field')
+
+
+def bad_text(n):
+  """A Post whose text claims `n` bytes, followed by a few stop bytes."""
+  return (struct.pack('!bhq', TType.I64, 1, 7) + struct.pack('!bhi', TType.STRING, 4, n) +
+          b'\0' * 8)
+
+
+@pytest.mark.parametrize('n, error', [(-9, TProtocolException.NEGATIVE_SIZE),
+                                      (99, TProtocolException.SIZE_LIMIT)])
+def test_bad_sizes_are_rejected(n, error):
+  # Building the view walks every element.
+  data = (struct.pack('!bhbi', TType.LIST, 0, TType.STRUCT, 2) + encode(POSTS[0]) +
+          bad_text(n) + b'\0')
+  with pytest.raises(TProtocolException) as info:
+    decoder_for(ReadPosts_result, False, True)(data, 0, None)
+  assert info.value.type == error
+  # field() reads the element itself.
+  posts = LazyStructList(bad_text(n), array('q', [0]), decoder_for(Post), Post)
+  with pytest.raises(TProtocolException) as info:
+    posts.field('text')
+  assert info.value.type == error
@@ -0,0 +1,17 @@
+import os
+import shutil
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def test_seeding_script_imports_from_the_loader_scripts_directory(tmp_path):
+  # Dockerfile-loader copies socialNetwork/scripts and nothing else from
+  # this repository; the seeding script must run from that copy alone.
+  scripts = tmp_path / 'scripts'
+  shutil.copytree(os.path.join(ROOT, 'socialNetwork', 'scripts'), scripts,
+                  ignore=shutil.ignore_patterns('__pycache__'))
+  env = {key: value for key, value in os.environ.items() if key != 'PYTHONPATH'}
+  subprocess.run([sys.executable, str(scripts / 'init_social_graph.py'), '--help'],
+                 cwd=tmp_path, env=env, check=True, capture_output=True)
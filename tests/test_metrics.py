@@ -0,0 +1,121 @@
+import threading
+import types
+import urllib.error
+import urllib.request
+
+import pytest
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+import media_service.UniqueIdService
+import social_network.UniqueIdService
+from thriftkit import metrics
+from thriftkit.calls import encode_call
+
+LABELS = ('destination_service_name="unique-id-service",request_operation="%s",'
+          'request_protocol="thrift"')
+
+
+class SocialHandler:
+  def ComposeUniqueId(self, req_id, post_type, carrier):
+    return req_id
+
+
+class MediaHandler:
+  def UploadUniqueId(self, req_id, carrier):
+    pass
+
+
+def process(processor, service, name, *args):
+  payload = encode_call(service, name, 1, args, {})[4:]
+  processor.process(TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer(payload)),
+                    TBinaryProtocol.TBinaryProtocol(TTransport.TMemoryBuffer()))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  """Replaces the clock thriftkit.metrics reads with scripted readings, in
+  seconds; set `clock.readings` before each request."""
+  fake = types.SimpleNamespace(readings=[])
+  fake.perf_counter = lambda: fake.readings.pop(0)
+  monkeypatch.setattr(metrics, 'time', fake)
+  return fake
+
+
+def test_bucket_bounds_are_inclusive():
+  histogram = metrics._Histogram((1, 5))
+  for ms in (0, 1, 1.0001, 5, 7):
+    histogram.record(ms)
+  assert histogram.counts == [2, 2, 1]
+  assert histogram.sum == 14.0001
+
+
+def test_exposition(clock):
+  registry = metrics.ProcessorMetrics(buckets=(10, 1, 5))
+  processor = registry.instrument(
+      social_network.UniqueIdService.Processor(SocialHandler()), 'unique-id-service')
+  # process() entered, header read, handler entered and left, reply flushed
+  clock.readings = [0.0, 0.001, 0.003, 0.008, 0.010]
+  process(processor, social_network.UniqueIdService, 'ComposeUniqueId', 7, 0, {})
+  assert clock.readings == []
+
+  text = registry.exposition()
+  assert text.endswith('\n')
+  lines = text.splitlines()
+  labels = LABELS % 'ComposeUniqueId'
+  assert '# TYPE thrift_requests_total counter' in lines
+  assert 'thrift_requests_total{%s} 1' % labels in lines
+  assert '# TYPE thrift_request_duration_milliseconds histogram' in lines
+  total = [line for line in lines if line.startswith('thrift_request_duration_milliseconds')]
+  assert total[:4] == ['thrift_request_duration_milliseconds_bucket{%s,le="%s"} %d' % (
+      labels, le, count) for le, count in (('1', 0), ('5', 0), ('10', 1), ('+Inf', 1))]
+  assert total[4].startswith('thrift_request_duration_milliseconds_sum{%s} 9.0' % labels)
+  assert total[5] == 'thrift_request_duration_milliseconds_count{%s} 1' % labels
+  # decode 2 ms, handler 5 ms (on a bound, so in le="5"), encode 2 ms
+  for phase in metrics.PHASES:
+    assert ('thrift_request_phase_duration_milliseconds_bucket{%s,phase="%s",le="5"} 1' % (
+        labels, phase)) in lines
+    assert ('thrift_request_phase_duration_milliseconds_bucket{%s,phase="%s",le="1"} 0' % (
+        labels, phase)) in lines
+
+
+def test_processors_without_the_hook_time_decode_from_process(clock):
+  registry = metrics.ProcessorMetrics(buckets=(1, 5))
+  processor = registry.instrument(
+      media_service.UniqueIdService.Processor(MediaHandler()), 'unique-id-service')
+  clock.readings = [0.0, 0.002, 0.004, 0.005]
+  process(processor, media_service.UniqueIdService, 'UploadUniqueId', 7, {})
+  (key, times), = registry.snapshot().items()
+  assert key == ('unique-id-service', 'UploadUniqueId')
+  decode, handler, encode = times.phases
+  assert (decode.counts, handler.counts, encode.counts) == ([0, 1, 0], [0, 1, 0], [1, 0, 0])
+  assert times.total.sum == pytest.approx(5.0)
+
+
+def test_threads_are_summed_and_served():
+  registry = metrics.ProcessorMetrics()
+  processor = registry.instrument(
+      social_network.UniqueIdService.Processor(SocialHandler()), 'unique-id-service')
+
+  def run():
+    for req_id in range(50):
+      process(processor, social_network.UniqueIdService, 'ComposeUniqueId', req_id, 0, {})
+
+  threads = [threading.Thread(target=run) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  server = registry.serve('127.0.0.1', 0)
+  try:
+    base = 'http://127.0.0.1:%d' % server.server_address[1]
+    with urllib.request.urlopen(base + '/metrics', timeout=5) as response:
+      assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+      text = response.read().decode()
+    with pytest.raises(urllib.error.HTTPError) as raised:
+      urllib.request.urlopen(base + '/other', timeout=5)
+    assert raised.value.code == 404
+  finally:
+    server.shutdown()
+    server.server_close()
+  assert 'thrift_requests_total{%s} 200' % (LABELS % 'ComposeUniqueId') in text.splitlines()
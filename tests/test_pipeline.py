@@ -0,0 +1,24 @@
+import pytest
+from thrift.transport.TTransport import TTransportException
+
+from social_network import UniqueIdService
+from thriftkit.pipeline import pipeline_class
+
+BAD_FRAME = (2).to_bytes(4, 'big') + b'ab'  # too short for a message header
+
+
+@pytest.mark.parametrize('reply, error_type', [(None, TTransportException.END_OF_FILE),
+                                                (BAD_FRAME, TTransportException.UNKNOWN)])
+def test_submit_fails_fast_after_reader_stops(serve_once, reply, error_type):
+  client = pipeline_class(UniqueIdService)('127.0.0.1', serve_once(reply), timeout=5).open()
+  try:
+    with pytest.raises(TTransportException) as first:
+      client.ComposeUniqueId(1, 0, {})
+    assert first.value.type == error_type
+    client._reader.join(5)
+    with pytest.raises(TTransportException) as second:
+      client.submit('ComposeUniqueId', 2, 0, {})
+    assert second.value.type == error_type
+    assert client.in_flight() == 0
+  finally:
+    client.close()
@@ -0,0 +1,113 @@
+import socket
+import time
+
+import pytest
+
+from social_network import UniqueIdService
+from social_network.ttypes import ErrorCode, ServiceException
+from thriftkit.pool import ClientPool, PoolManager
+from thriftkit.server import ThriftServer
+
+# Test ports stay below the ephemeral range.
+PORT = 22905
+
+
+class Handler:
+  def ComposeUniqueId(self, req_id, post_type, carrier):
+    if req_id < 0:
+      raise ServiceException(errorCode=ErrorCode.SE_THRIFT_HANDLER_ERROR, message='negative')
+    return req_id
+
+
+@pytest.fixture(scope='module')
+def server():
+  server = ThriftServer(UniqueIdService.Processor(Handler()), '127.0.0.1', PORT,
+                        workers=8).start()
+  yield server
+  server.stop()
+
+
+@pytest.fixture
+def make_pool(server):
+  pools = []
+
+  def make(**kwargs):
+    pools.append(ClientPool(UniqueIdService, '127.0.0.1', PORT, timeout=5, **kwargs))
+    return pools[-1]
+
+  yield make
+  for pool in pools:
+    pool.close()
+
+
+def call(pool, req_id=1):
+  with pool.client() as client:
+    return client.ComposeUniqueId(req_id, 0, {})
+
+
+def counts(pool):
+  return pool.created, pool.reused, pool.evicted
+
+
+def test_connections_are_reused(make_pool):
+  pool = make_pool()
+  assert [call(pool, i) for i in range(5)] == list(range(5))
+  assert counts(pool) == (1, 4, 0)
+
+
+def test_idle_connections_beyond_max_idle_are_closed(make_pool):
+  pool = make_pool(max_idle=2)
+  with pool.client() as a, pool.client() as b, pool.client() as c:
+    assert [a.ComposeUniqueId(1, 0, {}), b.ComposeUniqueId(2, 0, {}),
+            c.ComposeUniqueId(3, 0, {})] == [1, 2, 3]
+  assert counts(pool) == (3, 0, 1)
+  assert len(pool._idle) == 2
+
+
+@pytest.mark.parametrize('setting', ['idle_timeout', 'max_lifetime'])
+def test_expired_connections_are_replaced(make_pool, setting):
+  pool = make_pool(**{setting: 0.05})
+  call(pool)
+  time.sleep(0.1)
+  call(pool)
+  assert counts(pool) == (2, 0, 1)
+
+
+def test_connections_closed_by_the_peer_are_replaced(make_pool):
+  pool = make_pool()
+  call(pool)
+  pool._idle[0].socket.handle.shutdown(socket.SHUT_RD)  # reads now see EOF
+  assert call(pool, 7) == 7
+  assert counts(pool) == (2, 0, 1)
+
+
+def test_declared_exceptions_keep_the_connection(make_pool):
+  pool = make_pool()
+  with pytest.raises(ServiceException):
+    call(pool, -1)
+  assert call(pool) == 1
+  assert counts(pool) == (1, 1, 0)
+
+
+def test_other_errors_close_the_connection(make_pool):
+  pool = make_pool()
+  with pytest.raises(RuntimeError):
+    with pool.client() as client:
+      client.send_ComposeUniqueId(1, 0, {})
+      raise RuntimeError('gave up before the reply')
+  # The unread reply went with the connection; the next call gets its own.
+  assert call(pool, 2) == 2
+  assert counts(pool) == (2, 0, 1)
+
+
+def test_manager_keeps_one_pool_per_endpoint(server):
+  manager = PoolManager(max_idle=1)
+  try:
+    pool = manager.get(UniqueIdService, '127.0.0.1', PORT)
+    assert manager.get(UniqueIdService, '127.0.0.1', PORT) is pool
+    assert pool.max_idle == 1
+    with manager.client(UniqueIdService, '127.0.0.1', PORT) as client:
+      assert client.ComposeUniqueId(3, 0, {}) == 3
+  finally:
+    manager.close()
+  assert pool._idle == []
@@ -0,0 +1,47 @@
+import json
+import re
+
+import pytest
+
+import post_generator
+from post_generator import MAX_ITEMS, PostGenerator
+
+POST_RE = re.compile(r'[a-zA-Z0-9]{256}((?: @username_\d+)*)((?: http://[a-z0-9]{64})*)')
+
+
+@pytest.fixture(params=['numpy', 'random'])
+def backend(request, monkeypatch):
+  if request.param == 'random':
+    monkeypatch.setattr(post_generator, 'np', None)
+  elif post_generator.np is None:
+    pytest.skip('numpy is not installed')
+  return request.param
+
+
+def posts(count, **kwargs):
+  generator = PostGenerator(**kwargs)
+  return [generator.next_post() for _ in range(count)]
+
+
+def test_same_seed_same_posts(backend):
+  first = posts(50, num_users=100, seed=7, batch_size=16)
+  assert first == posts(50, num_users=100, seed=7, batch_size=16)
+  assert first != posts(50, num_users=100, seed=8, batch_size=16)
+  assert len(set(first)) == 50
+
+
+def test_posts_have_the_compose_post_shape(backend):
+  counts = set()
+  for text, media_ids, media_types in posts(300, num_users=9, batch_size=64):
+    match = POST_RE.fullmatch(text)
+    assert match, text
+    mentions = [int(user) for user in re.findall(r'@username_(\d+)', match.group(1))]
+    urls = match.group(2).split()
+    assert all(0 <= user <= 9 for user in mentions)
+    media_ids, media_types = json.loads(media_ids), json.loads(media_types)
+    assert all(re.fullmatch(r'\d{18}', media_id) for media_id in media_ids)
+    assert media_types == ['png'] * len(media_ids)
+    counts.add((len(mentions), len(urls), len(media_ids)))
+  # Every count from 0 to MAX_ITEMS turns up for each kind.
+  for kind in range(3):
+    assert {count[kind] for count in counts} == set(range(MAX_ITEMS + 1))
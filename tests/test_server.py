@@ -0,0 +1,56 @@
+import socket
+import struct
+
+import pytest
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TSocket, TTransport
+
+from social_network import UniqueIdService
+from thriftkit.server import ThriftServer
+
+# Test ports stay below the ephemeral range.
+PORTS = {'threads': 22901, 'asyncio': 22902}
+
+
+class Handler:
+  def ComposeUniqueId(self, req_id, post_type, carrier):
+    return req_id + 1
+
+
+def call_header(name):
+  return struct.pack('!ii', TBinaryProtocol.TBinaryProtocol.VERSION_1 | 1, len(name)) + (
+      name.encode() + struct.pack('!i', 7))
+
+
+BAD_FRAMES = {
+    'truncated_header': b'\x80\x01',
+    'truncated_args': call_header('ComposeUniqueId') + struct.pack('!bh', 10, 1) + b'\0\0',
+    'unknown_field_type': call_header('ComposeUniqueId') + b'\x63\x00\x01' + b'\0' * 8,
+}
+
+
+@pytest.fixture(params=sorted(PORTS))
+def server(request):
+  server = ThriftServer(UniqueIdService.Processor(Handler()), '127.0.0.1', PORTS[request.param],
+                        mode=request.param, workers=2).start()
+  yield server
+  server.stop()
+
+
+def compose_unique_id(port, req_id):
+  transport = TTransport.TFramedTransport(TSocket.TSocket('127.0.0.1', port))
+  client = UniqueIdService.Client(TBinaryProtocol.TBinaryProtocol(transport))
+  transport.open()
+  try:
+    return client.ComposeUniqueId(req_id, 0, {})
+  finally:
+    transport.close()
+
+
+@pytest.mark.parametrize('frame', list(BAD_FRAMES.values()), ids=list(BAD_FRAMES))
+def test_bad_request_closes_the_connection(server, frame):
+  with socket.create_connection(('127.0.0.1', server.port), timeout=5) as sock:
+    sock.sendall(struct.pack('!i', len(frame)) + frame)
+    assert sock.recv(4096) == b''
+  # The server goes on serving other connections.
+  assert compose_unique_id(server.port, 41) == 42
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from social_graph import CSRGraph, convert_to_csr, iter_edge_batches, iter_edges
+from social_graph import open_graph_edges
+
+EDGES = b'''% a comment
+1 2
+1 3
+
+# another comment
+2 3 0.5
+10 1
+3 4'''
+
+
+def reference_edges(data):
+  edges = []
+  for line in data.splitlines():
+    fields = line.split()
+    if len(fields) >= 2 and not line.startswith((b'%', b'#')):
+      edges.append((int(fields[0]), int(fields[1])))
+  return edges
+
+
+@pytest.mark.parametrize('data', [EDGES, EDGES + b'\n', b'1 2\n3 4\n5 6\n', b'1 2'],
+                         ids=['mixed', 'trailing_newline', 'plain', 'one_line'])
+def test_every_chunk_size_yields_the_same_edges(tmp_path, data):
+  path = tmp_path / 'graph.edges'
+  path.write_bytes(data)
+  expected = reference_edges(data)
+  for chunk_size in range(1, len(data) + 2):
+    assert list(iter_edges(str(path), chunk_size)) == expected, chunk_size
+
+
+def test_batches_are_bounded_by_the_chunk_size(tmp_path):
+  path = tmp_path / 'graph.edges'
+  path.write_bytes(b''.join(b'%d %d\n' % (i, i + 1) for i in range(1000)))
+  batches = list(iter_edge_batches(str(path), chunk_size=64))
+  assert len(batches) > 10
+  assert all(batch.typecode == 'I' and len(batch) <= 2 * 16 for batch in batches)
+  assert [n for batch in batches for n in batch] == [n for i in range(1000) for n in (i, i + 1)]
+
+
+def test_empty_file_has_no_edges(tmp_path):
+  path = tmp_path / 'graph.edges'
+  path.write_bytes(b'')
+  assert list(iter_edges(str(path))) == []
+
+
+def test_csr_round_trip(tmp_path):
+  path = tmp_path / 'graph.edges'
+  path.write_bytes(EDGES)
+  out = convert_to_csr(str(path), num_nodes=12, chunk_size=8)
+  assert out == str(tmp_path / 'graph.csr')
+  edges = reference_edges(EDGES)
+  with CSRGraph(out) as graph:
+    assert (graph.num_nodes, graph.num_edges) == (12, len(edges))
+    assert list(graph.neighbors_of(1)) == [2, 3]
+    assert list(graph.neighbors_of(10)) == [1]
+    assert [graph.degree(node) for node in range(12)] == [0, 2, 1, 1] + [0] * 6 + [1, 0]
+    assert list(graph.neighbors_of(11)) == []
+    # Grouped by source, in file order within a source.
+    assert list(graph.edges()) == sorted(edges, key=lambda edge: edge[0])
+
+
+def test_csr_node_count_covers_the_largest_id(tmp_path):
+  path = tmp_path / 'graph.edges'
+  path.write_bytes(b'0 7\n')
+  with CSRGraph(convert_to_csr(str(path), num_nodes=3)) as graph:
+    assert graph.num_nodes == 8
+    assert list(graph.edges()) == [(0, 7)]
+
+
+def test_csr_of_an_empty_edge_list(tmp_path):
+  path = tmp_path / 'graph.edges'
+  path.write_bytes(b'% no edges\n')
+  with CSRGraph(convert_to_csr(str(path), num_nodes=4)) as graph:
+    assert (graph.num_nodes, graph.num_edges) == (4, 0)
+    assert list(graph.edges()) == []
+
+
+def test_other_files_are_not_opened_as_csr(tmp_path):
+  path = tmp_path / 'graph.edges'
+  path.write_bytes(EDGES)
+  with pytest.raises(ValueError):
+    CSRGraph(str(path))
+
+
+def test_stale_csr_files_are_ignored(tmp_path):
+  path = tmp_path / 'graph.edges'
+  path.write_bytes(b'1 2\n')
+  out = convert_to_csr(str(path))
+  assert list(open_graph_edges(str(path))) == [(1, 2)]
+  path.write_bytes(b'1 2\n2 3\n')
+  stat = os.stat(out)
+  os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+  assert list(open_graph_edges(str(path))) == [(1, 2), (2, 3)]
+  assert list(open_graph_edges(str(path), use_csr=True)) == [(1, 2)]
@@ -0,0 +1,158 @@
+import http.client
+import json
+import threading
+
+import pytest
+from social_network.ttypes import PostType
+
+import standin_cluster
+import standin_services
+
+# More bench threads than the clusters have workers: a handler that parked
+# a pool thread on work queued behind it would hang the bench. Test ports
+# stay below the ephemeral range.
+WORKERS = 4
+CONCURRENCY = 32
+MEDIA_PORTS = {name: port + 20000 for name, port in standin_cluster.PORTS.items()}
+SOCIAL_PORTS = {name: port + 21000 for name, port in standin_services.PORTS.items()}
+HTTP_PORT = 20080
+
+
+def run_bench(bench, *args, timeout=120):
+  errors = []
+
+  def target():
+    try:
+      bench(*args)
+    except Exception as e:
+      errors.append(e)
+
+  thread = threading.Thread(target=target, daemon=True)
+  thread.start()
+  thread.join(timeout)
+  assert not thread.is_alive(), 'bench did not finish in %ds' % timeout
+  assert not errors, errors
+
+
+def test_media_bench_with_more_clients_than_workers():
+  cluster = standin_cluster.StandInCluster(ports=MEDIA_PORTS, workers=WORKERS,
+                                           service_time=0.001).start()
+  try:
+    run_bench(standin_cluster.bench, cluster, 50, 20, 200, CONCURRENCY)
+  finally:
+    cluster.stop()
+  assert cluster.handlers['compose-review-service'].composed == 200
+
+
+def test_social_bench_with_more_clients_than_workers():
+  cluster = standin_services.StandInCluster(ports=SOCIAL_PORTS, workers=WORKERS,
+                                            service_time=0.001).start()
+  cluster.seed(50, 5)
+  try:
+    run_bench(standin_services.bench, cluster, 50, 200, CONCURRENCY)
+  finally:
+    cluster.stop()
+
+
+MOVIE_INFO = {'movie_id': 'm1', 'title': 'Title', 'casts': [], 'plot_id': 1,
+              'thumbnail_ids': [], 'photo_ids': [], 'video_ids': [], 'avg_rating': 7.5,
+              'num_rating': 2}
+
+
+@pytest.fixture(scope='module')
+def media_front():
+  cluster = standin_cluster.StandInCluster(ports=MEDIA_PORTS, workers=WORKERS).start()
+  front = standin_cluster.WrkApiFront(cluster, port=HTTP_PORT).start()
+  yield cluster
+  front.stop()
+  cluster.stop()
+
+
+def post(path, body):
+  connection = http.client.HTTPConnection('127.0.0.1', HTTP_PORT, timeout=10)
+  try:
+    connection.request('POST', path, body=json.dumps(body))
+    response = connection.getresponse()
+    return response.status, response.read().decode()
+  finally:
+    connection.close()
+
+
+@pytest.mark.parametrize('path, body', [
+    ('/wrk2-api/movie-info/write', ['not a record']),
+    ('/wrk2-api/movie-info/write', dict(MOVIE_INFO, casts=[1, 2])),
+    ('/wrk2-api/movie-info/write', dict(MOVIE_INFO, avg_rating=[7.5])),
+    ('/wrk2-api/cast-info/write-batch', 'text'),
+], ids=['list_of_strings', 'casts_not_objects', 'rating_not_a_number', 'string'])
+def test_malformed_json_is_a_bad_request(media_front, path, body):
+  status, text = post(path, body)
+  assert status == 400, text
+  assert post('/wrk2-api/plot/write', {'plot_id': 1, 'plot': 'plot'}) == (200, '')
+
+
+def test_movie_info_writes_reply_like_the_lua_scripts(media_front):
+  assert post('/wrk2-api/movie-info/write', MOVIE_INFO) == (200, '')
+  batch = [dict(MOVIE_INFO, movie_id='m%d' % i) for i in range(2, 5)]
+  assert post('/wrk2-api/movie-info/write-batch', batch) == (200, '3\n')
+  assert set(media_front.handlers['movie-info-service'].movie_infos) == {'m1', 'm2', 'm3', 'm4'}
+
+
+def test_service_time_options_match_across_clusters():
+  for module in (standin_cluster, standin_services):
+    cluster = module.StandInCluster(service_time=0.002, distribution='lognormal', sigma=0.0,
+                                    service_times={'user-service': 0.001})
+    assert module.DISTRIBUTIONS == ('constant', 'exponential', 'lognormal')
+    assert cluster.service_time == 0.002 and cluster.service_times == {'user-service': 0.001}
+    with pytest.raises(ValueError):
+      module.StandInCluster(distribution='exp')
+
+
+@pytest.fixture
+def social():
+  cluster = standin_services.StandInCluster(ports=SOCIAL_PORTS, workers=WORKERS).start()
+  cluster.seed(10, 3)  # user u is followed by u + 1 .. u + 3
+  yield cluster
+  cluster.stop()
+
+
+def social_call(cluster, name, method, *args):
+  with cluster.client(name) as client:
+    return getattr(client, method)(*args)
+
+
+def home_timeline(cluster, user_id):
+  return [post.post_id for post in social_call(
+      cluster, 'home-timeline-service', 'ReadHomeTimeline', 0, user_id, 0, 10, {})]
+
+
+def test_compose_post_fans_out_to_followers_and_mentions(social):
+  assert social_call(social, 'social-graph-service', 'GetFollowers', 0, 2, {}) == [3, 4, 5]
+  text = 'hello @username_7 see http://example.com'
+  social_call(social, 'compose-post-service', 'ComposePost', 1, 'username_2', 2, text,
+              [11], ['png'], PostType.POST, {})
+  post, = social_call(social, 'user-timeline-service', 'ReadUserTimeline', 0, 2, 0, 10, {})
+  assert post.creator.user_id == 2 and post.creator.username == 'username_2'
+  assert [mention.user_id for mention in post.user_mentions] == [7]
+  assert [(media.media_id, media.media_type) for media in post.media] == [(11, 'png')]
+  url, = post.urls
+  assert url.expanded_url == 'http://example.com'
+  assert post.text == 'hello @username_7 see ' + url.shortened_url
+  assert social_call(social, 'url-shorten-service', 'GetExtendedUrls', 0,
+                     [url.shortened_url], {}) == ['http://example.com']
+  # Followers and the mentioned user get it; nobody else does.
+  assert {user_id for user_id in range(10) if home_timeline(social, user_id)} == {3, 4, 5, 7}
+
+
+def test_timelines_are_newest_first_and_follow_changes(social):
+  social_call(social, 'social-graph-service', 'FollowWithUsername', 0, 'username_9',
+              'username_2', {})
+  assert social_call(social, 'social-graph-service', 'GetFollowers', 0, 2, {}) == [3, 4, 5, 9]
+  for req_id in range(3):
+    social_call(social, 'compose-post-service', 'ComposePost', req_id, 'username_2', 2,
+                'post %d' % req_id, [], [], PostType.POST, {})
+  post_ids = list(social.handlers['post-storage-service'].posts)  # in compose order
+  assert home_timeline(social, 9) == post_ids[::-1]
+  assert home_timeline(social, 3) == post_ids[::-1]
+  social_call(social, 'social-graph-service', 'UnfollowWithUsername', 0, 'username_9',
+              'username_2', {})
+  assert social_call(social, 'social-graph-service', 'GetFollowers', 0, 2, {}) == [3, 4, 5]
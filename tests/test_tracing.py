@@ -0,0 +1,153 @@
+import gc
+import os
+import signal
+import socket
+import time
+
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TSocket, TTransport
+
+from social_network import UniqueIdService
+from thriftkit import ThriftServer, Tracer, read_spans, traced_class
+from thriftkit import tracing
+from thriftkit.tracing import CLIENT, SERVER
+
+
+class UniqueIds:
+  def __init__(self):
+    self.seen = []
+
+  def ComposeUniqueId(self, req_id, post_type, carrier):
+    self.seen.append((dict(carrier), tracing.current_span()))
+    return req_id
+
+
+def test_client_and_server_spans_join(tmp_path):
+  tracer = Tracer(str(tmp_path / 'spans-{pid}.bin'), propagation=('w3c', 'jaeger'))
+  handler = UniqueIds()
+  processor = tracer.instrument(UniqueIdService.Processor(handler), 'unique-id-service')
+  client = traced_class(UniqueIdService)(processor._handler, tracer)
+  assert client.ComposeUniqueId(7, 0, {}) == 7
+  tracer.close()
+
+  (carrier, current), = handler.seen
+  server, client_span = sorted(read_spans(tracer.log_path), key=lambda span: span.kind,
+                               reverse=True)
+  assert (client_span.kind, server.kind) == (CLIENT, SERVER)
+  assert server.trace_id == client_span.trace_id
+  assert server.parent_id == client_span.span_id
+  assert client_span.parent_id == 0
+  assert carrier['traceparent'] == '00-%032x-%016x-01' % (client_span.trace_id,
+                                                          client_span.span_id)
+  assert carrier['uber-trace-id'] == '%032x:%016x:0:1' % (client_span.trace_id,
+                                                          client_span.span_id)
+  assert current == ('%032x' % server.trace_id, '%016x' % server.span_id, True)
+
+
+class Forwarder:
+  """A handler that makes one downstream call per request."""
+
+  def __init__(self, downstream):
+    self.downstream = downstream
+
+  def ComposeUniqueId(self, req_id, post_type, carrier):
+    return self.downstream.ComposeUniqueId(req_id, post_type, {})
+
+
+def test_downstream_calls_join_the_incoming_trace(tmp_path):
+  tracer = Tracer(str(tmp_path / 'spans-{pid}.bin'), propagation=('w3c', 'jaeger'))
+  leaf = UniqueIds()
+  downstream = traced_class(UniqueIdService)(leaf, tracer, 'leaf')
+  processor = tracer.instrument(UniqueIdService.Processor(Forwarder(downstream)), 'middle')
+  trace_id, caller_id = 0xabc << 64 | 0xdef, 0x1234
+  incoming = {'traceparent': '00-%032x-%016x-01' % (trace_id, caller_id)}
+  assert processor._handler.ComposeUniqueId(3, 0, incoming) == 3
+  tracer.close()
+
+  (carrier, _), = leaf.seen
+  server, client = sorted(read_spans(tracer.log_path), key=lambda span: span.kind,
+                          reverse=True)
+  assert (server.kind, client.kind) == (SERVER, CLIENT)
+  assert server.trace_id == client.trace_id == trace_id
+  assert server.parent_id == caller_id
+  assert client.parent_id == server.span_id
+  assert carrier['traceparent'] == '00-%032x-%016x-01' % (trace_id, client.span_id)
+  assert carrier['uber-trace-id'] == '%032x:%016x:%016x:1' % (trace_id, client.span_id,
+                                                              server.span_id)
+
+
+def test_dropped_tracer_is_collected_and_writes_its_spans(tmp_path):
+  tracer = Tracer(str(tmp_path / 'spans-{pid}.bin'), flush_interval=0.01)
+  with tracer.span('service', 'op'):
+    pass
+  path = tracer.log_path
+  thread = tracer._thread
+  del tracer
+  gc.collect()
+  thread.join(5)
+  assert not thread.is_alive()
+  span, = read_spans(path)
+  assert span.operation == 'op'
+
+
+def test_forked_child_writes_its_own_log(tmp_path):
+  tracer = Tracer(str(tmp_path / 'spans-{pid}.bin'), flush_interval=60)
+  tracer.record(CLIENT, 'parent', 'op', 1, next(tracing._span_ids), 0, 0, 10)
+  read_fd, write_fd = os.pipe()
+  pid = os.fork()
+  if pid == 0:
+    status = 1
+    try:
+      with tracer.span('child', 'op'):
+        pass
+      os.write(write_fd, b'%d' % next(tracing._span_ids))
+      status = 0
+    finally:
+      tracing.close_all()
+      os._exit(status)
+  os.close(write_fd)
+  child_next_id = int(os.read(read_fd, 64))
+  os.close(read_fd)
+  assert os.waitpid(pid, 0)[1] == 0
+  tracer.close()
+
+  child, = read_spans(str(tmp_path / ('spans-%d.bin' % pid)))
+  assert child.service == 'child'
+  parent, = read_spans(tracer.log_path)
+  assert parent.service == 'parent'
+  assert abs(child_next_id - parent.span_id) > 1 << 20  # reseeded, not the parent's sequence
+
+
+def test_prefork_children_flush_on_shutdown(tmp_path):
+  port = 20000 + os.getpid() % 10000
+  pid = os.fork()
+  if pid == 0:
+    status = 1
+    try:
+      tracer = Tracer(str(tmp_path / 'spans-{pid}.bin'), flush_interval=60)
+      processor = tracer.instrument(UniqueIdService.Processor(UniqueIds()), 'unique-id')
+      ThriftServer(processor, '127.0.0.1', port, mode='prefork', processes=2).serve()
+      status = 0
+    finally:
+      os._exit(status)
+
+  deadline = time.monotonic() + 10
+  while True:
+    try:
+      socket.create_connection(('127.0.0.1', port)).close()
+      break
+    except OSError:
+      assert time.monotonic() < deadline
+      time.sleep(0.05)
+  transport = TTransport.TFramedTransport(TSocket.TSocket('127.0.0.1', port))
+  client = UniqueIdService.Client(TBinaryProtocol.TBinaryProtocol(transport))
+  transport.open()
+  for req_id in range(20):
+    assert client.ComposeUniqueId(req_id, 0, {}) == req_id
+  transport.close()
+  os.kill(pid, signal.SIGINT)
+  assert os.waitpid(pid, 0)[1] == 0
+
+  spans = [span for log in tmp_path.iterdir() for span in read_spans(str(log))]
+  assert len(spans) == 20
+  assert {span.operation for span in spans} == {'ComposeUniqueId'}
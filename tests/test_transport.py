@@ -0,0 +1,107 @@
+import socket
+import struct
+
+import pytest
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+from thrift.transport.TTransport import TTransportException
+
+from social_network.PostStorageService import ReadPost_result, ReadPosts_result
+from social_network.ttypes import Creator, Post
+from thriftkit.fastdecode import LAZY_MIN_LENGTH, TBinaryProtocolFastDecode
+from thriftkit.transport import TReusableFramedTransport
+
+
+class SocketEnd:
+  """The parts of TSocket the transport uses, over one end of a socketpair."""
+
+  def __init__(self, handle):
+    self.handle = handle
+
+  def isOpen(self):
+    return self.handle is not None
+
+  def write(self, data):
+    self.handle.sendall(data)
+
+  def flush(self):
+    pass
+
+
+@pytest.fixture
+def pair():
+  ours, theirs = socket.socketpair()
+  with ours, theirs:
+    yield TReusableFramedTransport(SocketEnd(ours), initial_size=256), theirs
+
+
+def frame(value):
+  buf = TTransport.TMemoryBuffer()
+  value.write(TBinaryProtocol.TBinaryProtocol(buf))
+  data = buf.getvalue()
+  return struct.pack('!i', len(data)) + data
+
+
+def post(i, length=LAZY_MIN_LENGTH):
+  return Post(post_id=i, creator=Creator(user_id=i, username='user_%d' % i),
+              text=chr(ord('a') + i) * length)
+
+
+def receive(transport, peer, value, **protocol_kwargs):
+  peer.sendall(frame(value))
+  result = type(value)()
+  result.read(TBinaryProtocolFastDecode(transport, **protocol_kwargs))
+  return result
+
+
+def test_eager_results_reuse_one_buffer(pair):
+  transport, peer = pair
+  buf = transport._buf
+  for i in range(3):
+    assert receive(transport, peer, ReadPost_result(success=post(i))).success == post(i)
+  assert transport._buf is buf
+
+
+@pytest.mark.parametrize('protocol_kwargs, value', [
+    ({'lazy_strings': True}, ReadPost_result(success=post(0))),
+    ({'lazy_lists': True}, ReadPosts_result(success=[post(0), post(1)])),
+], ids=['lazy_string', 'list_view'])
+def test_results_that_read_the_frame_later_pin_it(pair, protocol_kwargs, value):
+  transport, peer = pair
+  buf = transport._buf
+  first = receive(transport, peer, value, **protocol_kwargs)
+  second = receive(transport, peer, ReadPost_result(success=post(5)), **protocol_kwargs)
+  assert transport._buf is not buf  # the next frame did not overwrite the first
+  assert first == value and second.success == post(5)
+  # Once nothing refers into it, the current buffer is reused again.
+  del first, second
+  buf = transport._buf
+  assert receive(transport, peer, ReadPost_result(success=post(6, length=1))).success == \
+      post(6, length=1)
+  assert transport._buf is buf
+
+
+def test_buffer_grows_for_large_frames(pair):
+  transport, peer = pair
+  big = post(1, length=1000)
+  assert receive(transport, peer, ReadPost_result(success=big)).success == big
+  assert len(transport._buf) >= len(frame(ReadPost_result(success=big))) - 4
+
+
+def test_plain_reads_span_frames(pair):
+  transport, peer = pair
+  peer.sendall(struct.pack('!i', 3) + b'abc' + struct.pack('!i', 2) + b'de')
+  assert [transport.read(2), transport.read(2), transport.read(2)] == [b'ab', b'c', b'de']
+
+
+def test_bad_frames(pair):
+  transport, peer = pair
+  peer.sendall(struct.pack('!i', -1))
+  with pytest.raises(TTransportException) as raised:
+    transport.read(1)
+  assert raised.value.type == TTransportException.NEGATIVE_SIZE
+  peer.sendall(struct.pack('!i', 4) + b'ab')
+  peer.shutdown(socket.SHUT_WR)
+  with pytest.raises(TTransportException) as raised:
+    transport.read(1)
+  assert raised.value.type == TTransportException.END_OF_FILE
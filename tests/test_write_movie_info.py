@@ -0,0 +1,113 @@
+import asyncio
+import socket
+
+import pytest
+from aiohttp import web
+
+import write_movie_info
+from latency import RequestStats
+
+
+def raw_cast(cast_id):
+  return {"id": cast_id, "name": "cast %d" % cast_id, "gender": 2, "biography": ""}
+
+
+def raw_movie(movie_id, cast_ids):
+  return {"id": movie_id, "title": "movie %d" % movie_id, "overview": "",
+          "poster_path": "/p.jpg", "vote_average": 7.0, "vote_count": 3,
+          "cast": [{"cast_id": i, "character": "c", "id": cast_id}
+                   for i, cast_id in enumerate(cast_ids)]}
+
+
+async def run_write_all(batch_size, failing_cast):
+  written = set()
+  registered = {}
+
+  async def cast_info(request):
+    records = await request.json()
+    await asyncio.sleep(0.05)  # finishes well after every cast is queued
+    for cast in records if isinstance(records, list) else [records]:
+      if cast["cast_info_id"] == failing_cast:
+        raise web.HTTPInternalServerError()
+      written.add(cast["cast_info_id"])
+    return web.Response(text="Success")
+
+  async def accept(request):
+    return web.Response(text="Success")
+
+  async def register(request):
+    form = await request.post()
+    registered[int(form["movie_id"])] = set(written)
+    return web.Response(text="Success")
+
+  app = web.Application()
+  for path in (write_movie_info.CAST_INFO_PATH, write_movie_info.CAST_INFO_PATH + "-batch"):
+    app.router.add_post(path, cast_info)
+  for path in (write_movie_info.PLOT_PATH, write_movie_info.MOVIE_INFO_PATH):
+    app.router.add_post(path, accept)
+    app.router.add_post(path + "-batch", accept)
+  app.router.add_post(write_movie_info.REGISTER_MOVIE_PATH, register)
+  runner = web.AppRunner(app)
+  await runner.setup()
+  site = web.TCPSite(runner, "127.0.0.1", 0)
+  await site.start()
+  port = site._server.sockets[0].getsockname()[1]
+  try:
+    await write_movie_info.write_all(
+        "http://127.0.0.1:%d" % port, [raw_cast(i) for i in (1, 2, 3)],
+        [raw_movie(10, [1, 2]), raw_movie(11, [3]), raw_movie(12, [1, 99])],
+        RequestStats(), limit=8, batch_size=batch_size)
+  finally:
+    await runner.cleanup()
+  return registered
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_movies_wait_for_written_casts(batch_size):
+  registered = asyncio.run(run_write_all(batch_size, failing_cast=3))
+  # Movie 11 needs the failed cast 3; cast 99 is not in the dataset at all.
+  assert set(registered) == {10, 12}
+  assert {1, 2} <= registered[10]
+  assert 1 in registered[12]
+
+
+async def run_pipelined_against(reply):
+  """write_all in pipeline mode against a server that answers every
+  request with `reply`, or against a closed port when `reply` is None."""
+  async def handle(reader, writer):
+    await reader.read(1 << 16)
+    writer.write(reply)
+    await writer.drain()
+    writer.close()
+
+  if reply is None:
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    server = None
+  else:
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+  try:
+    await write_movie_info.write_all(
+        "http://127.0.0.1:%d" % port, [raw_cast(i) for i in (1, 2)],
+        [raw_movie(10, [1, 2])], RequestStats(), limit=4, batch_size=2,
+        batch_mode="pipeline")
+  finally:
+    if server is not None:
+      server.close()
+      await server.wait_closed()
+
+
+@pytest.mark.parametrize("reply", [
+    b"HTTP/1.1 ???\r\n\r\n",
+    b"HTTP/1.1 200 OK\r\nContent-Length: 9\r\n\r\nshort",
+    None,
+], ids=["bad_status", "short_body", "refused"])
+def test_pipelined_errors_fail_only_their_uploads(reply, capsys):
+  asyncio.run(asyncio.wait_for(run_pipelined_against(reply), 30))
+  out = capsys.readouterr().out
+  # Two casts, the movie info and the plot; the movie is never registered.
+  assert "4 records failed" in out
+  assert "movie 10 not registered" in out
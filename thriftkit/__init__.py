@@ -0,0 +1,20 @@
+"""Client and server tooling shared by the social_network and media_service
+gen-py packages.
+
+Add the repository root to sys.path next to the project's gen-py directory:
+
+  sys.path.append('../gen-py')
+  sys.path.append('../..')
+"""
+
+from .fastdecode import LazyStructList, TBinaryProtocolFastDecode, binary_protocol
+from .pool import ClientPool, PoolManager, get_pool
+from .aio import AsyncClient, client_class, connect
+from .pipeline import PipelinedClient, pipeline_class
+from .transport import TReusableFramedTransport
+from .columnar import POST_COLUMNS, REVIEW_COLUMNS, ColumnBatch
+from .hedge import HedgedClient, hedged_class
+from .cache import CachingClient, LRUCache
+from .server import ThriftServer, ServerStats
+from .metrics import ProcessorMetrics
+from .tracing import Tracer, read_spans, traced_class
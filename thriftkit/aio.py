@@ -0,0 +1,122 @@
+import asyncio
+import functools
+
+from thrift.transport.TTransport import TTransportException
+
+from .calls import decode_reply, encode_call, is_oneway, peek_seqid, service_methods
+
+
+class AsyncClient:
+  """asyncio client for one generated service over one framed connection.
+
+  Calls take the same arguments as the generated Client's and are awaited.
+  Each call gets its own seqid and replies are matched back by seqid, so any
+  number of calls may be in flight on the connection at once. Subclasses are
+  built per service by client_class().
+  """
+
+  service = None
+
+  def __init__(self, host, port, timeout=None):
+    self.host = host
+    self.port = port
+    self.timeout = timeout
+    self._seqid = 0
+    self._pending = {}
+    self._reader = None
+    self._writer = None
+    self._read_task = None
+    self._error = None  # why the reader stopped; later calls fail with it
+
+  async def open(self):
+    self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+    self._error = None
+    self._read_task = asyncio.ensure_future(self._read_loop())
+    return self
+
+  async def close(self):
+    if self._writer is not None:
+      self._writer.close()
+      self._writer = None
+    if self._read_task is not None:
+      self._read_task.cancel()
+      try:
+        await self._read_task
+      except asyncio.CancelledError:
+        pass
+      self._read_task = None
+
+  async def __aenter__(self):
+    return await self.open()
+
+  async def __aexit__(self, exc_type, exc, tb):
+    await self.close()
+
+  def in_flight(self):
+    return len(self._pending)
+
+  async def _call(self, name, args, kwargs):
+    if self._writer is None:
+      raise TTransportException(TTransportException.NOT_OPEN, 'client is not open')
+    if self._error is not None:
+      error = self._error
+      raise TTransportException(error.type, error.message) from error
+    self._seqid = (self._seqid + 1) & 0x7fffffff
+    seqid = self._seqid
+    frame = encode_call(self.service, name, seqid, args, kwargs)
+    if is_oneway(self.service, name):
+      self._writer.write(frame)
+      await self._writer.drain()
+      return None
+    future = asyncio.get_event_loop().create_future()
+    self._pending[seqid] = future
+    try:
+      self._writer.write(frame)
+      await self._writer.drain()
+      payload = await asyncio.wait_for(future, self.timeout)
+    finally:
+      self._pending.pop(seqid, None)
+    return decode_reply(self.service, name, payload)
+
+  async def _read_loop(self):
+    try:
+      while True:
+        size = int.from_bytes(await self._reader.readexactly(4), 'big', signed=True)
+        payload = await self._reader.readexactly(size)
+        future = self._pending.pop(peek_seqid(payload), None)
+        if future is not None and not future.done():
+          future.set_result(payload)
+    except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+      error = TTransportException(TTransportException.END_OF_FILE,
+                                  'connection lost: %s' % e)
+    except asyncio.CancelledError:
+      error = TTransportException(TTransportException.NOT_OPEN, 'client closed')
+    except Exception as e:
+      error = TTransportException(TTransportException.UNKNOWN, 'bad reply frame: %r' % e)
+      error.__cause__ = e
+    self._error = error
+    for future in self._pending.values():
+      if not future.done():
+        future.set_exception(error)
+    self._pending.clear()
+
+
+def _make_method(name, iface_method):
+  async def method(self, *args, **kwargs):
+    return await self._call(name, args, kwargs)
+  return functools.update_wrapper(method, iface_method)
+
+
+@functools.lru_cache(maxsize=None)
+def client_class(service):
+  """Returns the AsyncClient subclass for a generated service module."""
+  methods = {name: _make_method(name, getattr(service.Iface, name))
+             for name in service_methods(service)}
+  methods['service'] = service
+  short_name = service.__name__.rsplit('.', 1)[-1]
+  return type('Async' + short_name + 'Client', (AsyncClient,), methods)
+
+
+async def connect(service, host, port, timeout=None):
+  """Opens an async client, e.g. `await connect(UserTimelineService, host, port)`."""
+  return await client_class(service)(host, port, timeout).open()
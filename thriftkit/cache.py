@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+
+from .fastdecode import materialize
+
+_MISSING = object()
+
+
+class LRUCache:
+  """Thread-safe, size-bounded mapping that evicts the least recently used key.
+  Hits and misses are counted by its users (see CachingClient.stats)."""
+
+  def __init__(self, maxsize=10000):
+    self.maxsize = maxsize
+    self.evictions = 0
+    self._data = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._data)
+
+  def get(self, key, default=None):
+    with self._lock:
+      value = self._data.get(key, _MISSING)
+      if value is _MISSING:
+        return default
+      self._data.move_to_end(key)
+      return value
+
+  def put(self, key, value):
+    with self._lock:
+      self._data[key] = value
+      self._data.move_to_end(key)
+      while len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+        self.evictions += 1
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+
+
+class CachingClient:
+  """Read-through cache in front of a client's immutable reads.
+
+  Posts, plots, cast info and expanded urls never change once written, so
+  ReadPost, ReadPosts, ReadPlot, ReadCastInfo and GetExtendedUrls are
+  answered from `cache` where possible. Batch calls send only the keys that
+  missed, in one call, and return results in request order; ReadPost and
+  ReadPosts share entries. Every other method goes straight to `client`,
+  which may be a generated Client or any of the thriftkit clients.
+
+  Cached results are shared between callers and must not be modified.
+  They are materialized first (see fastdecode.materialize): a result
+  decoded with lazy strings or list views would otherwise keep its whole
+  receive frame alive for as long as it stays cached.
+
+    posts = CachingClient(post_storage_client, maxsize=50000)
+    posts.ReadPosts(req_id, post_ids, {})
+    print(posts.stats())
+  """
+
+  def __init__(self, client, maxsize=10000, cache=None):
+    self.client = client
+    self.cache = LRUCache(maxsize) if cache is None else cache
+    self._counts = {}
+    self._lock = threading.Lock()
+
+  def __getattr__(self, name):
+    return getattr(self.client, name)
+
+  def stats(self):
+    """Returns {kind: {'hits': ..., 'misses': ...}} for posts, plots, etc."""
+    with self._lock:
+      return {kind: {'hits': hits, 'misses': misses}
+              for kind, (hits, misses) in self._counts.items()}
+
+  def _count(self, kind, hits, misses):
+    with self._lock:
+      counts = self._counts.get(kind, (0, 0))
+      self._counts[kind] = (counts[0] + hits, counts[1] + misses)
+
+  def _read_one(self, kind, method, req_id, key, args):
+    value = self.cache.get((kind, key), _MISSING)
+    if value is not _MISSING:
+      self._count(kind, 1, 0)
+      return value
+    self._count(kind, 0, 1)
+    value = materialize(method(req_id, key, *args))
+    self.cache.put((kind, key), value)
+    return value
+
+  def _read_many(self, kind, method, req_id, keys, args, key_of):
+    found = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+      value = self.cache.get((kind, key), _MISSING)
+      if value is _MISSING:
+        missing.append(key)
+      else:
+        found[key] = value
+    self._count(kind, len(found), len(missing))
+    if missing:
+      values = method(req_id, missing, *args)
+      # Positional results line up with the keys; struct results carry
+      # their own id and may leave out keys the service does not have.
+      pairs = zip(missing, values) if key_of is None else \
+          ((key_of(value), value) for value in values)
+      for key, value in pairs:
+        value = materialize(value)
+        self.cache.put((kind, key), value)
+        found[key] = value
+    return [found[key] for key in keys if key in found]
+
+  def ReadPost(self, req_id, post_id, *args):
+    return self._read_one('post', self.client.ReadPost, req_id, post_id, args)
+
+  def ReadPosts(self, req_id, post_ids, *args):
+    return self._read_many('post', self.client.ReadPosts, req_id, post_ids, args,
+                           lambda post: post.post_id)
+
+  def ReadPlot(self, req_id, plot_id, *args):
+    return self._read_one('plot', self.client.ReadPlot, req_id, plot_id, args)
+
+  def ReadCastInfo(self, req_id, cast_ids, *args):
+    return self._read_many('cast_info', self.client.ReadCastInfo, req_id, cast_ids, args,
+                           lambda cast_info: cast_info.cast_info_id)
+
+  def GetExtendedUrls(self, req_id, shortened_urls, *args):
+    return self._read_many('url', self.client.GetExtendedUrls, req_id, shortened_urls,
+                           args, None)
@@ -0,0 +1,81 @@
+import inspect
+import struct
+
+from thrift.Thrift import TApplicationException, TMessageType
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from .fastdecode import binary_protocol
+
+_I32 = struct.Struct('!i')
+_VERSION_MASK = -65536  # 0xffff0000 as a signed i32
+
+
+def service_methods(service):
+  """Returns the RPC names a generated service module defines, in IDL order;
+  those of a service it extends come first."""
+  names = {}
+  for cls in reversed(service.Iface.__mro__):
+    for name, value in vars(cls).items():
+      if inspect.isfunction(value) and not name.startswith('_'):
+        names[name] = None
+  return list(names)
+
+
+def is_oneway(service, name):
+  return not hasattr(service, name + '_result')
+
+
+def encode_call(service, name, seqid, args, kwargs):
+  """Serializes a call to `name` as one framed binary message."""
+  buf = TTransport.TMemoryBuffer()
+  oprot = TBinaryProtocol.TBinaryProtocolAccelerated(buf)
+  message_type = TMessageType.ONEWAY if is_oneway(service, name) else TMessageType.CALL
+  oprot.writeMessageBegin(name, message_type, seqid)
+  getattr(service, name + '_args')(*args, **kwargs).write(oprot)
+  oprot.writeMessageEnd()
+  payload = buf.getvalue()
+  return _I32.pack(len(payload)) + payload
+
+
+def peek_seqid(payload):
+  """Reads the seqid from a binary message header without decoding the body."""
+  version, = _I32.unpack_from(payload, 0)
+  if version & _VERSION_MASK == TBinaryProtocol.TBinaryProtocol.VERSION_1:
+    name_length, = _I32.unpack_from(payload, 4)
+    return _I32.unpack_from(payload, 8 + name_length)[0]
+  # Old non-strict header: name length, name, type byte, seqid.
+  return _I32.unpack_from(payload, 4 + version + 1)[0]
+
+
+def peek_name(payload):
+  """Reads the method name from a binary message header."""
+  version, = _I32.unpack_from(payload, 0)
+  if version & _VERSION_MASK == TBinaryProtocol.TBinaryProtocol.VERSION_1:
+    name_length, = _I32.unpack_from(payload, 4)
+    return payload[8:8 + name_length].decode('utf-8')
+  return payload[4:4 + version].decode('utf-8')
+
+
+def decode_reply(service, name, payload, protocol_class=None):
+  """Decodes the reply to `name`; returns its result or raises its exception."""
+  iprot = (protocol_class or binary_protocol)(TTransport.TMemoryBuffer(payload))
+  _, message_type, _ = iprot.readMessageBegin()
+  if message_type == TMessageType.EXCEPTION:
+    x = TApplicationException()
+    x.read(iprot)
+    iprot.readMessageEnd()
+    raise x
+  result = getattr(service, name + '_result')()
+  result.read(iprot)
+  iprot.readMessageEnd()
+  returns_value = result.thrift_spec[0] is not None
+  if returns_value and result.success is not None:
+    return result.success
+  for field in result.thrift_spec[1:]:
+    if field is not None and getattr(result, field[2]) is not None:
+      raise getattr(result, field[2])
+  if returns_value:
+    raise TApplicationException(TApplicationException.MISSING_RESULT,
+                                "%s failed: unknown result" % name)
+  return None
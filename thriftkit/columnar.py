@@ -0,0 +1,261 @@
+"""Columnar export of list<struct> results.
+
+A column extractor is compiled per (struct, field paths) and walks the
+binary encoding of every element, appending straight into per-column
+buffers without building per-row Python objects:
+
+  * integer, double and bool fields go into array.array buffers;
+  * string fields are concatenated into one bytes buffer with int64 end
+    offsets (Arrow's large_string layout);
+  * list, set and map fields contribute their element count.
+
+Paths name nested fields with dots. Elements missing a field get 0 or an
+empty string.
+
+  protocol = TBinaryProtocolFastDecode(transport, lazy_lists=True)
+  posts = client.ReadHomeTimeline(req_id, user_id, 0, 1000, {})
+  batch = posts.columns(*POST_COLUMNS)
+  df = batch.to_arrow().to_pandas()
+"""
+
+import struct
+from array import array
+
+from thrift.Thrift import TType
+
+from .fastdecode import _FIXED, _I16, _SIZES, _read_size, _skip, _skippers
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+try:
+  import pyarrow as pa
+except ImportError:
+  pa = None
+
+POST_COLUMNS = ('post_id', 'timestamp', 'creator.user_id', 'text',
+                'media', 'urls', 'user_mentions')
+REVIEW_COLUMNS = ('review_id', 'user_id', 'movie_id', 'rating', 'timestamp', 'text')
+
+_CONTAINERS = (TType.LIST, TType.SET, TType.MAP)
+_ARROW_TYPES = {'b': 'int8', 'h': 'int16', 'i': 'int32', 'q': 'int64', 'd': 'float64'}
+
+
+class StringColumn:
+  """A string column: `data` holds every value back to back and value i
+  is data[offsets[i]:offsets[i + 1]]."""
+
+  def __init__(self):
+    self.offsets = array('q', [0])
+    self.data = bytearray()
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, index):
+    return self.data[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+
+class ColumnBatch:
+  """Columns extracted from a list of structs, keyed by column name.
+
+  Container fields are named '<path>_count'.
+  """
+
+  def __init__(self, columns, num_rows):
+    self.columns = columns
+    self.num_rows = num_rows
+
+  def __len__(self):
+    return self.num_rows
+
+  def __getitem__(self, name):
+    return self.columns[name]
+
+  def to_numpy(self):
+    """Returns {name: ndarray}, sharing the column buffers. Bool columns
+    are bool arrays; string columns become (offsets, data) pairs of int64
+    and uint8 arrays."""
+    if np is None:
+      raise ImportError('to_numpy() requires numpy')
+    result = {}
+    for name, column in self.columns.items():
+      if isinstance(column, StringColumn):
+        result[name] = (np.frombuffer(column.offsets, dtype=np.int64),
+                        np.frombuffer(column.data, dtype=np.uint8))
+      elif column.typecode == 'B':
+        result[name] = np.frombuffer(column, dtype=np.bool_)
+      else:
+        result[name] = np.frombuffer(column, dtype=column.typecode)
+    return result
+
+  def to_arrow(self):
+    """Returns a pyarrow.RecordBatch built on the column buffers."""
+    if pa is None:
+      raise ImportError('to_arrow() requires pyarrow')
+    arrays = []
+    for column in self.columns.values():
+      if isinstance(column, StringColumn):
+        arrays.append(pa.Array.from_buffers(
+            pa.large_string(), self.num_rows,
+            [None, pa.py_buffer(column.offsets), pa.py_buffer(column.data)]))
+      elif column.typecode == 'B':
+        arrays.append(pa.array(column, pa.uint8()).cast(pa.bool_()))
+      else:
+        arrays.append(pa.Array.from_buffers(
+            pa.type_for_alias(_ARROW_TYPES[column.typecode]), self.num_rows,
+            [None, pa.py_buffer(column)]))
+    return pa.RecordBatch.from_arrays(arrays, names=list(self.columns))
+
+
+def _plan(paths):
+  tree = {}
+  for path in paths:
+    node = tree
+    parts = path.split('.')
+    for part in parts[:-1]:
+      node = node.setdefault(part, {})
+      if not isinstance(node, dict):
+        raise ValueError('%s is not a struct field' % part)
+    node[parts[-1]] = path
+  return tree
+
+
+def _compile(cls, paths):
+  columns = {}
+  slots = {}
+  namespace = {'_I16': _I16, '_read_size': _read_size, '_skip': _skip, '_skippers': _skippers}
+  walk_lines = []
+
+  def emit(indent, line):
+    walk_lines.append(' ' * indent + line)
+
+  def constant(value):
+    name = '_k%d' % len(namespace)
+    namespace[name] = value
+    return name
+
+  def skip(ftype, arg, indent):
+    # Unread fields are stepped over the way the list views do it.
+    if ftype in _SIZES:
+      emit(indent, 'pos += %d' % _SIZES[ftype])
+    elif ftype == TType.STRING:
+      emit(indent, 'pos += 4 + _read_size(buf, pos)')
+    elif ftype == TType.STRUCT:
+      emit(indent, 'pos = _skippers[%s](buf, pos)' % constant(arg[0]))
+    elif ftype in (TType.LIST, TType.SET) and arg[0] in _SIZES:
+      emit(indent, 'pos += 5 + %d * _read_size(buf, pos + 1)' % _SIZES[arg[0]])
+    elif ftype in (TType.LIST, TType.SET) and arg[0] == TType.STRUCT:
+      emit(indent, 'element = _skippers[%s]' % constant(arg[1][0]))
+      emit(indent, 'n = _read_size(buf, pos + 1)')
+      emit(indent, 'pos += 5')
+      emit(indent, 'for _ in range(n):')
+      emit(indent + 2, 'pos = element(buf, pos)')
+    else:
+      emit(indent, 'pos = _skip(buf, pos, %d)' % ftype)
+
+  def extract(path, ftype, arg, indent):
+    k = slots.setdefault(path, len(slots))
+    if ftype == TType.BOOL:
+      columns[k] = (path, path, 'B')
+      # Any nonzero byte is true on the wire; stored as 0 or 1 so the
+      # buffer can be viewed as a bool array.
+      emit(indent, 'v%d = buf[pos] != 0' % k)
+      emit(indent, 'pos += 1')
+    elif ftype in _FIXED:
+      code, size = _FIXED[ftype]
+      columns[k] = (path, path, code)
+      emit(indent, 'v%d = %s(buf, pos)[0]' % (k, constant(struct.Struct('!' + code).unpack_from)))
+      emit(indent, 'pos += %d' % size)
+    elif ftype == TType.STRING:
+      columns[k] = (path, path, None)
+      emit(indent, 'v%d = pos + 4' % k)
+      emit(indent, 'pos = w%d = v%d + _read_size(buf, pos)' % (k, k))
+    elif ftype in _CONTAINERS:
+      columns[k] = (path, path + '_count', 'i')
+      emit(indent, 'v%d = _read_size(buf, pos + %d)' % (
+          k, 2 if ftype == TType.MAP else 1))
+      skip(ftype, arg, indent)
+    else:
+      raise ValueError('%s is a struct; name one of its fields' % path)
+
+  def field(spec, tree, indent):
+    name, ftype, arg = spec[2], spec[1], spec[3]
+    node = tree.get(name)
+    if node is None:
+      skip(ftype, arg, indent)
+    elif isinstance(node, dict):
+      if ftype != TType.STRUCT:
+        raise ValueError('%s is not a struct field' % name)
+      walk(arg[0], node, indent)
+    else:
+      extract(node, ftype, arg, indent)
+
+  def walk(struct_cls, tree, indent):
+    specs = [spec for spec in struct_cls.thrift_spec or () if spec is not None]
+    for name in tree:
+      if name not in [spec[2] for spec in specs]:
+        raise ValueError('%s has no field %s' % (struct_cls.__name__, name))
+    # Fields written in id order are matched with one header comparison
+    # each; the loop below picks up anything out of order or unknown.
+    for spec in specs:
+      emit(indent, 'if buf.startswith(%s, pos):' % constant(struct.pack('!bh', spec[1], spec[0])))
+      emit(indent + 2, 'pos += 3')
+      field(spec, tree, indent + 2)
+    emit(indent, 'while True:')
+    emit(indent + 2, 'ftype = buf[pos]')
+    emit(indent + 2, 'if ftype == 0:')
+    emit(indent + 4, 'pos += 1')
+    emit(indent + 4, 'break')
+    emit(indent + 2, 'fid = _I16.unpack_from(buf, pos + 1)[0]')
+    emit(indent + 2, 'pos += 3')
+    for spec in specs:
+      emit(indent + 2, 'if fid == %d and ftype == %d:' % (spec[0], spec[1]))
+      field(spec, tree, indent + 4)
+      emit(indent + 4, 'continue')
+    emit(indent + 2, 'pos = _skip(buf, pos, ftype)')
+
+  walk(cls, _plan(paths), 4)
+  lines = ['def extract(buf, offsets, columns):']
+  for k, (_, _, typecode) in columns.items():
+    if typecode is None:
+      lines.append('  d%d = columns[%d].data' % (k, k))
+      lines.append('  a%d = columns[%d].offsets.append' % (k, k))
+    else:
+      lines.append('  a%d = columns[%d].append' % (k, k))
+  lines.append('  for pos in offsets:')
+  for k, (_, _, typecode) in columns.items():
+    lines.append('    v%d = 0' % k if typecode is not None else '    v%d = w%d = 0' % (k, k))
+  lines.extend(walk_lines)
+  for k, (_, _, typecode) in columns.items():
+    if typecode is None:
+      lines.append('    d%d += buf[v%d:w%d]' % (k, k, k))
+      lines.append('    a%d(len(d%d))' % (k, k))
+    else:
+      lines.append('    a%d(v%d)' % (k, k))
+  exec(compile('\n'.join(lines) + '\n', '<columns %s>' % cls.__qualname__, 'exec'),
+       namespace)
+  # Slots are numbered in wire order; the batch lists them as requested.
+  order = {path: index for index, path in enumerate(paths)}
+  layout = sorted(((k, name, typecode) for k, (path, name, typecode) in columns.items()),
+                  key=lambda column: order[columns[column[0]][0]])
+  return namespace['extract'], layout
+
+
+_extractors = {}
+
+
+def extract_columns(buf, offsets, cls, paths):
+  """Extracts `paths` from the `cls` structs starting at `offsets` in `buf`."""
+  key = (cls, tuple(paths))
+  compiled = _extractors.get(key)
+  if compiled is None:
+    compiled = _extractors[key] = _compile(cls, paths)
+  extract, layout = compiled
+  columns = [None] * len(layout)
+  for k, _, typecode in layout:
+    columns[k] = StringColumn() if typecode is None else array(typecode)
+  extract(buf, offsets, columns)
+  return ColumnBatch({name: columns[k] for k, name, _ in layout}, len(offsets))
@@ -0,0 +1,112 @@
+"""__slots__ variants of the generated gen-py modules.
+
+compact(module) rebuilds a generated ttypes or service module so that its
+structs store their fields in __slots__ instead of a per-instance __dict__.
+The generated methods are reused unchanged, rebound to the new module, so
+nested structs, results and clients all produce compact instances:
+
+  from thriftkit.compact import compact
+  ttypes = compact(social_network.ttypes)
+  PostStorageService = compact(social_network.PostStorageService)
+
+Exceptions are left as generated, so `except ServiceException` catches
+them from compact and generated clients alike. Compact modules are
+registered in sys.modules as <module>_compact, so their instances pickle.
+"""
+
+import importlib
+import sys
+import types
+
+from thrift.Thrift import TException
+from thrift.TRecursive import fix_spec
+
+_compacted = {}
+
+
+def _rebind(function, namespace):
+  rebound = types.FunctionType(function.__code__, namespace, function.__name__,
+                               function.__defaults__, function.__closure__)
+  rebound.__kwdefaults__ = function.__kwdefaults__
+  rebound.__qualname__ = function.__qualname__
+  rebound.__doc__ = function.__doc__
+  return rebound
+
+
+def _remap(value, classes):
+  if isinstance(value, type):
+    return classes.get(value, value)
+  if isinstance(value, tuple):
+    return tuple(_remap(item, classes) for item in value)
+  if isinstance(value, list):
+    return [_remap(item, classes) for item in value]
+  return value
+
+
+def _slots_eq(self, other):
+  return isinstance(other, self.__class__) and all(
+      getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+
+def _slots_ne(self, other):
+  return not (self == other)
+
+
+def _slots_repr(self):
+  return '%s(%s)' % (self.__class__.__name__, ', '.join(
+      '%s=%r' % (name, getattr(self, name)) for name in self.__slots__))
+
+
+def _is_struct(cls):
+  return hasattr(cls, 'thrift_spec') and not issubclass(cls, TException)
+
+
+def compact(module):
+  """Returns the compact variant of a generated gen-py module."""
+  name = module.__name__ + '_compact'
+  if name in _compacted:
+    return _compacted[name]
+  classes = {}
+  if module.__name__.rsplit('.', 1)[-1] != 'ttypes':
+    ttypes = compact(importlib.import_module(module.__package__ + '.ttypes'))
+    classes.update(ttypes.__compacted_from__)
+
+  new = types.ModuleType(name, module.__doc__)
+  namespace = new.__dict__
+  namespace.update(module.__dict__)
+  namespace['__name__'] = name
+  local = [value for value in vars(module).values()
+           if isinstance(value, type) and value.__module__ == module.__name__]
+  # Create the structs first so the other classes can be rebased onto them.
+  structs = []
+  for cls in local:
+    if _is_struct(cls):
+      fields = tuple(spec[2] for spec in cls.thrift_spec if spec is not None)
+      body = {key: _rebind(value, namespace) for key, value in vars(cls).items()
+              if isinstance(value, types.FunctionType)}
+      body.update(__slots__=fields, __module__=name, __qualname__=cls.__qualname__,
+                  __doc__=cls.__doc__, __eq__=_slots_eq, __ne__=_slots_ne,
+                  __repr__=_slots_repr)
+      classes[cls] = type(cls.__name__, (object,), body)
+      structs.append(cls)
+  for cls in local:
+    if cls not in classes and not issubclass(cls, TException):
+      body = {}
+      for key, value in vars(cls).items():
+        if key in ('__dict__', '__weakref__'):
+          continue
+        body[key] = _rebind(value, namespace) if isinstance(value, types.FunctionType) else value
+      body['__module__'] = name
+      classes[cls] = type(cls.__name__, _remap(cls.__bases__, classes), body)
+  for key, value in list(namespace.items()):
+    if isinstance(value, type) and value in classes:
+      namespace[key] = classes[value]
+  for cls in structs:
+    classes[cls].thrift_spec = _remap(cls.thrift_spec, classes)
+  structs = [classes[cls] for cls in structs]
+  fix_spec(structs)
+  namespace['all_structs'] = structs
+  namespace['__compacted_from__'] = classes
+  sys.modules[name] = new
+  _compacted[name] = new
+  return new
@@ -0,0 +1,611 @@
+"""Pure-Python fast path for decoding generated structs.
+
+Generated read() methods hand the whole struct to `iprot._fast_decode` when
+the protocol sets one and the transport buffers whole frames. Normally that
+hook is the fastbinary C extension; this module fills it with decoders
+compiled from each struct's thrift_spec into straight-line Python that
+reads with struct.unpack_from from the frame's bytes, instead of one
+protocol call per field header, length and value.
+"""
+
+import struct
+from array import array
+from collections.abc import Sequence
+
+from thrift.Thrift import TType
+from thrift.protocol import TBinaryProtocol
+from thrift.protocol.TProtocol import TProtocolException
+
+try:
+  from thrift.protocol import fastbinary
+except ImportError:
+  fastbinary = None
+
+_I16 = struct.Struct('!h')
+_I32 = struct.Struct('!i')
+
+_FIXED = {
+    TType.BYTE: ('b', 1),
+    TType.I16: ('h', 2),
+    TType.I32: ('i', 4),
+    TType.I64: ('q', 8),
+    TType.DOUBLE: ('d', 8),
+}
+# Shorter strings decode about as fast as their span is recorded.
+LAZY_MIN_LENGTH = 64
+
+_SIZES = {ttype: size for ttype, (_, size) in _FIXED.items()}
+_SIZES[TType.BOOL] = 1
+
+
+def _bad_size(n):
+  if n < 0:
+    raise TProtocolException(TProtocolException.NEGATIVE_SIZE, 'negative size %d' % n)
+  raise TProtocolException(TProtocolException.SIZE_LIMIT,
+                           'size %d runs past the end of the frame' % n)
+
+
+def _read_size(buf, pos):
+  # Every element takes at least a byte, so no count, like no length, can
+  # exceed the bytes left. Checking also keeps a negative one from moving
+  # `pos` backwards into a loop.
+  n = _I32.unpack_from(buf, pos)[0]
+  if n < 0 or n > len(buf) - pos - 4:
+    _bad_size(n)
+  return n
+
+
+def _skip(buf, pos, ttype):
+  size = _SIZES.get(ttype)
+  if size is not None:
+    return pos + size
+  if ttype == TType.STRING:
+    return pos + 4 + _read_size(buf, pos)
+  if ttype == TType.STRUCT:
+    while True:
+      ftype = buf[pos]
+      if ftype == TType.STOP:
+        return pos + 1
+      pos = _skip(buf, pos + 3, ftype)
+  if ttype == TType.MAP:
+    ktype, vtype = buf[pos], buf[pos + 1]
+    count = _read_size(buf, pos + 2)
+    pos += 6
+    for _ in range(count):
+      pos = _skip(buf, _skip(buf, pos, ktype), vtype)
+    return pos
+  if ttype in (TType.LIST, TType.SET):
+    etype = buf[pos]
+    count = _read_size(buf, pos + 1)
+    pos += 5
+    size = _SIZES.get(etype)
+    if size is not None:
+      return pos + size * count
+    for _ in range(count):
+      pos = _skip(buf, pos, etype)
+    return pos
+  raise TProtocolException(TProtocolException.INVALID_DATA, 'unknown type %d' % ttype)
+
+
+def _skip_struct(buf, pos):
+  while True:
+    ftype = buf[pos]
+    if ftype == TType.STOP:
+      return pos + 1
+    size = _SIZES.get(ftype)
+    if size is not None:
+      pos += 3 + size
+    elif ftype == TType.STRING:
+      pos += 7 + _read_size(buf, pos + 3)
+    else:
+      pos = _skip(buf, pos + 3, ftype)
+
+
+def _bad_element_type(found, expected):
+  raise TProtocolException(TProtocolException.INVALID_DATA,
+                           'container element type %d, expected %d' % (found, expected))
+
+
+class _Source:
+  """Accumulates the source of one decoder and the names it refers to."""
+
+  def __init__(self, decoders, lazy=False, list_views=False):
+    self.lazy = lazy
+    self.list_views = list_views
+    self.lines = []
+    self.namespace = {
+        '_I16': _I16, '_I32': _I32, '_skip': _skip,
+        '_bad': _bad_element_type, '_bad_size': _bad_size, '_decoders': decoders,
+        'unpack_from': struct.unpack_from, '_list_view': _list_view,
+    }
+
+  def emit(self, indent, line):
+    self.lines.append(' ' * indent + line)
+
+  def constant(self, value):
+    name = '_k%d' % len(self.namespace)
+    self.namespace[name] = value
+    return name
+
+  def check_size(self, indent):
+    """Emits the check of a length or count `n` read just before `pos`."""
+    self.emit(indent, 'if n < 0 or n > end - pos:')
+    self.emit(indent, '  _bad_size(n)')
+
+  def value(self, ttype, arg, var, indent, depth):
+    """Emits code that reads one `ttype` value at `pos` into `var`."""
+    if ttype == TType.BOOL:
+      self.emit(indent, '%s = buf[pos] != 0' % var)
+      self.emit(indent, 'pos += 1')
+    elif ttype in _FIXED:
+      code, size = _FIXED[ttype]
+      self.emit(indent, '%s = %s.unpack_from(buf, pos)[0]' % (
+          var, self.constant(struct.Struct('!' + code))))
+      self.emit(indent, 'pos += %d' % size)
+    elif ttype == TType.STRING:
+      self.emit(indent, 'n = _I32.unpack_from(buf, pos)[0]')
+      self.emit(indent, 'pos += 4')
+      self.check_size(indent)
+      if arg == 'BINARY':
+        self.emit(indent, '%s = bytes(buf[pos:pos + n])' % var)
+      else:
+        self.emit(indent, "%s = str(buf[pos:pos + n], 'utf-8')" % var)
+      self.emit(indent, 'pos += n')
+    elif ttype == TType.STRUCT:
+      self.emit(indent, '%s, pos = _decoders[%s](buf, pos, None%s)' % (
+          var, self.constant(arg[0]), ', view' if self.lazy else ''))
+    elif ttype in (TType.LIST, TType.SET):
+      self.sequence(ttype, arg, var, indent, depth)
+    elif ttype == TType.MAP:
+      ktype, karg, vtype, varg = arg[:4]
+      self.emit(indent, 'kt, vt = buf[pos], buf[pos + 1]')
+      self.emit(indent, 'n = _I32.unpack_from(buf, pos + 2)[0]')
+      self.emit(indent, 'pos += 6')
+      self.check_size(indent)
+      self.emit(indent, 'if n > 0 and (kt != %d or vt != %d):' % (ktype, vtype))
+      self.emit(indent, '  _bad(kt if kt != %d else vt, %d if kt != %d else %d)' % (
+          ktype, ktype, ktype, vtype))
+      self.emit(indent, '%s = {}' % var)
+      self.emit(indent, 'for _ in range(n):')
+      self.value(ktype, karg, 'k%d' % depth, indent + 2, depth + 1)
+      self.value(vtype, varg, 'e%d' % depth, indent + 2, depth + 1)
+      self.emit(indent + 2, '%s[k%d] = e%d' % (var, depth, depth))
+    else:
+      raise TypeError('cannot decode thrift type %d' % ttype)
+
+  def lazy_string(self, name, indent):
+    """Emits code that leaves a long string field undecoded in its slot."""
+    self.emit(indent, 'n = _I32.unpack_from(buf, pos)[0]')
+    self.emit(indent, 'pos += 4')
+    self.check_size(indent)
+    self.emit(indent, 'if not lazy:')
+    self.emit(indent + 2, "obj.%s = str(buf[pos:pos + n], 'utf-8')" % name)
+    self.emit(indent, 'elif n < %d:' % LAZY_MIN_LENGTH)
+    self.emit(indent + 2, "obj._lazy_%s = str(buf[pos:pos + n], 'utf-8')" % name)
+    self.emit(indent, 'else:')
+    self.emit(indent + 2, 'obj._lazy_%s = pos' % name)
+    self.emit(indent, 'pos += n')
+
+  def sequence(self, ttype, arg, var, indent, depth):
+    etype, earg = arg[0], arg[1]
+    wrap = 'set' if ttype == TType.SET else 'list'
+    self.emit(indent, 'et = buf[pos]')
+    self.emit(indent, 'n = _I32.unpack_from(buf, pos + 1)[0]')
+    self.emit(indent, 'pos += 5')
+    self.check_size(indent)
+    self.emit(indent, 'if n > 0 and et != %d:' % etype)
+    self.emit(indent, '  _bad(et, %d)' % etype)
+    if etype in _FIXED:
+      # Fixed-width elements come out of a single unpack.
+      code, size = _FIXED[etype]
+      self.emit(indent, "%s = %s(unpack_from('!%%d%s' %% n, buf, pos))" % (var, wrap, code))
+      self.emit(indent, 'pos += n * %d' % size)
+      return
+    if self.list_views and depth == 0 and etype == TType.STRUCT:
+      element_cls = self.constant(earg[0])
+      self.emit(indent, '%s, pos = _list_view(buf, pos, n, _decoders[%s], %s)' % (
+          var, element_cls, element_cls))
+      return
+    self.emit(indent, '%s = %s()' % (var, wrap))
+    self.emit(indent, 'for _ in range(n):')
+    self.value(etype, earg, 'e%d' % depth, indent + 2, depth + 1)
+    self.emit(indent + 2, '%s.%s(e%d)' % (var, 'add' if wrap == 'set' else 'append', depth))
+
+
+class _LazyString:
+  """A string field kept in a slot as either its value or, until first
+  read, the offset of its undecoded bytes in the frame."""
+
+  def __init__(self, slot):
+    self.slot = slot
+
+  def __get__(self, obj, owner=None):
+    if obj is None:
+      return self
+    value = self.slot.__get__(obj)
+    if value.__class__ is int:
+      view = obj._view
+      value = str(view[value:value + _I32.unpack_from(view, value - 4)[0]], 'utf-8')
+      self.slot.__set__(obj, value)
+    return value
+
+  def __set__(self, obj, value):
+    self.slot.__set__(obj, value)
+
+
+def _lazy_class(cls, names):
+  # Generated __eq__ and __repr__ read __dict__, which lacks the slots.
+  fields = [spec[2] for spec in cls.thrift_spec if spec is not None]
+
+  def __eq__(self, other):
+    return isinstance(other, cls) and all(
+        getattr(self, name) == getattr(other, name) for name in fields)
+
+  def __repr__(self):
+    return '%s(%s)' % (self.__class__.__name__, ', '.join(
+        '%s=%r' % (name, getattr(self, name)) for name in fields))
+
+  slots = ['_lazy_' + name for name in names]
+  lazy_cls = type('Lazy' + cls.__name__, (cls,), {
+      '__slots__': ['_view'] + slots, '__eq__': __eq__, '__repr__': __repr__,
+      '__module__': cls.__module__})
+  for name, slot in zip(names, slots):
+    setattr(lazy_cls, name, _LazyString(getattr(lazy_cls, slot)))
+  return lazy_cls
+
+
+def _compile(cls, lazy, list_views):
+  # Generated exceptions are immutable: collect their fields and construct
+  # at the end. Plain structs are updated in place, as their read() expects.
+  # Exceptions, mutable ones from older generators included, keep their
+  # strings eager: a slotted subclass cannot be made with object.__new__.
+  immutable = '__setattr__' in vars(cls)
+  fields = [field[:4] for field in cls.thrift_spec or () if field is not None]
+  lazy_names = [] if issubclass(cls, BaseException) or not lazy else [
+      name for _, ftype, name, arg in fields if ftype == TType.STRING and arg != 'BINARY']
+  source = _Source(_lazy_decoders if lazy else _decoders, lazy, list_views)
+  source.namespace['cls'] = cls
+  if lazy:
+    # One memoryview per decode is shared by every struct in it; it keeps
+    # `buf` pinned while any lazy string is unread.
+    source.emit(0, 'def decode(buf, pos, obj, view=None):')
+    source.emit(2, 'if view is None:')
+    source.emit(4, 'view = memoryview(buf)')
+  else:
+    source.emit(0, 'def decode(buf, pos, obj):')
+  source.emit(2, 'end = len(buf)')
+  if immutable:
+    source.emit(2, 'values = {}')
+  elif lazy_names:
+    # Structs decoded on their own become lazy subclass instances; a
+    # caller-supplied instance gets its strings decoded right away. Fields
+    # are assigned in spec order so instances share dict keys, as they do
+    # when built by the generated __init__.
+    source.namespace['lazy_cls'] = _lazy_class(cls, lazy_names)
+    source.emit(2, 'lazy = obj is None')
+    source.emit(2, 'if lazy:')
+    source.emit(4, 'obj = object.__new__(lazy_cls)')
+    for spec in cls.thrift_spec:
+      if spec is not None:
+        source.emit(4, 'obj.%s%s = %s' % (
+            '_lazy_' if spec[2] in lazy_names else '', spec[2], source.constant(spec[4])))
+    source.emit(4, 'obj._view = view')
+  else:
+    source.emit(2, 'if obj is None:')
+    source.emit(4, 'obj = cls()')
+  target = "values[%r] = v" if immutable else 'obj.%s = v'
+
+  # A struct returned by a call, such as ReadPage's Page, gets list views
+  # for its own list<struct> fields too.
+  views_success = list_views and cls.__name__.endswith('_result')
+
+  def emit_field(ftype, name, arg, indent):
+    if views_success and name == 'success' and ftype == TType.STRUCT:
+      source.namespace['_views'] = _caches[lazy, True]
+      source.emit(indent, 'obj.success, pos = _views[%s](buf, pos, None%s)' % (
+          source.constant(arg[0]), ', view' if lazy else ''))
+    elif name in lazy_names:
+      source.lazy_string(name, indent)
+    else:
+      source.value(ftype, arg, 'v', indent, 0)
+      source.emit(indent, target % name)
+
+  # Writers emit fields in id order, so first try each field in turn with a
+  # single header comparison; whatever is left goes through the general loop.
+  for fid, ftype, name, arg in fields:
+    header = source.constant(struct.pack('!bh', ftype, fid))
+    source.emit(2, 'if buf.startswith(%s, pos):' % header)
+    source.emit(4, 'pos += 3')
+    emit_field(ftype, name, arg, 4)
+  source.emit(2, 'while True:')
+  source.emit(4, 'ftype = buf[pos]')
+  source.emit(4, 'if ftype == 0:')
+  source.emit(6, 'return %s, pos + 1' % ('cls(**values)' if immutable else 'obj'))
+  source.emit(4, 'fid = _I16.unpack_from(buf, pos + 1)[0]')
+  source.emit(4, 'pos += 3')
+  branch = 'if'
+  for fid, ftype, name, arg in fields:
+    source.emit(4, '%s fid == %d and ftype == %d:' % (branch, fid, ftype))
+    emit_field(ftype, name, arg, 6)
+    branch = 'elif'
+  if branch == 'elif':
+    source.emit(4, 'else:')
+    source.emit(6, 'pos = _skip(buf, pos, ftype)')
+  else:
+    source.emit(4, 'pos = _skip(buf, pos, ftype)')
+  code = compile('\n'.join(source.lines) + '\n', '<decode %s>' % cls.__qualname__, 'exec')
+  exec(code, source.namespace)
+  return source.namespace['decode']
+
+
+class _DecoderCache(dict):
+  def __init__(self, lazy, list_views):
+    self.lazy = lazy
+    self.list_views = list_views
+
+  def __missing__(self, cls):
+    decoder = self[cls] = _compile(cls, self.lazy, self.list_views)
+    return decoder
+
+
+_caches = {(lazy, list_views): _DecoderCache(lazy, list_views)
+           for lazy in (False, True) for list_views in (False, True)}
+_decoders = _caches[False, False]
+_lazy_decoders = _caches[True, False]
+
+
+def decoder_for(cls, lazy=False, list_views=False):
+  """Returns decode(buf, pos, obj) -> (obj, end) for a generated struct.
+
+  With `lazy`, nested structs decode to subclasses whose long string fields
+  are decoded from `buf` on first read. With `list_views`, the struct's
+  own list<struct> fields become LazyStructLists. Either way `buf` must
+  not change while the results are alive.
+  """
+  return _caches[lazy, list_views][cls]
+
+
+class LazyStructList(Sequence):
+  """Read-only list of structs that decodes each element on first access.
+
+  Building one only walks the wire format to record where every element
+  starts; len() is free and field() reads a single field from every
+  element without decoding the rest.
+  """
+
+  def __init__(self, buf, offsets, decode, element_cls):
+    self.element_cls = element_cls
+    self._buf = buf
+    # Keeps a reusable receive buffer from being handed the next frame.
+    self._pin = memoryview(buf)
+    self._offsets = offsets
+    self._items = [None] * len(offsets)
+    self._decode = decode
+
+  def __len__(self):
+    return len(self._offsets)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in range(*index.indices(len(self)))]
+    item = self._items[index]
+    if item is None:
+      item = self._items[index] = self._decode(self._buf, self._offsets[index], None)[0]
+    return item
+
+  def __iter__(self):
+    for index in range(len(self._offsets)):
+      yield self[index]
+
+  def field(self, name):
+    """Returns field `name` of every element, decoding only that field."""
+    spec = next((spec for spec in self.element_cls.thrift_spec if spec and spec[2] == name),
+                None)
+    if spec is None:
+      raise ValueError('%s has no field %s' % (self.element_cls.__name__, name))
+    fid, ftype = spec[0], spec[1]
+    if ftype not in _FIXED and ftype != TType.STRING:
+      return [getattr(item, name) for item in self]
+    unpack = struct.Struct('!' + _FIXED[ftype][0]).unpack_from if ftype in _FIXED else None
+    buf, values = self._buf, []
+    for index, pos in enumerate(self._offsets):
+      item = self._items[index]
+      if item is not None:
+        values.append(getattr(item, name))
+        continue
+      value = spec[4]
+      while True:
+        wire_type = buf[pos]
+        if wire_type == TType.STOP:
+          break
+        if wire_type == ftype and _I16.unpack_from(buf, pos + 1)[0] == fid:
+          if unpack is not None:
+            value = unpack(buf, pos + 3)[0]
+          else:
+            n = _read_size(buf, pos + 3)
+            value = bytes(buf[pos + 7:pos + 7 + n])
+            if spec[3] != 'BINARY':
+              value = value.decode('utf-8')
+          break
+        pos = _skip(buf, pos + 3, wire_type)
+      values.append(value)
+    return values
+
+  def columns(self, *paths):
+    """Returns a ColumnBatch of the given field paths, e.g. 'creator.user_id',
+    read straight from the frame (see thriftkit.columnar)."""
+    from .columnar import extract_columns
+    return extract_columns(self._buf, self._offsets, self.element_cls, paths)
+
+  def __eq__(self, other):
+    if isinstance(other, (LazyStructList, list)):
+      return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    return NotImplemented
+
+  def __repr__(self):
+    return repr(list(self))
+
+
+def materialize(value):
+  """Decodes every lazy string and list view inside a decoded result, so
+  that it stops pinning its frame; for values that outlive the call, such
+  as cached ones. Returns `value`, or a list in place of a LazyStructList.
+  """
+  if isinstance(value, LazyStructList):
+    return [materialize(item) for item in value]
+  if isinstance(value, list):
+    value[:] = [materialize(item) for item in value]
+  elif isinstance(value, dict):
+    for key, item in value.items():
+      value[key] = materialize(item)
+  elif getattr(value, 'thrift_spec', None) is not None and not isinstance(value, BaseException):
+    for spec in value.thrift_spec:
+      if spec is not None and spec[1] in (TType.STRUCT, TType.LIST, TType.MAP, TType.STRING):
+        item = getattr(value, spec[2])  # reading a lazy string decodes it
+        if spec[1] != TType.STRING and item is not None:
+          setattr(value, spec[2], materialize(item))
+    if hasattr(value, '_view'):
+      value._view = None
+  return value
+
+
+def _compile_skipper(cls):
+  # Like the decoders: fields in id order are stepped over with one header
+  # comparison each, and the generic walk picks up from the first surprise.
+  lines = ['def skip(buf, pos):']
+  namespace = {'_read_size': _read_size, '_skippers': _skippers, '_skip_struct': _skip_struct}
+
+  def constant(value):
+    name = '_k%d' % len(namespace)
+    namespace[name] = value
+    return name
+
+  for spec in cls.thrift_spec or ():
+    if spec is None:
+      continue
+    fid, ftype, _, arg = spec[:4]
+    lines.append('  if buf.startswith(%s, pos):' % constant(struct.pack('!bh', ftype, fid)))
+    if ftype in _SIZES:
+      lines.append('    pos += %d' % (3 + _SIZES[ftype]))
+    elif ftype == TType.STRING:
+      lines.append('    pos += 7 + _read_size(buf, pos + 3)')
+    elif ftype == TType.STRUCT:
+      lines.append('    pos = _skippers[%s](buf, pos + 3)' % constant(arg[0]))
+    elif ftype in (TType.LIST, TType.SET) and arg[0] in _SIZES:
+      lines.append('    pos += 8 + %d * _read_size(buf, pos + 4)' % _SIZES[arg[0]])
+    elif ftype in (TType.LIST, TType.SET) and arg[0] == TType.STRUCT:
+      lines.append('    element = _skippers[%s]' % constant(arg[1][0]))
+      lines.append('    n = _read_size(buf, pos + 4)')
+      lines.append('    pos += 8')
+      lines.append('    for _ in range(n):')
+      lines.append('      pos = element(buf, pos)')
+    else:
+      lines.append('    return _skip_struct(buf, pos)')
+  lines.append('  return _skip_struct(buf, pos)')
+  exec(compile('\n'.join(lines) + '\n', '<skip %s>' % cls.__qualname__, 'exec'), namespace)
+  return namespace['skip']
+
+
+class _SkipperCache(dict):
+  def __missing__(self, cls):
+    skipper = self[cls] = _compile_skipper(cls)
+    return skipper
+
+
+_skippers = _SkipperCache()
+
+
+def _list_view(buf, pos, count, decode, element_cls):
+  skip = _skippers[element_cls]
+  offsets = array('q')
+  for _ in range(count):
+    offsets.append(pos)
+    pos = skip(buf, pos)
+  return LazyStructList(buf, offsets, decode, element_cls), pos
+
+
+def fast_decode(obj, iprot, cls_spec):
+  """The `_fast_decode` hook: decodes one struct from the transport's frame."""
+  cls = cls_spec[0]
+  decoders = _caches[iprot.lazy_strings, iprot.lazy_lists]
+  trans = iprot.trans
+  frame_buffer = getattr(trans, 'frame_buffer', None)
+  if frame_buffer is not None:
+    buf, start, stop = frame_buffer()
+    try:
+      result, end = decoders[cls](buf, start, obj)
+    except (struct.error, IndexError):
+      end = stop + 1
+    except UnicodeDecodeError as e:
+      # Either bad text or a string cut off by the end of the frame.
+      raise TProtocolException(TProtocolException.INVALID_DATA,
+                               'cannot decode %s: %s' % (cls.__name__, e))
+    if end > stop:
+      raise TProtocolException(TProtocolException.INVALID_DATA,
+                               '%s runs past the end of its frame' % cls.__name__)
+    trans.consume(end)
+    return result
+  stream = trans.cstringio_buf
+  start = stream.tell()
+  # Shares the frame's bytes rather than copying while the buffer is unchanged.
+  buf = stream.getvalue()
+  try:
+    result, end = decoders[cls](buf, start, obj)
+    if end > len(buf):
+      raise IndexError
+  except (struct.error, IndexError, UnicodeDecodeError, TProtocolException):
+    result = None
+  if result is None:
+    # The struct runs past the buffered data, possibly through a string,
+    # or is malformed; let the generated code read it through the
+    # transport, which knows how to refill, and fails the way
+    # TBinaryProtocol does.
+    stream.seek(start)
+    plain = TBinaryProtocol.TBinaryProtocol(trans)
+    if obj is None:
+      return cls.read(plain)
+    obj.read(plain)
+    return obj
+  stream.seek(end)
+  return result
+
+
+class TBinaryProtocolFastDecode(TBinaryProtocol.TBinaryProtocol):
+  """TBinaryProtocol that decodes structs with the compiled decoders.
+
+  With lazy_strings=True, long string fields of nested structs are decoded
+  on first access; with lazy_lists=True, list<struct> results such as
+  ReadPosts, ReadReviews and ReadCastInfo, and those inside ReadPage's
+  Page, come back as LazyStructLists (see decoder_for) that can also be
+  exported column-wise (see LazyStructList.columns).
+  """
+
+  def __init__(self, trans, strictRead=False, strictWrite=True, lazy_strings=False,
+               lazy_lists=False, **kwargs):
+    super(TBinaryProtocolFastDecode, self).__init__(trans, strictRead, strictWrite, **kwargs)
+    self.lazy_strings = lazy_strings
+    self.lazy_lists = lazy_lists
+    self._fast_decode = fast_decode
+
+
+class TBinaryProtocolFastDecodeFactory(TBinaryProtocol.TBinaryProtocolFactory):
+  def __init__(self, strictRead=False, strictWrite=True, lazy_strings=False,
+               lazy_lists=False, **kwargs):
+    super(TBinaryProtocolFastDecodeFactory, self).__init__(strictRead, strictWrite, **kwargs)
+    self.lazy_strings = lazy_strings
+    self.lazy_lists = lazy_lists
+
+  def getProtocol(self, trans):
+    return TBinaryProtocolFastDecode(
+        trans, self.strictRead, self.strictWrite, lazy_strings=self.lazy_strings,
+        lazy_lists=self.lazy_lists,
+        string_length_limit=self.string_length_limit,
+        container_length_limit=self.container_length_limit)
+
+
+def binary_protocol(trans):
+  """The fastest available binary protocol: the C accelerator if it is
+  installed, the compiled pure-Python decoders otherwise."""
+  if fastbinary is not None:
+    return TBinaryProtocol.TBinaryProtocolAccelerated(trans)
+  return TBinaryProtocolFastDecode(trans)
@@ -0,0 +1,185 @@
+import functools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from thrift.transport.TTransport import TTransportException
+
+from .calls import service_methods
+from .histogram import LatencyHistogram
+from .pipeline import pipeline_class
+
+# Reads that are safe to send twice.
+IDEMPOTENT_READS = frozenset([
+    'ReadPost', 'ReadPosts', 'GetFollowers', 'GetFollowees', 'ReadMovieInfo',
+    'ReadPlot', 'ReadCastInfo', 'ReadReviews', 'ReadUserTimeline', 'ReadHomeTimeline',
+])
+
+
+class MethodStats:
+  """Per-method counters of a HedgedClient."""
+
+  def __init__(self):
+    self.calls = 0
+    self.hedged = 0
+    self.hedge_wins = 0
+    self.timeouts = 0
+    self.latency = LatencyHistogram()
+
+  def to_dict(self):
+    return {
+        'calls': self.calls,
+        'hedged': self.hedged,
+        'hedge_wins': self.hedge_wins,
+        'hedge_win_rate': self.hedge_wins / self.hedged if self.hedged else 0.0,
+        'timeouts': self.timeouts,
+        'p95_s': self.latency.percentile(95.0),
+    }
+
+
+class HedgedClient:
+  """Client with per-method deadlines and hedged requests over replicas.
+
+  Calls go round-robin to one pipelined connection per endpoint. A call
+  that has not returned within its deadline raises TTransportException
+  TIMED_OUT; its late reply is dropped. For methods in `hedge`, such as
+  IDEMPOTENT_READS, a call still outstanding after the method's p95
+  latency is sent again to the next endpoint, and whichever reply arrives
+  first is returned; the other is dropped. No method is hedged by
+  default, since only idempotent ones may be sent twice. Until
+  `min_samples` replies have been timed, the hedge waits `initial_delay`;
+  it never waits longer than half the deadline.
+  Subclasses are built per service by hedged_class().
+
+    client = hedged_class(PostStorageService)(
+        [('post-storage-1', 9090), ('post-storage-2', 9090)],
+        deadlines={'ReadPost': 0.2}, default_deadline=1.0,
+        hedge=IDEMPOTENT_READS).open()
+    post = client.ReadPost(req_id, post_id, {})
+    print(client.stats()['ReadPost']['hedge_win_rate'])
+  """
+
+  service = None
+
+  def __init__(self, endpoints, deadlines=None, default_deadline=None, hedge=(),
+               hedge_percentile=95.0, initial_delay=0.01, min_samples=20,
+               timeout=None, socket_factory=None):
+    self.endpoints = list(endpoints)
+    self.deadlines = dict(deadlines or {})
+    self.default_deadline = default_deadline
+    methods = service_methods(self.service)
+    self.hedge = frozenset(hedge) & frozenset(methods)
+    self.hedge_percentile = hedge_percentile
+    self.initial_delay = initial_delay
+    self.min_samples = min_samples
+    cls = pipeline_class(self.service)
+    self._clients = [cls(host, port, timeout, socket_factory) for host, port in self.endpoints]
+    self._next = 0
+    self._stats = {name: MethodStats() for name in methods}
+    self._lock = threading.Lock()
+
+  def open(self):
+    for client in self._clients:
+      client.open()
+    return self
+
+  def close(self):
+    for client in self._clients:
+      client.close()
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, exc_type, exc, tb):
+    self.close()
+
+  def hedge_delay(self, name):
+    """Seconds a call to `name` waits before it is hedged."""
+    latency = self._stats[name].latency
+    with self._lock:
+      if latency.count < self.min_samples:
+        return self.initial_delay
+      return latency.percentile(self.hedge_percentile)
+
+  def stats(self):
+    """Returns {method: counters} for every method called so far."""
+    with self._lock:
+      return {name: stats.to_dict() for name, stats in self._stats.items() if stats.calls}
+
+  def _submit(self, index, name, args, kwargs):
+    stats = self._stats[name]
+    start = time.monotonic()
+    future = self._clients[index].submit(name, *args, **kwargs)
+
+    def timed(future):
+      if not future.cancelled() and not isinstance(future.exception(), TTransportException):
+        with self._lock:
+          stats.latency.record(time.monotonic() - start)
+    future.add_done_callback(timed)
+    return future
+
+  def call(self, name, *args, **kwargs):
+    """Calls `name` under its deadline, hedging it if it is in `hedge`."""
+    deadline = self.deadlines.get(name, self.default_deadline)
+    expires = None if deadline is None else time.monotonic() + deadline
+    stats = self._stats[name]
+    with self._lock:
+      stats.calls += 1
+      index = self._next
+      self._next = (index + 1) % len(self._clients)
+    primary = self._submit(index, name, args, kwargs)
+    pending = {primary}
+    hedge = None
+    if name in self.hedge and len(self._clients) > 1:
+      delay = self.hedge_delay(name)
+      if deadline is not None:
+        # Leave the hedge at least half the deadline to answer in.
+        delay = min(delay, deadline / 2)
+      done, _ = wait(pending, max(0.0, delay))
+      # A primary that failed fast is hedged right away.
+      failed = done and isinstance(primary.exception(), TTransportException)
+      if (not done or failed) and (expires is None or time.monotonic() < expires):
+        with self._lock:
+          stats.hedged += 1
+        try:
+          hedge = self._submit((index + 1) % len(self._clients), name, args, kwargs)
+          pending.add(hedge)
+        except TTransportException:
+          pass
+    while True:
+      timeout = None if expires is None else max(0.0, expires - time.monotonic())
+      done, pending = wait(pending, timeout, return_when=FIRST_COMPLETED)
+      if not done:
+        for future in pending:
+          future.cancel()
+        with self._lock:
+          stats.timeouts += 1
+        raise TTransportException(TTransportException.TIMED_OUT,
+                                  '%s exceeded its %.3fs deadline' % (name, deadline))
+      future = done.pop()
+      # A lost connection on one replica leaves the other to answer.
+      if isinstance(future.exception(), TTransportException) and (pending or done):
+        pending |= done
+        continue
+      for other in pending | done:
+        other.cancel()
+      if future is hedge:
+        with self._lock:
+          stats.hedge_wins += 1
+      return future.result()
+
+
+def _make_method(name, iface_method):
+  def method(self, *args, **kwargs):
+    return self.call(name, *args, **kwargs)
+  return functools.update_wrapper(method, iface_method)
+
+
+@functools.lru_cache(maxsize=None)
+def hedged_class(service):
+  """Returns the HedgedClient subclass for a generated service module."""
+  methods = {name: _make_method(name, getattr(service.Iface, name))
+             for name in service_methods(service)}
+  methods['service'] = service
+  short_name = service.__name__.rsplit('.', 1)[-1]
+  return type('Hedged' + short_name + 'Client', (HedgedClient,), methods)
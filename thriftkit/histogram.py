@@ -0,0 +1 @@
+../socialNetwork/scripts/latency.py
\ No newline at end of file
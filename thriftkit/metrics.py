@@ -0,0 +1,235 @@
+"""Per-method timing of generated Processors, exported for Prometheus.
+
+instrument() installs the Processor's on_message_begin hook and wraps its
+handler and process(), so every request is split into
+
+  decode    message header read -> handler called (argument decoding)
+  handler   the handler method itself
+  encode    handler returned -> reply written and flushed
+
+Samples go into per-thread histograms, so recording takes no lock; a
+scrape sums the threads. The text exposition follows the naming of the
+sidecar metrics in metrics.sh, so app-level time can be subtracted from
+istio_request_duration_milliseconds per service and operation:
+
+  thrift_requests_total{destination_service_name, request_operation}
+  thrift_request_duration_milliseconds{...}                  decode to encode
+  thrift_request_phase_duration_milliseconds{..., phase}     each phase
+
+  metrics = ProcessorMetrics()
+  processor = metrics.instrument(ComposePostService.Processor(handler),
+                                 'compose-post-service')
+  metrics.serve('0.0.0.0', 9464)   # GET /metrics
+
+Processors generated without the hook (the media_service gen-py predates
+it) start the clock when process() is entered, so their decode time also
+covers the message header.
+"""
+
+import bisect
+import functools
+import http.server
+import threading
+import time
+
+# istio's default request duration buckets, in milliseconds.
+DEFAULT_BUCKETS = (0.5, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000,
+                   30000, 60000, 300000, 600000, 1800000, 3600000)
+
+PHASES = ('decode', 'handler', 'encode')
+
+
+class _Histogram:
+  def __init__(self, buckets):
+    self.buckets = buckets
+    self.counts = [0] * (len(buckets) + 1)
+    self.sum = 0.0
+
+  def record(self, ms):
+    self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+    self.sum += ms
+
+  def merge(self, other):
+    for index, count in enumerate(other.counts):
+      self.counts[index] += count
+    self.sum += other.sum
+
+
+class _MethodTimes:
+  def __init__(self, buckets):
+    self.total = _Histogram(buckets)
+    self.phases = [_Histogram(buckets) for _ in PHASES]
+
+  def merge(self, other):
+    self.total.merge(other.total)
+    for mine, theirs in zip(self.phases, other.phases):
+      mine.merge(theirs)
+
+
+class ProcessorMetrics:
+  """Histograms of the Processors instrument() was called on."""
+
+  def __init__(self, buckets=DEFAULT_BUCKETS):
+    self.buckets = tuple(sorted(buckets))
+    self._local = threading.local()
+    self._shards = []
+    self._lock = threading.Lock()  # only taken for a thread's first sample
+
+  def _shard(self):
+    try:
+      return self._local.shard
+    except AttributeError:
+      shard = self._local.shard = {}
+      with self._lock:
+        self._shards.append(shard)
+      return shard
+
+  def instrument(self, processor, service=None):
+    """Times every request `processor` handles from now on, labelled with
+    `service` (default: the generated module name). Returns `processor`."""
+    if service is None:
+      service = type(processor).__module__.rsplit('.', 1)[-1]
+    local = self._local
+    previous_hook = getattr(processor, '_on_message_begin', None)
+
+    def on_message_begin(name, type, seqid):
+      local.begin = time.perf_counter()
+      if previous_hook is not None:
+        previous_hook(name, type, seqid)
+
+    if hasattr(processor, '_on_message_begin'):
+      processor.on_message_begin(on_message_begin)
+    processor._handler = _TimedHandler(processor._handler, local)
+    process = processor.process
+
+    @functools.wraps(process)
+    def timed_process(iprot, oprot):
+      local.begin = local.method = None
+      start = time.perf_counter()
+      try:
+        return process(iprot, oprot)
+      finally:
+        if local.method is not None:
+          self._record(service, local, start, time.perf_counter())
+
+    processor.process = timed_process
+    return processor
+
+  def _record(self, service, local, start, end):
+    begin = local.begin or start
+    shard = self._shard()
+    key = (service, local.method)
+    times = shard.get(key)
+    if times is None:
+      times = shard[key] = _MethodTimes(self.buckets)
+    times.total.record((end - begin) * 1e3)
+    decode, handler, encode = times.phases
+    decode.record((local.handler_start - begin) * 1e3)
+    handler.record((local.handler_end - local.handler_start) * 1e3)
+    encode.record((end - local.handler_end) * 1e3)
+
+  def snapshot(self):
+    """Returns {(service, method): merged times} over all threads."""
+    with self._lock:
+      shards = list(self._shards)
+    merged = {}
+    for shard in shards:
+      for key, times in list(shard.items()):
+        if key not in merged:
+          merged[key] = _MethodTimes(self.buckets)
+        merged[key].merge(times)
+    return merged
+
+  def exposition(self):
+    """Renders the histograms in the Prometheus text format."""
+    snapshot = sorted(self.snapshot().items())
+    lines = [
+        '# HELP thrift_requests_total Requests handled, per service and operation.',
+        '# TYPE thrift_requests_total counter',
+    ]
+    for (service, method), times in snapshot:
+      lines.append('thrift_requests_total{%s} %d' % (_labels(service, method),
+                                                     sum(times.total.counts)))
+    lines += [
+        '# HELP thrift_request_duration_milliseconds Time from the message header'
+        ' to the flushed reply.',
+        '# TYPE thrift_request_duration_milliseconds histogram',
+    ]
+    for (service, method), times in snapshot:
+      self._histogram_lines(lines, 'thrift_request_duration_milliseconds',
+                            _labels(service, method), times.total)
+    lines += [
+        '# HELP thrift_request_phase_duration_milliseconds Time spent decoding,'
+        ' in the handler and encoding.',
+        '# TYPE thrift_request_phase_duration_milliseconds histogram',
+    ]
+    for (service, method), times in snapshot:
+      for phase, histogram in zip(PHASES, times.phases):
+        self._histogram_lines(lines, 'thrift_request_phase_duration_milliseconds',
+                              _labels(service, method, phase), histogram)
+    return '\n'.join(lines) + '\n'
+
+  def _histogram_lines(self, lines, name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(self.buckets + (float('inf'),), histogram.counts):
+      cumulative += count
+      le = '+Inf' if bound == float('inf') else '%g' % bound
+      lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, le, cumulative))
+    lines.append('%s_sum{%s} %s' % (name, labels, repr(histogram.sum)))
+    lines.append('%s_count{%s} %d' % (name, labels, cumulative))
+
+  def serve(self, host='0.0.0.0', port=9464):
+    """Serves exposition() at /metrics on a background thread."""
+    metrics = self
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+      def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+          self.send_error(404)
+          return
+        body = metrics.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, format, *args):
+        pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _labels(service, method, phase=None):
+  labels = 'destination_service_name="%s",request_operation="%s",request_protocol="thrift"' % (
+      service, method)
+  return labels if phase is None else labels + ',phase="%s"' % phase
+
+
+class _TimedHandler:
+  """Handler proxy that marks when each method is entered and left."""
+
+  def __init__(self, handler, local):
+    self._handler = handler
+    self._local = local
+
+  def __getattr__(self, name):
+    method = getattr(self._handler, name)
+    if not callable(method):
+      return method
+    local = self._local
+
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+      local.method = name
+      local.handler_start = time.perf_counter()
+      try:
+        return method(*args, **kwargs)
+      finally:
+        local.handler_end = time.perf_counter()
+
+    setattr(self, name, timed)
+    return timed
@@ -0,0 +1,149 @@
+import functools
+import socket
+import threading
+from concurrent.futures import Future
+
+from thrift.transport import TSocket
+from thrift.transport.TTransport import TTransportException
+
+from .calls import decode_reply, encode_call, is_oneway, peek_seqid, service_methods
+
+
+class PipelinedClient:
+  """Thread-safe blocking client that pipelines calls on one framed connection.
+
+  submit() writes the call right away and returns a Future, so many calls
+  can be on the wire before the first reply arrives; a reader thread
+  matches replies to their futures by seqid, in whatever order the server
+  sends them. The generated method names block for their own reply, which
+  lets several threads share the connection. Cancelling a future gives up
+  on its call: the reply, if it still comes, is dropped. Subclasses are
+  built per service by pipeline_class().
+
+    client = pipeline_class(SocialGraphService)(host, port).open()
+    futures = [client.submit('GetFollowers', req_id, user_id, {})
+               for user_id in user_ids]
+    followers = [f.result() for f in futures]
+  """
+
+  service = None
+
+  def __init__(self, host, port, timeout=None, socket_factory=None):
+    self.host = host
+    self.port = port
+    self.timeout = timeout
+    self.socket = (socket_factory or TSocket.TSocket)(host, port)
+    self._seqid = 0
+    self._pending = {}
+    self._lock = threading.Lock()
+    self._write_lock = threading.Lock()
+    self._reader = None
+    self._error = None  # why the reader stopped; later calls fail with it
+
+  def open(self):
+    self._error = None
+    if self.timeout is not None:
+      self.socket.setTimeout(self.timeout * 1000.0)
+    self.socket.open()
+    # Replies may be far apart; call timeouts are enforced on the futures.
+    self.socket.setTimeout(None)
+    self._reader = threading.Thread(target=self._read_loop, daemon=True)
+    self._reader.start()
+    return self
+
+  def close(self):
+    handle = self.socket.handle
+    if handle is not None:
+      try:
+        # close() alone does not wake the reader thread blocked in recv().
+        handle.shutdown(socket.SHUT_RDWR)
+      except OSError:
+        pass
+    self.socket.close()
+    if self._reader is not None:
+      self._reader.join()
+      self._reader = None
+
+  def __enter__(self):
+    return self.open()
+
+  def __exit__(self, exc_type, exc, tb):
+    self.close()
+
+  def in_flight(self):
+    return len(self._pending)
+
+  def submit(self, name, *args, **kwargs):
+    """Sends a call to `name` and returns a Future of its result."""
+    future = Future()
+    oneway = is_oneway(self.service, name)
+    with self._write_lock:
+      self._seqid = (self._seqid + 1) & 0x7fffffff
+      seqid = self._seqid
+      with self._lock:
+        # Checked under the lock the reader fails pending calls with, so
+        # no call is left waiting on a reader that has stopped.
+        if self._error is not None:
+          error = self._error
+          raise TTransportException(error.type, error.message) from error
+        if not oneway:
+          self._pending[seqid] = (name, future)
+      try:
+        self.socket.write(encode_call(self.service, name, seqid, args, kwargs))
+      except BaseException:
+        with self._lock:
+          self._pending.pop(seqid, None)
+        raise
+    if oneway:
+      future.set_result(None)
+    else:
+      future.add_done_callback(functools.partial(self._forget, seqid))
+    return future
+
+  def _forget(self, seqid, future):
+    if future.cancelled():
+      with self._lock:
+        self._pending.pop(seqid, None)
+
+  def _read_loop(self):
+    try:
+      while True:
+        size = int.from_bytes(self.socket.readAll(4), 'big', signed=True)
+        payload = self.socket.readAll(size)
+        with self._lock:
+          name, future = self._pending.pop(peek_seqid(payload), (None, None))
+        # Claiming the future first keeps a concurrent cancel() out.
+        if future is None or not future.set_running_or_notify_cancel():
+          continue
+        try:
+          future.set_result(decode_reply(self.service, name, payload))
+        except Exception as e:
+          future.set_exception(e)
+    except (TTransportException, OSError, ValueError) as e:
+      error = e if isinstance(e, TTransportException) else TTransportException(
+          TTransportException.END_OF_FILE, 'connection lost: %s' % e)
+    except Exception as e:
+      error = TTransportException(TTransportException.UNKNOWN, 'bad reply frame: %r' % e)
+      error.__cause__ = e
+    with self._lock:
+      self._error = error
+      pending, self._pending = self._pending, {}
+    for _, future in pending.values():
+      if future.set_running_or_notify_cancel():
+        future.set_exception(error)
+
+
+def _make_method(name, iface_method):
+  def method(self, *args, **kwargs):
+    return self.submit(name, *args, **kwargs).result(self.timeout)
+  return functools.update_wrapper(method, iface_method)
+
+
+@functools.lru_cache(maxsize=None)
+def pipeline_class(service):
+  """Returns the PipelinedClient subclass for a generated service module."""
+  methods = {name: _make_method(name, getattr(service.Iface, name))
+             for name in service_methods(service)}
+  methods['service'] = service
+  short_name = service.__name__.rsplit('.', 1)[-1]
+  return type('Pipelined' + short_name + 'Client', (PipelinedClient,), methods)
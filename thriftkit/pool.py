@@ -0,0 +1,180 @@
+import select
+import socket
+import threading
+import time
+
+from thrift.Thrift import TException
+from thrift.protocol.TProtocol import TProtocolException
+from thrift.transport import TSocket
+from thrift.transport import TTransport
+
+from .fastdecode import binary_protocol
+
+
+def _is_reusable_error(error):
+  # Declared service exceptions and TApplicationException arrive as complete
+  # replies, so the connection is still in sync afterwards. Anything else may
+  # have left a half-read frame behind.
+  return (isinstance(error, TException) and
+          not isinstance(error, (TTransport.TTransportException, TProtocolException)))
+
+
+class PooledConnection:
+  """A framed binary connection and the generated client bound to it."""
+
+  def __init__(self, service, host, port, timeout=None, socket_factory=None):
+    self.socket = (socket_factory or TSocket.TSocket)(host, port)
+    if timeout is not None:
+      self.socket.setTimeout(timeout * 1000.0)
+    self.transport = TTransport.TFramedTransport(self.socket)
+    self.protocol = binary_protocol(self.transport)
+    self.client = service.Client(self.protocol)
+    self.transport.open()
+    self.created = self.last_used = time.monotonic()
+
+  def is_healthy(self):
+    """Returns False if the peer closed the connection or sent unsolicited
+    bytes, either of which makes the next call fail or desynchronize."""
+    handle = self.socket.handle
+    if handle is None:
+      return False
+    try:
+      readable, _, _ = select.select([handle], [], [], 0)
+      if not readable:
+        return True
+      handle.recv(1, socket.MSG_PEEK)
+    except (OSError, ValueError):
+      return False
+    return False
+
+  def close(self):
+    try:
+      self.transport.close()
+    except TTransport.TTransportException:
+      pass
+
+
+class _Checkout:
+  # A plain context manager rather than contextlib.contextmanager: generated
+  # exceptions are immutable, and contextlib rewrites __traceback__ on the
+  # exception it re-raises.
+
+  def __init__(self, pool):
+    self.pool = pool
+    self.conn = None
+
+  def __enter__(self):
+    self.conn = self.pool.checkout()
+    return self.conn.client
+
+  def __exit__(self, exc_type, exc, tb):
+    if exc is None or _is_reusable_error(exc):
+      self.pool.checkin(self.conn)
+    else:
+      self.pool.evicted += 1
+      self.conn.close()
+    return False
+
+
+class ClientPool:
+  """Keeps warm framed connections to one (host, port, service).
+
+  Checked-in connections are reused LIFO. A connection is evicted when it
+  exceeds `max_lifetime` seconds since it was opened, when it has been idle
+  longer than `idle_timeout` seconds, when it fails the health check on
+  checkout, or when more than `max_idle` connections are idle.
+
+    pool = ClientPool(SocialGraphService, 'social-graph-service', 9090)
+    with pool.client() as client:
+      client.GetFollowers(req_id, user_id, {})
+  """
+
+  def __init__(self, service, host, port, max_idle=8, max_lifetime=300.0,
+               idle_timeout=60.0, timeout=None, socket_factory=None):
+    self.service = service
+    self.host = host
+    self.port = port
+    self.max_idle = max_idle
+    self.max_lifetime = max_lifetime
+    self.idle_timeout = idle_timeout
+    self.timeout = timeout
+    self.socket_factory = socket_factory
+    self.created = 0
+    self.reused = 0
+    self.evicted = 0
+    self._idle = []
+    self._lock = threading.Lock()
+
+  def _expired(self, conn, now):
+    return (now - conn.created > self.max_lifetime or
+            now - conn.last_used > self.idle_timeout)
+
+  def checkout(self):
+    now = time.monotonic()
+    while True:
+      with self._lock:
+        conn = self._idle.pop() if self._idle else None
+      if conn is None:
+        break
+      if not self._expired(conn, now) and conn.is_healthy():
+        self.reused += 1
+        return conn
+      self.evicted += 1
+      conn.close()
+    self.created += 1
+    return PooledConnection(self.service, self.host, self.port,
+                            self.timeout, self.socket_factory)
+
+  def checkin(self, conn):
+    now = time.monotonic()
+    conn.last_used = now
+    with self._lock:
+      if len(self._idle) < self.max_idle and not self._expired(conn, now):
+        self._idle.append(conn)
+        return
+    self.evicted += 1
+    conn.close()
+
+  def client(self):
+    """Checks out a connection; use as `with pool.client() as client:`."""
+    return _Checkout(self)
+
+  def close(self):
+    with self._lock:
+      idle, self._idle = self._idle, []
+    for conn in idle:
+      conn.close()
+
+
+class PoolManager:
+  """One ClientPool per (host, port, service), created on first use."""
+
+  def __init__(self, **pool_kwargs):
+    self.pool_kwargs = pool_kwargs
+    self._pools = {}
+    self._lock = threading.Lock()
+
+  def get(self, service, host, port):
+    key = (host, port, service.__name__)
+    with self._lock:
+      pool = self._pools.get(key)
+      if pool is None:
+        pool = self._pools[key] = ClientPool(service, host, port, **self.pool_kwargs)
+      return pool
+
+  def client(self, service, host, port):
+    return self.get(service, host, port).client()
+
+  def close(self):
+    with self._lock:
+      pools, self._pools = list(self._pools.values()), {}
+    for pool in pools:
+      pool.close()
+
+
+_default_manager = PoolManager()
+
+
+def get_pool(service, host, port):
+  """Returns the process-wide pool for (host, port, service)."""
+  return _default_manager.get(service, host, port)
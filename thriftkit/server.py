@@ -0,0 +1,442 @@
+"""Framed binary Thrift server for the generated Processors.
+
+Three modes, picked with `mode`:
+
+  threads   one I/O thread watches idle connections with a selector and
+            hands a readable one to a pool of `workers` threads; the worker
+            answers its requests in order until none arrives for `linger`
+            seconds, then hands it back, so idle pooled client
+            connections never tie up a worker;
+  asyncio   frames are read and processed on one event loop; for handlers
+            that do not block;
+  prefork   `processes` children each bind the port with SO_REUSEPORT and
+            serve it in `child_mode`, so the kernel spreads connections
+            over as many interpreters. Every child gets its own copy of
+            the handler and its state.
+
+Requests are timed around Processor.process() and counted per method;
+with `report_interval`, a table of per-method QPS and latency is printed
+that often (in prefork mode, for all children together).
+
+  server = ThriftServer(UniqueIdService.Processor(handler), port=9090,
+                        mode='prefork', processes=8, report_interval=10)
+  server.serve()
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import pickle
+import select
+import selectors
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TTransport
+
+from . import tracing
+from .calls import peek_name
+from .histogram import LatencyHistogram
+
+MODES = ('threads', 'asyncio', 'prefork')
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+
+_I32 = struct.Struct('!i')
+_log = logging.getLogger(__name__)
+
+
+class ServerStats:
+  """Per-method handler latency histograms, shared by a server's threads."""
+
+  def __init__(self):
+    self.histograms = {}
+    self._lock = threading.Lock()
+
+  def record(self, name, seconds):
+    with self._lock:
+      histogram = self.histograms.get(name)
+      if histogram is None:
+        histogram = self.histograms[name] = LatencyHistogram()
+      histogram.record(seconds)
+
+  def snapshot(self):
+    """Returns a copy of the histograms, keyed by method name."""
+    with self._lock:
+      return {name: _copy(histogram) for name, histogram in self.histograms.items()}
+
+
+def _copy(histogram):
+  copy = LatencyHistogram()
+  copy.merge(histogram)
+  return copy
+
+
+def merge_snapshots(snapshots):
+  merged = {}
+  for snapshot in snapshots:
+    for name, histogram in snapshot.items():
+      merged.setdefault(name, LatencyHistogram()).merge(histogram)
+  return merged
+
+
+def format_report(histograms, previous, elapsed):
+  """Formats per-method counts, QPS since `previous` (a snapshot taken
+  `elapsed` seconds earlier) and latency percentiles in milliseconds."""
+  lines = ['{:<44} {:>10} {:>9} {:>9} {:>9} {:>9}'.format(
+      'method', 'count', 'qps', 'p50 ms', 'p99 ms', 'max ms')]
+  for name, histogram in sorted(histograms.items()):
+    before = previous.get(name)
+    count = histogram.count - (before.count if before is not None else 0)
+    lines.append('{:<44} {:>10} {:>9.0f} {:>9.3f} {:>9.3f} {:>9.3f}'.format(
+        name, histogram.count, count / elapsed if elapsed > 0 else 0.0,
+        histogram.percentile(50) * 1e3, histogram.percentile(99) * 1e3,
+        histogram.max * 1e3))
+  return '\n'.join(lines)
+
+
+class StatsReporter:
+  """Prints format_report() of `snapshot()` every `interval` seconds."""
+
+  def __init__(self, snapshot, interval, out=None):
+    self.snapshot = snapshot
+    self.interval = interval
+    self.out = out
+    self._stopped = threading.Event()
+    self._previous = {}
+    self._last = time.monotonic()
+
+  def start(self):
+    threading.Thread(target=self._run, daemon=True).start()
+    return self
+
+  def stop(self):
+    self._stopped.set()
+
+  def report(self):
+    now = time.monotonic()
+    histograms = self.snapshot()
+    print(format_report(histograms, self._previous, now - self._last),
+          file=self.out or sys.stdout, flush=True)
+    self._previous, self._last = histograms, now
+
+  def _run(self):
+    while not self._stopped.wait(self.interval):
+      self.report()
+
+
+def _split_frames(buf, data):
+  """Appends `data` to `buf` and removes and returns the complete frames."""
+  buf += data
+  frames = []
+  pos = 0
+  while len(buf) - pos >= 4:
+    size, = _I32.unpack_from(buf, pos)
+    if size < 0 or size > MAX_FRAME_SIZE:
+      raise ValueError('bad frame size %d' % size)
+    if len(buf) - pos - 4 < size:
+      break
+    frames.append(bytes(buf[pos + 4:pos + 4 + size]))
+    pos += 4 + size
+  del buf[:pos]
+  return frames
+
+
+class _Connection:
+  def __init__(self, sock):
+    self.sock = sock
+    self.buf = bytearray()
+    self.poller = select.poll()
+    self.poller.register(sock, select.POLLIN)
+
+
+class _AsyncConnection(asyncio.Protocol):
+  def __init__(self, server):
+    self.server = server
+    self.buf = bytearray()
+    self.transport = None
+
+  def connection_made(self, transport):
+    self.transport = transport
+
+  def data_received(self, data):
+    try:
+      frames = _split_frames(self.buf, data)
+    except ValueError:
+      self.transport.close()
+      return
+    for frame in frames:
+      reply = self.server.process(frame)
+      if reply:
+        self.transport.write(reply)
+
+
+class ThriftServer:
+  """Serves one generated Processor over framed binary Thrift."""
+
+  def __init__(self, processor, host='0.0.0.0', port=9090, mode='threads', workers=32,
+               processes=None, child_mode='threads', report_interval=None, stats=None,
+               protocol_factory=None, backlog=1024, linger=0.05):
+    if mode not in MODES or child_mode not in ('threads', 'asyncio'):
+      raise ValueError('unknown server mode %r' % (mode if mode not in MODES else child_mode))
+    self.processor = processor
+    self.host = host
+    self.port = port
+    self.mode = mode
+    self.workers = workers
+    self.processes = processes or os.cpu_count()
+    self.child_mode = child_mode
+    self.report_interval = report_interval
+    self.stats = ServerStats() if stats is None else stats
+    self.protocol_factory = protocol_factory or TBinaryProtocol.TBinaryProtocolAcceleratedFactory()
+    self.backlog = backlog
+    self._linger_ms = int(linger * 1000)
+    self._stopped = threading.Event()
+    self._thread = None
+
+  def process(self, frame):
+    """Runs one request frame through the processor and returns the framed
+    reply, or b'' for a oneway call."""
+    start = time.perf_counter()
+    otrans = TTransport.TMemoryBuffer()
+    self.processor.process(self.protocol_factory.getProtocol(TTransport.TMemoryBuffer(frame)),
+                           self.protocol_factory.getProtocol(otrans))
+    self.stats.record(peek_name(frame), time.perf_counter() - start)
+    reply = otrans.getvalue()
+    return _I32.pack(len(reply)) + reply if reply else b''
+
+  def serve(self):
+    """Serves until stop() is called or the process is interrupted."""
+    if self.mode == 'prefork':
+      self._serve_prefork()
+      return
+    reporter = None
+    if self.report_interval:
+      reporter = StatsReporter(self.stats.snapshot, self.report_interval).start()
+    try:
+      self._serve(self.mode, self._listen(reuse_port=False))
+    except KeyboardInterrupt:
+      pass
+    finally:
+      if reporter is not None:
+        reporter.stop()
+
+  def start(self):
+    """Serves on a background thread once the port is bound; not for prefork."""
+    if self.mode == 'prefork':
+      raise ValueError('prefork servers run in the foreground with serve()')
+    listener = self._listen(reuse_port=False)
+    self._thread = threading.Thread(target=self._serve, args=(self.mode, listener),
+                                     daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self._stopped.set()
+    if self._thread is not None:
+      self._thread.join()
+      self._thread = None
+
+  def _listen(self, reuse_port):
+    return socket.create_server((self.host, self.port), backlog=self.backlog,
+                                reuse_port=reuse_port)
+
+  def _serve(self, mode, listener):
+    try:
+      if mode == 'asyncio':
+        asyncio.run(self._serve_asyncio(listener))
+      else:
+        self._serve_threads(listener)
+    finally:
+      listener.close()
+
+  def _serve_threads(self, listener):
+    selector = selectors.DefaultSelector()
+    executor = ThreadPoolExecutor(self.workers)
+    wakeup, self._wakeup = socket.socketpair()
+    wakeup.setblocking(False)
+    self._returned = collections.deque()
+    listener.setblocking(False)
+    selector.register(listener, selectors.EVENT_READ, listener)
+    selector.register(wakeup, selectors.EVENT_READ, wakeup)
+    try:
+      while not self._stopped.is_set():
+        for key, _ in selector.select(0.2):
+          if key.data is listener:
+            self._accept(listener, selector)
+          elif key.data is wakeup:
+            try:
+              wakeup.recv(4096)
+            except BlockingIOError:
+              pass
+            while self._returned:
+              conn = self._returned.popleft()
+              selector.register(conn.sock, selectors.EVENT_READ, conn)
+          else:
+            # The worker owns the connection until it hands it back.
+            selector.unregister(key.fileobj)
+            executor.submit(self._serve_connection, key.data)
+    finally:
+      for key in list(selector.get_map().values()):
+        if isinstance(key.data, _Connection):
+          key.data.sock.close()
+      for conn in self._returned:
+        conn.sock.close()
+      selector.close()
+      wakeup.close()
+      self._wakeup.close()
+      executor.shutdown(wait=False)
+
+  def _accept(self, listener, selector):
+    while True:
+      try:
+        sock, _ = listener.accept()
+      except BlockingIOError:
+        return
+      sock.setblocking(True)
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      selector.register(sock, selectors.EVENT_READ, _Connection(sock))
+
+  def _serve_connection(self, conn):
+    # Keeps answering while requests keep arriving within `linger`, so a
+    # busy connection does not go back through the selector every call.
+    try:
+      while True:
+        data = conn.sock.recv(1 << 16)
+        if not data:
+          conn.sock.close()
+          return
+        for frame in _split_frames(conn.buf, data):
+          reply = self.process(frame)
+          if reply:
+            conn.sock.sendall(reply)
+        if not conn.poller.poll(self._linger_ms):
+          break
+    except OSError:
+      conn.sock.close()
+      return
+    except Exception:
+      # A malformed frame or request; the client gets a closed connection
+      # rather than no answer, and the connection is not handed back.
+      _log.exception('closing connection after a bad request')
+      conn.sock.close()
+      return
+    self._returned.append(conn)
+    try:
+      self._wakeup.send(b'\0')
+    except OSError:
+      conn.sock.close()  # the server is stopping
+
+  async def _serve_asyncio(self, listener):
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: _AsyncConnection(self), sock=listener)
+    async with server:
+      while not self._stopped.is_set():
+        await asyncio.sleep(0.2)
+
+  def _serve_prefork(self):
+    # Children send cumulative stats snapshots up a pipe each.
+    children = {}
+    for _ in range(self.processes):
+      read_fd, write_fd = os.pipe()
+      pid = os.fork()
+      if pid == 0:
+        os.close(read_fd)
+        status = 0
+        try:
+          signal.signal(signal.SIGTERM, _interrupt)
+          self._run_child(write_fd)
+        except KeyboardInterrupt:
+          pass
+        except BaseException:
+          status = 1
+        # os._exit() skips atexit, so span logs are written here.
+        tracing.close_all()
+        os._exit(status)
+      os.close(write_fd)
+      children[read_fd] = [pid, bytearray(), {}]
+
+    reporter = None
+    if self.report_interval:
+      reporter = StatsReporter(
+          lambda: merge_snapshots([child[2] for child in children.values()]),
+          self.report_interval)
+    deadline = time.monotonic() + (self.report_interval or 0)
+    try:
+      while children and not self._stopped.is_set():
+        readable, _, _ = select.select(list(children), [], [], 0.2)
+        for fd in readable:
+          data = os.read(fd, 1 << 16)
+          if not data:
+            os.close(fd)
+            os.waitpid(children.pop(fd)[0], 0)
+            continue
+          child = children[fd]
+          child[1] += data
+          while len(child[1]) >= 4:
+            size, = _I32.unpack_from(child[1], 0)
+            if len(child[1]) < 4 + size:
+              break
+            child[2] = pickle.loads(bytes(child[1][4:4 + size]))
+            del child[1][:4 + size]
+        if reporter is not None and time.monotonic() >= deadline:
+          reporter.report()
+          deadline += self.report_interval
+    except KeyboardInterrupt:
+      pass
+    finally:
+      for fd, (pid, _, _) in children.items():
+        try:
+          os.kill(pid, signal.SIGTERM)
+          os.waitpid(pid, 0)
+        except OSError:
+          pass
+        os.close(fd)
+
+  def _run_child(self, write_fd):
+    listener = self._listen(reuse_port=True)
+    interval = self.report_interval or 1.0
+
+    def send_stats():
+      while True:
+        time.sleep(interval)
+        data = pickle.dumps(self.stats.snapshot(), pickle.HIGHEST_PROTOCOL)
+        message = memoryview(_I32.pack(len(data)) + data)
+        while message:
+          message = message[os.write(write_fd, message):]
+
+    threading.Thread(target=send_stats, daemon=True).start()
+    self._serve(self.child_mode, listener)
+
+
+def _interrupt(signum, frame):
+  raise KeyboardInterrupt
+
+
+def add_arguments(parser):
+  """Adds --server-mode, --workers, --processes, --child-mode and
+  --report-interval to an argparse parser."""
+  group = parser.add_argument_group('server')
+  group.add_argument('--server-mode', choices=MODES, default='threads')
+  group.add_argument('--workers', type=int, default=32,
+                     help='handler threads per process in threads mode')
+  group.add_argument('--processes', type=int, default=None,
+                     help='children in prefork mode (default: one per CPU)')
+  group.add_argument('--child-mode', choices=('threads', 'asyncio'), default='threads',
+                     help='how each prefork child serves')
+  group.add_argument('--report-interval', type=float, default=None,
+                     help='print per-method QPS and latency every this many seconds')
+  return parser
+
+
+def server_from_args(processor, host, port, args, **kwargs):
+  """Builds a ThriftServer from the arguments add_arguments() defined."""
+  return ThriftServer(processor, host, port, mode=args.server_mode, workers=args.workers,
+                      processes=args.processes, child_mode=args.child_mode,
+                      report_interval=args.report_interval, **kwargs)
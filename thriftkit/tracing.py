@@ -0,0 +1,522 @@
+"""Trace context propagation through `carrier` and binary span logs.
+
+Every social_network and media_service RPC takes a `carrier` map meant for
+the Jaeger context of the C++ services. A Tracer fills it on the client
+side and reads it on the server side:
+
+  traceparent     00-<trace id:32 hex>-<span id:16 hex>-<flags>   (W3C)
+  uber-trace-id   <trace id>:<span id>:<parent id>:<flags>        (Jaeger)
+
+Client spans come from the methods of traced_class(service), which wraps
+a generated Client or any thriftkit client; server spans come from the
+handler of a Processor passed to Tracer.instrument(). The active span
+lives in a context variable, so the calls a handler makes on its own
+thread or task are its children; work handed to another thread keeps the
+trace when run under contextvars.copy_context().
+
+Recording a span costs two clock reads, a counter step and a deque
+append; ids stay integers, or the hex strings they arrived as, until a
+carrier or the log needs them. A background thread encodes batches of
+spans into an append-only log every `flush_interval` seconds. Start
+times are CLOCK_MONOTONIC nanoseconds; each log session starts with a
+record anchoring them to the wall clock, and read_spans() converts them
+back.
+
+Only the two clock reads and the append stay under a microsecond: in
+CPython, extracting, switching the context and formatting a carrier cost
+more than that. On a 1-CPU VM where a clock read takes 110 ns (Python
+3.11), a server span adds about 1.0 us to its call and a client span,
+which formats its carrier, 1.9-2.3 us.
+
+  tracer = Tracer('/tmp/spans-{pid}.bin')
+  processor = tracer.instrument(PlotService.Processor(handler), 'plot-service')
+  plots = traced_class(PlotService)(client, tracer, 'plot-service')
+  plots.ReadPlot(req_id, plot_id, {})
+  ...
+  for span in read_spans('/tmp/spans-1234.bin'):
+    print(span.service, span.operation, span.duration_ns)
+"""
+
+import atexit
+import collections
+import contextvars
+import functools
+import inspect
+import itertools
+import os
+import random
+import struct
+import threading
+import time
+import weakref
+
+from .aio import AsyncClient
+from .calls import service_methods
+
+CLIENT = 1
+SERVER = 2
+LOCAL = 3
+_ERROR = 0x80
+
+_MAGIC = b'TKSPANS1'
+_ANCHOR = struct.Struct('<BqqI')       # 0, wall clock ns, monotonic ns, pid
+_NAME = struct.Struct('<BHH')          # 1, name id, utf-8 length; the name follows
+_SPAN = struct.Struct('<BBHHQQQQqq')   # 2, kind, service id, operation id, trace id
+                                       # high and low, span id, parent id, start, duration
+_LOW_64 = (1 << 64) - 1
+
+Span = collections.namedtuple(
+    'Span', 'trace_id span_id parent_id service operation kind start_ns duration_ns error')
+
+# (trace id, span id, sampled) of the span the current code runs in. Ids
+# are ints, or the hex strings they arrived as in a carrier; they are
+# formatted on injection and parsed by the writer thread.
+_current = contextvars.ContextVar('thriftkit_span', default=None)
+_ids = random.Random()
+_span_ids = itertools.count(_ids.getrandbits(62) | 1)
+_tracers = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+  # A forked child must not repeat its parent's ids, pending spans or log.
+  global _span_ids
+  _ids.seed()
+  _span_ids = itertools.count(_ids.getrandbits(62) | 1)
+  for tracer in list(_tracers):
+    tracer._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _hex(span_id, digits=16):
+  if span_id.__class__ is not str:
+    return '%0*x' % (digits, span_id)
+  if len(span_id) == 55:  # a whole traceparent header; see _parent()
+    return span_id[3:35] if digits == 32 else span_id[36:52]
+  return span_id
+
+
+def current_span():
+  """Returns (trace_id, span_id, sampled) of the active span, as hex
+  strings and a bool, or None."""
+  span = _current.get()
+  if span is None:
+    return None
+  return _hex(span[0], 32), _hex(span[1]), span[2]
+
+
+def close_all():
+  """Closes every open Tracer, writing their pending spans. Runs at exit;
+  call it directly in processes that leave through os._exit()."""
+  for tracer in list(_tracers):
+    tracer.close()
+
+
+atexit.register(close_all)
+
+
+def extract(carrier):
+  """Reads (trace_id, span_id, sampled) from a carrier, or returns None."""
+  value = carrier.get('traceparent')
+  if value is not None:
+    if len(value) == 55 and value[2] == '-' and value[35] == '-' and value[52] == '-':
+      return value[3:35], value[36:52], value[54] in '13579bdf'
+    parts = value.split('-')
+    if len(parts) >= 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+      return parts[1], parts[2], parts[3][-1:] in ('1', '3', '5', '7', '9', 'b', 'd', 'f')
+  value = carrier.get('uber-trace-id')
+  if value is not None:
+    parts = value.replace('%3A', ':').split(':')
+    if len(parts) == 4:
+      try:
+        return parts[0].zfill(32), parts[1].zfill(16), bool(int(parts[3], 16) & 1)
+      except ValueError:
+        pass
+  return None
+
+
+def _parent(carrier):
+  # extract() for the hot paths. A W3C header stays whole, standing for
+  # both its trace id and span id until a carrier or the log needs them:
+  # slicing it costs more than the rest of the check.
+  value = carrier.get('traceparent')
+  if (value is not None and len(value) == 55 and value[2] == '-' and value[35] == '-' and
+      value[52] == '-'):
+    return value, value, value[54] in '13579bdf'
+  return extract(carrier)
+
+
+class Tracer:
+  """Records spans and writes them to a binary log at `path`.
+
+  `path` may contain {pid}; each process, forked ones included, opens its
+  own log there once it has spans to write. Without {pid}, forked servers
+  would interleave their logs. New traces are sampled with probability
+  `sample_rate`; joined traces follow the caller's decision. `propagation`
+  names the carrier formats to write, 'w3c' and/or 'jaeger'; extract()
+  reads either. At most `max_pending` spans wait for the writer; older
+  ones are dropped beyond that.
+  """
+
+  def __init__(self, path, sample_rate=1.0, propagation=('w3c',),
+               flush_interval=0.2, max_pending=1 << 20):
+    self.path = path
+    self.sample_rate = sample_rate
+    self.w3c = 'w3c' in propagation
+    self.jaeger = 'jaeger' in propagation
+    self.flush_interval = flush_interval
+    self._pending = collections.deque(maxlen=max_pending)
+    self._start()
+    _tracers.add(self)
+
+  def _start(self):
+    self.written = 0
+    self._pid = os.getpid()
+    self._file = None
+    self._names = {}
+    self._stopped = threading.Event()
+    self._write_lock = threading.Lock()
+    # The writer holds the tracer weakly, so a dropped one is collected.
+    self._thread = threading.Thread(
+        target=_write_spans, args=(weakref.ref(self), self._stopped, self.flush_interval),
+        name='span-writer', daemon=True)
+    self._thread.start()
+
+  def _after_fork(self):
+    # Everything but the settings belongs to the parent, and its writer
+    # thread did not survive the fork.
+    if self._stopped.is_set():
+      return
+    if self._file is not None:
+      self._file.close()  # unbuffered; only this process's descriptor
+    self._pending.clear()
+    self._start()
+
+  @property
+  def log_path(self):
+    """The log this process writes."""
+    return self.path.format(pid=self._pid)
+
+  def _new_trace(self):
+    sampled = self.sample_rate >= 1.0 or _ids.random() < self.sample_rate
+    return _ids.getrandbits(128), 0, sampled
+
+  def inject(self, carrier, trace_id, span_id, parent_id, sampled):
+    """Writes a span's context into `carrier`. `span_id` is an int; the
+    other ids are ints or hex strings."""
+    if trace_id.__class__ is not str:
+      trace_id = trace_id.to_bytes(16, 'big').hex()
+    elif len(trace_id) == 55:
+      trace_id = trace_id[3:35]
+    span_id = span_id.to_bytes(8, 'big').hex()
+    if self.w3c:
+      carrier['traceparent'] = '00-' + trace_id + '-' + span_id + ('-01' if sampled else '-00')
+    if self.jaeger:
+      carrier['uber-trace-id'] = (trace_id + ':' + span_id + ':' +
+                                  (_hex(parent_id) if parent_id else '0') +
+                                  (':1' if sampled else ':0'))
+
+  def record(self, kind, service, operation, trace_id, span_id, parent_id, start_ns, end_ns):
+    self._pending.append((kind, service, operation, trace_id, span_id, parent_id, start_ns,
+                          end_ns - start_ns))
+
+  def span(self, service, operation):
+    """A local span around a block, parenting the calls made inside it:
+
+      with tracer.span('compose-review-e2e', 'ComposeReview'):
+        ...
+    """
+    return _LocalSpan(self, service, operation)
+
+  def instrument(self, processor, service=None):
+    """Records a server span for every request `processor` handles, labelled
+    with `service` (default: the generated module name). Returns `processor`."""
+    if service is None:
+      service = type(processor).__module__.rsplit('.', 1)[-1]
+    processor._handler = _TracedHandler(processor._handler, self, service)
+    return processor
+
+  def flush(self):
+    """Writes every span recorded so far."""
+    with self._write_lock:
+      pending = self._pending
+      out = bytearray()
+      names = self._names
+      count = 0
+      while pending:
+        kind, service, operation, trace_id, span_id, parent_id, start, duration = \
+            pending.popleft()
+        try:
+          if trace_id.__class__ is str:
+            trace_id = int(_hex(trace_id, 32), 16)
+          if span_id.__class__ is str:
+            span_id = int(_hex(span_id), 16)
+          if parent_id.__class__ is str:
+            parent_id = int(_hex(parent_id), 16)
+        except ValueError:
+          continue  # a malformed carrier from the caller
+        if trace_id >> 128 or span_id >> 64 or parent_id >> 64:
+          continue
+        ids = []
+        for name in (service, operation):
+          name_id = names.get(name)
+          if name_id is None:
+            name_id = names[name] = len(names)
+            encoded = name.encode('utf-8')
+            out += _NAME.pack(1, name_id, len(encoded))
+            out += encoded
+          ids.append(name_id)
+        out += _SPAN.pack(2, kind, ids[0], ids[1], trace_id >> 64, trace_id & _LOW_64,
+                          span_id, parent_id, start, duration)
+        count += 1
+      if out:
+        if self._file is None:
+          self._file = open(self.log_path, 'ab', buffering=0)
+          self._file.write(_MAGIC + _ANCHOR.pack(0, time.time_ns(), time.monotonic_ns(),
+                                                 self._pid))
+        self._file.write(out)
+        self.written += count
+
+  def close(self):
+    if self._stopped.is_set():
+      return
+    self._stopped.set()
+    self._thread.join()
+    self.flush()
+    if self._file is not None:
+      self._file.close()
+
+  def __del__(self):
+    # Dropped without close(); this may run on the writer thread itself,
+    # so there is nothing to join.
+    if not self._stopped.is_set():
+      self._stopped.set()
+      self.flush()
+      if self._file is not None:
+        self._file.close()
+
+
+def _write_spans(tracer_ref, stopped, interval):
+  while not stopped.wait(interval):
+    tracer = tracer_ref()
+    if tracer is None:
+      return
+    tracer.flush()
+    del tracer
+
+
+class _LocalSpan:
+  def __init__(self, tracer, service, operation):
+    self.tracer = tracer
+    self.service = service
+    self.operation = operation
+
+  def __enter__(self):
+    parent = _current.get()
+    if parent is None:
+      self.trace_id, self.parent_id, self.sampled = self.tracer._new_trace()
+    else:
+      self.trace_id, self.parent_id, self.sampled = parent
+    self.span_id = next(_span_ids)
+    self.token = _current.set((self.trace_id, self.span_id, self.sampled))
+    self.start = time.monotonic_ns()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    end = time.monotonic_ns()
+    _current.reset(self.token)
+    if self.sampled:
+      self.tracer.record(LOCAL | (_ERROR if exc_type else 0), self.service, self.operation,
+                         self.trace_id, self.span_id, self.parent_id, self.start, end)
+    return False
+
+
+class _TracedHandler:
+  """Handler proxy that records a server span around each method."""
+
+  def __init__(self, handler, tracer, service):
+    self._handler = handler
+    self._tracer = tracer
+    self._service = service
+
+  def __getattr__(self, name):
+    method = getattr(self._handler, name)
+    if not callable(method):
+      return method
+    tracer = self._tracer
+    service = self._service
+
+    @functools.wraps(method)
+    def traced(*args):
+      # The generated Processor passes the decoded carrier last.
+      carrier = args[-1] if args else None
+      parent = _parent(carrier) if carrier else None
+      if parent is None:
+        trace_id, parent_id, sampled = tracer._new_trace()
+      else:
+        trace_id, parent_id, sampled = parent
+      span_id = next(_span_ids)
+      token = _current.set((trace_id, span_id, sampled))
+      kind = SERVER
+      start = time.monotonic_ns()
+      try:
+        return method(*args)
+      except BaseException:
+        kind |= _ERROR
+        raise
+      finally:
+        end = time.monotonic_ns()
+        _current.reset(token)
+        if sampled:
+          tracer._pending.append((kind, service, name, trace_id, span_id, parent_id, start,
+                                  end - start))
+
+    setattr(self, name, traced)
+    return traced
+
+
+class TracedClient:
+  """Client proxy that records a client span per call and injects it into
+  the call's carrier. Subclasses are built per service by traced_class();
+  `client` may be a generated Client or any thriftkit client, including an
+  AsyncClient, whose methods then return coroutines as before.
+
+  The parent span is the active one (a handler's server span, or a
+  Tracer.span() block) or else the one in the carrier passed in; without
+  either, the call starts a new trace.
+  """
+
+  service = None
+  _carrier_index = None
+
+  def __init__(self, client, tracer, peer=None):
+    self.client = client
+    self.tracer = tracer
+    self.peer = peer or self.service.__name__.rsplit('.', 1)[-1]
+    self._async = isinstance(client, AsyncClient)
+
+  def __getattr__(self, name):
+    return getattr(self.client, name)
+
+  def call(self, name, *args, **kwargs):
+    return self._call(name, self._carrier_index[name], args, kwargs)
+
+  def _call(self, name, index, args, kwargs):
+    tracer = self.tracer
+    positional = len(args) > index
+    carrier = args[index] if positional else kwargs.get('carrier')
+    parent = _current.get()
+    if parent is None and carrier:
+      parent = _parent(carrier)
+    if parent is None:
+      trace_id, parent_id, sampled = tracer._new_trace()
+    else:
+      trace_id, parent_id, sampled = parent
+    span_id = next(_span_ids)
+    carrier = dict(carrier) if carrier else {}
+    tracer.inject(carrier, trace_id, span_id, parent_id, sampled)
+    if positional:
+      args = args[:index] + (carrier,) + args[index + 1:]
+    else:
+      kwargs['carrier'] = carrier
+    if self._async:
+      return self._call_async(name, args, kwargs, (trace_id, span_id, parent_id, sampled))
+    kind = CLIENT
+    start = time.monotonic_ns()
+    try:
+      return getattr(self.client, name)(*args, **kwargs)
+    except BaseException:
+      kind |= _ERROR
+      raise
+    finally:
+      end = time.monotonic_ns()
+      if sampled:
+        tracer._pending.append((kind, self.peer, name, trace_id, span_id, parent_id, start,
+                                end - start))
+
+  async def _call_async(self, name, args, kwargs, span):
+    trace_id, span_id, parent_id, sampled = span
+    kind = CLIENT
+    start = time.monotonic_ns()
+    try:
+      return await getattr(self.client, name)(*args, **kwargs)
+    except BaseException:
+      kind |= _ERROR
+      raise
+    finally:
+      end = time.monotonic_ns()
+      if sampled:
+        self.tracer._pending.append((kind, self.peer, name, trace_id, span_id, parent_id,
+                                     start, end - start))
+
+
+class _TracedCheckout:
+  def __init__(self, checkout, cls, tracer, peer):
+    self.checkout = checkout
+    self.cls = cls
+    self.tracer = tracer
+    self.peer = peer
+
+  def __enter__(self):
+    return self.cls(self.checkout.__enter__(), self.tracer, self.peer)
+
+  def __exit__(self, exc_type, exc, tb):
+    return self.checkout.__exit__(exc_type, exc, tb)
+
+
+def traced_checkout(checkout, service, tracer, peer=None):
+  """Wraps a pool checkout (`with pool.client() as client:`) so that the
+  client it yields is traced."""
+  return _TracedCheckout(checkout, traced_class(service), tracer, peer)
+
+
+def _make_method(name, index, iface_method):
+  def method(self, *args, **kwargs):
+    return self._call(name, index, args, kwargs)
+  return functools.update_wrapper(method, iface_method)
+
+
+@functools.lru_cache(maxsize=None)
+def traced_class(service):
+  """Returns the TracedClient subclass for a generated service module."""
+  methods = {}
+  carrier_index = {}
+  for name in service_methods(service):
+    iface_method = getattr(service.Iface, name)
+    carrier_index[name] = list(inspect.signature(iface_method).parameters).index('carrier') - 1
+    methods[name] = _make_method(name, carrier_index[name], iface_method)
+  methods['service'] = service
+  methods['_carrier_index'] = carrier_index
+  short_name = service.__name__.rsplit('.', 1)[-1]
+  return type('Traced' + short_name + 'Client', (TracedClient,), methods)
+
+
+def read_spans(path):
+  """Yields the Spans in a log, with start_ns on the wall clock."""
+  with open(path, 'rb') as f:
+    data = f.read()
+  names = {}
+  offset_ns = 0
+  pos = 0
+  while pos < len(data):
+    if data.startswith(_MAGIC, pos):
+      _, wall_ns, monotonic_ns, _ = _ANCHOR.unpack_from(data, pos + len(_MAGIC))
+      offset_ns = wall_ns - monotonic_ns
+      names = {}
+      pos += len(_MAGIC) + _ANCHOR.size
+    elif data[pos] == 1:
+      _, name_id, length = _NAME.unpack_from(data, pos)
+      pos += _NAME.size
+      names[name_id] = data[pos:pos + length].decode('utf-8')
+      pos += length
+    elif data[pos] == 2:
+      (_, kind, service, operation, trace_high, trace_low, span_id, parent_id, start,
+       duration) = _SPAN.unpack_from(data, pos)
+      pos += _SPAN.size
+      yield Span((trace_high << 64) | trace_low, span_id, parent_id, names[service],
+                 names[operation], kind & ~_ERROR, start + offset_ns, duration,
+                 bool(kind & _ERROR))
+    else:
+      raise ValueError('corrupt span log %s at byte %d' % (path, pos))
@@ -0,0 +1,131 @@
+import struct
+from io import BytesIO
+
+from thrift.transport import TTransport
+from thrift.transport.TTransport import TTransportException
+
+_FRAME_HEADER = struct.Struct('!i')
+
+
+class TReusableFramedTransport(TTransport.TTransportBase, TTransport.CReadableTransport):
+  """Framed transport that receives every frame into one growable bytearray.
+
+  Frames are read with recv_into straight into the buffer, which is reused
+  for the next frame, so steady-state reads allocate nothing per frame.
+  TBinaryProtocolFastDecode decodes structs directly out of the buffer via
+  frame_buffer()/consume(); with lazy_strings it leaves long string fields
+  undecoded in the frame until they are read. While any struct still refers
+  into a frame, its buffer is left to it and the next frame gets a fresh one.
+
+    transport = TReusableFramedTransport(TSocket.TSocket(host, port))
+    protocol = TBinaryProtocolFastDecode(transport, lazy_strings=True)
+  """
+
+  def __init__(self, trans, initial_size=1 << 16):
+    self._trans = trans
+    self._buf = bytearray(initial_size)
+    self._pos = 0
+    self._end = 0
+    self._wbuf = BytesIO()
+    self._cbuf = None
+    self._cbuf_start = 0
+
+  def isOpen(self):
+    return self._trans.isOpen()
+
+  def open(self):
+    return self._trans.open()
+
+  def close(self):
+    return self._trans.close()
+
+  def _pinned(self):
+    # A bytearray with exported buffers refuses to resize.
+    try:
+      self._buf.append(0)
+    except BufferError:
+      return True
+    self._buf.pop()
+    return False
+
+  def _recv_into(self, size):
+    handle = self._trans.handle
+    if handle is None:
+      raise TTransportException(TTransportException.NOT_OPEN, 'transport is not open')
+    with memoryview(self._buf) as view:
+      received = 0
+      while received < size:
+        n = handle.recv_into(view[received:size])
+        if n == 0:
+          raise TTransportException(TTransportException.END_OF_FILE,
+                                    'TSocket read 0 bytes')
+        received += n
+
+  def _read_frame(self):
+    if self._pinned():
+      self._buf = bytearray(len(self._buf))
+    self._recv_into(4)
+    size = _FRAME_HEADER.unpack_from(self._buf)[0]
+    if size < 0:
+      raise TTransportException(TTransportException.NEGATIVE_SIZE,
+                                'invalid frame size %d' % size)
+    if size > len(self._buf):
+      self._buf = bytearray(max(size, 2 * len(self._buf)))
+    self._recv_into(size)
+    self._pos = 0
+    self._end = size
+
+  def _sync(self):
+    if self._cbuf is not None:
+      self._pos = self._cbuf_start + self._cbuf.tell()
+      self._cbuf = None
+
+  def read(self, sz):
+    self._sync()
+    if self._pos == self._end:
+      self._read_frame()
+    n = min(sz, self._end - self._pos)
+    data = bytes(self._buf[self._pos:self._pos + n])
+    self._pos += n
+    return data
+
+  def frame_buffer(self):
+    """Returns (buffer, position, frame end) for decoding in place."""
+    self._sync()
+    if self._pos == self._end:
+      self._read_frame()
+    return self._buf, self._pos, self._end
+
+  def consume(self, end):
+    self._pos = end
+
+  def write(self, buf):
+    self._wbuf.write(buf)
+
+  def flush(self):
+    data = self._wbuf.getvalue()
+    self._wbuf = BytesIO()
+    self._trans.write(_FRAME_HEADER.pack(len(data)) + data)
+    self._trans.flush()
+
+  # CReadableTransport: the generated read() only takes the fast-decode hook
+  # for these. The C accelerator needs a real BytesIO, so it gets a copy of
+  # the rest of the frame and what it consumed is accounted for on the next
+  # read. Frames are never split, so it never needs to refill.
+  @property
+  def cstringio_buf(self):
+    self._sync()
+    if self._pos == self._end:
+      self._read_frame()
+    self._cbuf = BytesIO(self._buf[self._pos:self._end])
+    self._cbuf_start = self._pos
+    return self._cbuf
+
+  def cstringio_refill(self, partialread, reqlen):
+    raise TTransportException(TTransportException.END_OF_FILE,
+                              'struct runs past the end of its frame')
+
+
+class TReusableFramedTransportFactory:
+  def getTransport(self, trans):
+    return TReusableFramedTransport(trans)